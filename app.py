@@ -26,12 +26,12 @@ def main():
     Phát hiện hành vi bạo lực sử dụng AI kết hợp phân tích chuyển động Optical Flow
     """)
     
-    # Khởi tạo session state và model
+    # Khởi tạo session state, đọc cấu hình từ sidebar rồi lấy model theo cấu hình đó
     initialize_session_state()
+    render_sidebar()
     initialize_model()
     
     # Render các component
-    render_sidebar()
     render_upload_section()
     render_results()
     
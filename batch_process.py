@@ -0,0 +1,201 @@
+"""
+Xử lý hàng loạt video không cần giao diện (dùng cho cron job / máy worker).
+
+Ví dụ:
+    python batch_process.py videos/ --workers 4 --torch-threads 2
+    python batch_process.py "recordings/*.mp4" --output-dir outputs
+    python batch_process.py archive/ --scan-mode two_pass --output-mode clips
+
+Mỗi video tạo ra:
+    <output-dir>/processed_<tên>.mp4            video đã chú thích
+                                                (thư mục processed_<tên>_clips/ với --output-mode clips)
+    <output-dir>/processed_<tên>.analysis.json  dữ liệu phân tích theo frame
+                                                (.analysis.npz với --analysis-format npz)
+
+File phân tích được ghi sau cùng nên được dùng làm dấu hoàn tất: khi chạy lại,
+các video đã có file này sẽ được bỏ qua (tiếp tục sau khi bị gián đoạn).
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+
+from models.backends import BACKENDS, export_dir_for, export_model
+from models.violence_detector import load_violence_detector
+from utils.config import DEFAULT_CONFIG, create_analysis_data
+from utils.coarse_scan import SCAN_MODES, analyze_video_two_pass
+from utils.model_registry import get_model_registry
+from utils.motion_analysis import MOTION_ESTIMATORS
+from utils.video_analysis import analyze_video, save_analysis
+from utils.video_output import OUTPUT_MODES
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# Model riêng của mỗi process worker
+_worker_model = None
+_worker_device = None
+
+def collect_videos(inputs):
+    """Gom danh sách video từ các thư mục, file hoặc pattern glob"""
+    videos = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = [os.path.join(item, name) for name in sorted(os.listdir(item))]
+        else:
+            paths = sorted(glob.glob(item)) or [item]
+        videos.extend(p for p in paths if os.path.isfile(p) and p.lower().endswith(VIDEO_EXTENSIONS))
+    return list(dict.fromkeys(videos))
+
+def output_paths(video_path, output_dir, analysis_format="json"):
+    """Đường dẫn video kết quả và file phân tích tương ứng với một video đầu vào"""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return (os.path.join(output_dir, f"processed_{stem}.mp4"),
+            os.path.join(output_dir, f"processed_{stem}.analysis.{analysis_format}"))
+
+def init_worker(weights_path, device_name, torch_threads, backend, export_dir, image_size, sequence_length):
+    """Chạy một lần trong mỗi process worker: giới hạn thread torch và nạp model"""
+    global _worker_model, _worker_device
+    torch.set_num_threads(torch_threads)
+    _worker_model, _ = get_model_registry().get(weights_path, device_name, backend, export_dir=export_dir,
+                                                 image_size=image_size, sequence_length=sequence_length)
+    _worker_device = _worker_model.device
+
+def process_video_job(video_path, output_dir, options, analysis_format="json", scan_options=None):
+    """
+    Xử lý một video trong process worker, trả về (video_path, số frame, thời gian).
+    scan_options: tham số quét hai lượt (coarse_interval, coarse_threshold), None để quét dày.
+    """
+    output_path, analysis_path = output_paths(video_path, output_dir, analysis_format)
+    analysis_data = create_analysis_data()
+    start = time.time()
+    if scan_options is not None:
+        info = analyze_video_two_pass(_worker_model, _worker_device, video_path, output_path,
+                                      analysis_data=analysis_data, **scan_options, **options)
+    else:
+        info = analyze_video(_worker_model, _worker_device, video_path, output_path,
+                             analysis_data=analysis_data, **options)
+    elapsed = time.time() - start
+    save_analysis(analysis_data, analysis_path, metadata={
+        'video_path': os.path.abspath(video_path),
+        'output_path': os.path.abspath(output_path),
+        'config': {**options, **(scan_options or {})},
+        'video': info,
+        'processing_seconds': elapsed
+    })
+    analysis_data.close()
+    return video_path, info['processed_frames'], elapsed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Phát hiện bạo lực hàng loạt trên thư mục video")
+    parser.add_argument('inputs', nargs='+', help="Thư mục, file video hoặc pattern glob")
+    parser.add_argument('--output-dir', default="outputs")
+    parser.add_argument('--weights', default=DEFAULT_CONFIG['MODEL_WEIGHTS_PATH'])
+    parser.add_argument('--device', default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help="Số process worker, mỗi worker có một bản model riêng")
+    parser.add_argument('--torch-threads', type=int, default=None,
+                        help="Số thread torch cho mỗi worker (mặc định: chia đều số CPU)")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_CONFIG['INFERENCE_BACKEND'])
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default=DEFAULT_CONFIG['OUTPUT_MODE'],
+                        help="full: cả video đã chú thích, clips: chỉ clip sự kiện, signals: không ghi video")
+    parser.add_argument('--clip-pre-roll', type=float, default=DEFAULT_CONFIG['CLIP_PRE_ROLL'])
+    parser.add_argument('--clip-post-roll', type=float, default=DEFAULT_CONFIG['CLIP_POST_ROLL'])
+    parser.add_argument('--scan-mode', choices=SCAN_MODES, default=DEFAULT_CONFIG['SCAN_MODE'],
+                        help="two_pass: quét thô trước, chỉ phân tích dày các đoạn nghi vấn (cần --output-mode clips/signals)")
+    parser.add_argument('--coarse-interval', type=float, default=DEFAULT_CONFIG['COARSE_INTERVAL'],
+                        help="Khoảng cách (giây) giữa các mẫu của lượt quét thô")
+    parser.add_argument('--coarse-threshold', type=float, default=DEFAULT_CONFIG['COARSE_THRESHOLD'],
+                        help="Ngưỡng xác suất của lượt quét thô để phân tích dày một đoạn")
+    parser.add_argument('--analysis-format', choices=['json', 'npz'], default="json",
+                        help="Định dạng file phân tích (npz gọn hơn nhiều với video dài)")
+    parser.add_argument('--force', action='store_true', help="Xử lý lại cả các video đã có kết quả")
+    parser.add_argument('--confidence-threshold', type=float, default=DEFAULT_CONFIG['CONFIDENCE_THRESHOLD'])
+    parser.add_argument('--motion-threshold', type=float, default=DEFAULT_CONFIG['MOTION_THRESHOLD'])
+    parser.add_argument('--sequence-length', type=int, default=DEFAULT_CONFIG['SEQUENCE_LENGTH'])
+    parser.add_argument('--image-size', type=int, default=DEFAULT_CONFIG['IMAGE_SIZE'])
+    parser.add_argument('--min-stride', type=int, default=DEFAULT_CONFIG['MIN_INFERENCE_STRIDE'])
+    parser.add_argument('--max-stride', type=int, default=DEFAULT_CONFIG['MAX_INFERENCE_STRIDE'])
+    parser.add_argument('--cascade-margin', type=float, default=None,
+                        help="Bật cascade chuyển động với biên trễ cho trước")
+    parser.add_argument('--inference-mode', choices=['per_frame', 'batched'], default=DEFAULT_CONFIG['INFERENCE_MODE'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_CONFIG['INFERENCE_BATCH_SIZE'])
+    parser.add_argument('--motion-estimator', choices=MOTION_ESTIMATORS, default=DEFAULT_CONFIG['MOTION_ESTIMATOR'])
+    args = parser.parse_args(argv)
+    if args.scan_mode == 'two_pass' and args.output_mode == 'full':
+        parser.error("--scan-mode two_pass không ghi được toàn bộ video, dùng --output-mode clips hoặc signals")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if not os.path.exists(args.weights):
+        print(f"Không tìm thấy file weights: {args.weights}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    videos = collect_videos(args.inputs)
+    todo = [v for v in videos
+            if args.force or not os.path.exists(output_paths(v, args.output_dir, args.analysis_format)[1])]
+    print(f"Tìm thấy {len(videos)} video, bỏ qua {len(videos) - len(todo)} video đã xử lý")
+    if not todo:
+        return 0
+
+    workers = max(1, min(args.workers, len(todo)))
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    options = {
+        'confidence_threshold': args.confidence_threshold,
+        'motion_threshold': args.motion_threshold,
+        'sequence_length': args.sequence_length,
+        'image_size': args.image_size,
+        'min_stride': args.min_stride,
+        'max_stride': args.max_stride,
+        'cascade_margin': args.cascade_margin,
+        'inference_mode': args.inference_mode,
+        'batch_size': args.batch_size,
+        'motion_estimator': args.motion_estimator,
+        'output_mode': args.output_mode,
+        'clip_pre_roll': args.clip_pre_roll,
+        'clip_post_roll': args.clip_post_roll
+    }
+    scan_options = None
+    if args.scan_mode == 'two_pass':
+        scan_options = {'coarse_interval': args.coarse_interval, 'coarse_threshold': args.coarse_threshold}
+
+    # Export một lần ở process chính để các worker không ghi đè file của nhau
+    export_dir = export_dir_for(args.weights)
+    if args.backend != 'eager':
+        export_model(load_violence_detector(args.weights, torch.device("cpu")), export_dir,
+                     args.image_size, args.sequence_length)
+
+    failures = 0
+    # spawn: tránh fork một process đã khởi tạo thread pool của torch
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                             initargs=(args.weights, args.device, torch_threads,
+                                       args.backend, export_dir, args.image_size, args.sequence_length)) as executor:
+        futures = {executor.submit(process_video_job, v, args.output_dir, options, args.analysis_format, scan_options): v
+                   for v in todo}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                video_path = futures[future]
+                try:
+                    _, frames, elapsed = future.result()
+                    print(f"[{done}/{len(todo)}] {video_path}: {frames} frame trong {elapsed:.1f}s "
+                          f"({frames / elapsed if elapsed > 0 else 0:.1f} fps)")
+                except Exception as e:
+                    failures += 1
+                    print(f"[{done}/{len(todo)}] {video_path}: lỗi - {e}", file=sys.stderr)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            print("Đã dừng, chạy lại lệnh để tiếp tục các video còn lại", file=sys.stderr)
+            return 130
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Benchmark thông lượng pipeline phân tích video trên video tổng hợp (không cần dữ liệu ngoài).
+
+Ví dụ:
+    python -m benchmarks.run_benchmarks                              # bộ cấu hình mặc định
+    python -m benchmarks.run_benchmarks --save-baseline              # lưu làm mốc so sánh
+    python -m benchmarks.run_benchmarks --compare                    # so với mốc, lỗi nếu chậm đi
+    python -m benchmarks.run_benchmarks --resolutions 1280x720 --frames 300 --image-sizes 64,128
+
+Mỗi cấu hình chạy trong một process riêng để đo được peak RSS của riêng nó (video tổng hợp
+được tạo trước trong process chính nên không tính vào bộ nhớ / thời gian đo).
+Model dùng weights ngẫu nhiên cố định (seed 0) nên kết quả không phụ thuộc file weights.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+DEFAULT_VIDEO_CACHE = os.path.join(tempfile.gettempdir(), "violence_detection_bench")
+
+def config_key(config):
+    """Khóa định danh một cấu hình benchmark (dùng để ghép với baseline)"""
+    return (f"{config['width']}x{config['height']}_{config['frames']}f_"
+            f"img{config['image_size']}_seq{config['sequence_length']}_{config['inference_mode']}")
+
+def run_single_benchmark(config, video_path, torch_threads):
+    """Chạy một cấu hình trong process worker, trả về số liệu đo được"""
+    import torch
+    from models.violence_detector import ViolenceDetector
+    from utils.config import create_analysis_data
+    from utils.video_analysis import analyze_video
+
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    torch.manual_seed(0)
+    model = ViolenceDetector().eval()
+    device = torch.device("cpu")
+    analysis_data = create_analysis_data()
+
+    fd, output_path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        info = analyze_video(model, device, video_path, output_path,
+                      sequence_length=config['sequence_length'],
+                      image_size=config['image_size'],
+                      inference_mode=config['inference_mode'],
+                      analysis_data=analysis_data)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.unlink(output_path)
+
+    # Độ trễ mỗi frame: từ lúc giải mã xong tới lúc ghi xong frame đã chú thích
+    latencies_ms = np.asarray(analysis_data['frame_latency'], dtype=np.float64)
+    frames = info['processed_frames']
+    # ru_maxrss tính bằng KB trên Linux, byte trên macOS
+    rss_scale = 1 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_scale
+
+    return {
+        'key': config_key(config),
+        'config': config,
+        'frames': frames,
+        'seconds': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'mean': float(latencies_ms.mean()) if len(latencies_ms) else 0.0,
+            'p50': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else 0.0,
+            'p90': float(np.percentile(latencies_ms, 90)) if len(latencies_ms) else 0.0,
+            'p99': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else 0.0
+        },
+        'peak_rss_mb': peak_rss / (1024 * 1024)
+    }
+
+def build_configs(args):
+    resolutions = [tuple(int(v) for v in r.lower().split('x')) for r in args.resolutions.split(',')]
+    frames = [int(v) for v in args.frames.split(',')]
+    image_sizes = [int(v) for v in args.image_sizes.split(',')]
+    sequence_lengths = [int(v) for v in args.sequence_lengths.split(',')]
+    modes = args.inference_modes.split(',')
+    return [
+        {'width': w, 'height': h, 'frames': n, 'image_size': img, 'sequence_length': seq, 'inference_mode': mode}
+        for (w, h), n, img, seq, mode in itertools.product(resolutions, frames, image_sizes, sequence_lengths, modes)
+    ]
+
+def compare_with_baseline(results, baseline, tolerance):
+    """In bảng so sánh với baseline, trả về danh sách cấu hình bị chậm đi quá tolerance"""
+    baseline_by_key = {r['key']: r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(result['key'])
+        if base is None:
+            print(f"  {result['key']}: chưa có trong baseline")
+            continue
+        change = result['fps'] / base['fps'] - 1.0 if base['fps'] > 0 else 0.0
+        flag = ""
+        if change < -tolerance:
+            regressions.append(result['key'])
+            flag = "  <-- CHẬM ĐI"
+        print(f"  {result['key']}: {base['fps']:.1f} -> {result['fps']:.1f} fps ({change:+.1%}){flag}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark thông lượng pipeline phát hiện bạo lực")
+    parser.add_argument('--resolutions', default="320x240,640x360,1280x720")
+    parser.add_argument('--frames', default="150", help="Số frame mỗi video, phân tách bằng dấu phẩy")
+    parser.add_argument('--image-sizes', default="64")
+    parser.add_argument('--sequence-lengths', default="16")
+    parser.add_argument('--inference-modes', default="per_frame")
+    parser.add_argument('--torch-threads', type=int, default=None)
+    parser.add_argument('--video-cache', default=DEFAULT_VIDEO_CACHE)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="File JSON kết quả của lần chạy này")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Ghi kết quả làm baseline mới")
+    parser.add_argument('--compare', action='store_true', help="So sánh với baseline, thoát mã 1 nếu chậm đi")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Mức giảm fps cho phép khi so sánh")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    from benchmarks.synthetic_video import synthetic_video_path
+
+    args = parse_args(argv)
+    configs = build_configs(args)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for config in configs:
+        video_path = synthetic_video_path(args.video_cache, config['width'], config['height'], config['frames'])
+        # Process mới cho mỗi cấu hình để peak RSS không bị cộng dồn
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_single_benchmark, config, video_path, args.torch_threads).result()
+        results.append(result)
+        latency = result['latency_ms']
+        print(f"{result['key']}: {result['fps']:.1f} fps | latency p50 {latency['p50']:.1f} ms "
+              f"p90 {latency['p90']:.1f} ms p99 {latency['p99']:.1f} ms | peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    import torch
+    payload = {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'torch': torch.__version__,
+            'torch_threads': args.torch_threads or torch.get_num_threads()
+        },
+        'results': results
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2)
+        print(f"Đã lưu baseline: {args.baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"Không tìm thấy baseline: {args.baseline}", file=sys.stderr)
+            return 2
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("So sánh với baseline:")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} cấu hình chậm đi quá {args.tolerance:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import os
+import cv2
+import numpy as np
+
+def generate_synthetic_video(path, width=640, height=360, num_frames=150, fps=25.0, seed=0):
+    """
+    Tạo video tổng hợp xác định (cùng tham số -> cùng nội dung): nền nhiễu tĩnh,
+    vài khối màu di chuyển chậm và một đoạn chuyển động mạnh ở giữa video để
+    pipeline đi qua cả trạng thái tĩnh lẫn chuyển động.
+    """
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (0, 0), 3)
+    
+    num_objects = 4
+    sizes = rng.integers(max(8, height // 12), max(16, height // 5), num_objects)
+    colors = rng.integers(0, 256, (num_objects, 3))
+    positions = rng.uniform(0, 1, (num_objects, 2)) * [width, height]
+    velocities = rng.uniform(-1, 1, (num_objects, 2)) * width / 200
+    burst_start, burst_end = num_frames // 3, 2 * num_frames // 3
+    
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    try:
+        for index in range(num_frames):
+            frame = background.copy()
+            speed = 8.0 if burst_start <= index < burst_end else 1.0
+            positions = (positions + velocities * speed) % [width, height]
+            for (x, y), size, color in zip(positions, sizes, colors):
+                top_left = (int(x), int(y))
+                bottom_right = (int(x) + int(size), int(y) + int(size))
+                cv2.rectangle(frame, top_left, bottom_right, tuple(int(c) for c in color), -1)
+            out.write(frame)
+    finally:
+        out.release()
+    return path
+
+def synthetic_video_path(cache_dir, width, height, num_frames, fps=25.0, seed=0):
+    """Lấy (hoặc tạo nếu chưa có) video tổng hợp trong thư mục cache"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"synthetic_{width}x{height}_{num_frames}f_{int(fps)}fps_s{seed}.mp4")
+    if not os.path.exists(path):
+        generate_synthetic_video(path, width, height, num_frames, fps, seed)
+    return path
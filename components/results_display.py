@@ -1,8 +1,16 @@
 import streamlit as st
 import os
-from utils.config import get_config
-from utils.video_processor import process_single_video
+from utils.config import DEFAULT_CONFIG, get_config, create_analysis_data, get_model_spec
+from utils.video_processor import create_real_time_chart, update_real_time_chart, display_analysis_summary
 from utils.chart_renderer import display_analysis_charts, display_detailed_report
+from utils.video_analysis import redecide_detection, render_annotated_video
+from utils.result_cache import ResultCache, cache_key, file_digest
+from utils.job_service import AnalysisJobService
+
+@st.cache_resource
+def get_job_service():
+    """Dịch vụ phân tích nền dùng chung cho mọi phiên của server (giới hạn MAX_CONCURRENT_JOBS)"""
+    return AnalysisJobService(DEFAULT_CONFIG['MAX_CONCURRENT_JOBS'])
 
 def render_results():
     """Render phần hiển thị kết quả"""
@@ -11,62 +19,251 @@ def render_results():
         if st.button("🚀 Bắt đầu phân tích", type="primary"):
             process_video()
     
+    # Theo dõi công việc phân tích đang chạy trong dịch vụ nền
+    if st.session_state.get('analysis_job') is not None:
+        st.fragment(display_job_progress, run_every=get_config('CHART_UPDATE_INTERVAL'))()
+    
+    # Công việc trước bị lỗi / bị hủy (hiển thị tới khi bắt đầu phân tích lại)
+    job_message = st.session_state.get('job_message')
+    if job_message is not None:
+        level, text = job_message
+        getattr(st, level)(text)
+    
     # Display results if available
     if hasattr(st.session_state, 'processing_complete') and st.session_state.processing_complete:
         display_final_results()
 
 def process_video():
-    """Xử lý video"""
+    """Gửi video vào hàng đợi của dịch vụ phân tích nền (kết quả được theo dõi bằng display_job_progress)"""
     model = st.session_state.model
     device = st.session_state.device
     
     if model is not None and device is not None:
-        # Create output directory
-        os.makedirs("outputs", exist_ok=True)
-        
-        # Generate output path
         uploaded_file = st.session_state.uploaded_file
         output_filename = f"processed_{uploaded_file.name}"
-        output_path = os.path.join("outputs", output_filename)
         
-        # Reset analysis data
-        st.session_state.analysis_data = {
-            'timestamps': [],
-            'violence_probs': [],
-            'motion_scores': [],
-            'detection_status': [],
-            'frame_times': []
+        # Tham số ảnh hưởng tới kết quả phân tích
+        options = {
+            'confidence_threshold': get_config('CONFIDENCE_THRESHOLD'),
+            'sequence_length': get_config('SEQUENCE_LENGTH'),
+            'image_size': get_config('IMAGE_SIZE'),
+            'motion_threshold': get_config('MOTION_THRESHOLD'),
+            'min_stride': get_config('MIN_INFERENCE_STRIDE'),
+            'max_stride': get_config('MAX_INFERENCE_STRIDE'),
+            'cascade_margin': get_config('CASCADE_HYSTERESIS') if get_config('CASCADE_MODE') else None,
+            'inference_mode': get_config('INFERENCE_MODE'),
+            'batch_size': get_config('INFERENCE_BATCH_SIZE'),
+            'motion_estimator': get_config('MOTION_ESTIMATOR')
         }
         
-        # Process video
-        with st.spinner("🔄 Đang phân tích video..."):
-            try:
-                process_single_video(
-                    model=model,
-                    device=device,
-                    video_path=st.session_state.temp_video_path,
-                    output_path=output_path,
-                    confidence_threshold=get_config('CONFIDENCE_THRESHOLD'),
-                    sequence_length=get_config('SEQUENCE_LENGTH'),
-                    image_size=get_config('IMAGE_SIZE'),
-                    motion_threshold=get_config('MOTION_THRESHOLD'),
-                    analysis_data=st.session_state.analysis_data
-                )
-                
+        # Quét hai lượt: lượt thô tìm đoạn nghi vấn, lượt dày chỉ chạy trên các đoạn đó
+        scan_options = {'scan_mode': get_config('SCAN_MODE')}
+        if scan_options['scan_mode'] == 'two_pass':
+            scan_options['coarse_interval'] = get_config('COARSE_INTERVAL')
+            scan_options['coarse_threshold'] = get_config('COARSE_THRESHOLD')
+        
+        # Chế độ ghi đầu ra: cả video, chỉ clip sự kiện hoặc không ghi video
+        output_mode = get_config('OUTPUT_MODE')
+        if scan_options['scan_mode'] == 'two_pass' and output_mode == 'full':
+            st.info("ℹ️ Quét hai lượt chỉ giải mã các đoạn nghi vấn nên chỉ xuất clip sự kiện thay cho toàn bộ video")
+            output_mode = 'clips'
+        output_options = {
+            'output_mode': output_mode,
+            'clip_pre_roll': get_config('CLIP_PRE_ROLL'),
+            'clip_post_roll': get_config('CLIP_POST_ROLL')
+        }
+        
+        # Trace torch.profiler cho stage model (tùy chọn)
+        profile_model = get_config('PROFILE_MODEL')
+        
+        # Ngưỡng chỉ ảnh hưởng tới bước quyết định sau suy luận (tính lại được ngay),
+        # trừ ngưỡng chuyển động khi nó điều khiển lịch gọi model (stride thích ứng / cascade)
+        schedule_uses_motion = options['cascade_margin'] is not None or options['min_stride'] != options['max_stride']
+        result_options = {k: v for k, v in options.items() if k not in ('confidence_threshold', 'motion_threshold')}
+        if schedule_uses_motion:
+            result_options['motion_threshold'] = options['motion_threshold']
+        st.session_state.analysis_options = options
+        st.session_state.schedule_motion_threshold = options['motion_threshold'] if schedule_uses_motion else None
+        
+        # Xử lý song song theo đoạn: chỉ khi quét dày, gọi model mọi frame và không ghi trace
+        chunk_workers = get_config('CHUNK_WORKERS')
+        if chunk_workers > 1 and (scan_options['scan_mode'] != 'dense' or options['max_stride'] > 1
+                                  or options['cascade_margin'] is not None or profile_model):
+            st.info("ℹ️ Xử lý song song theo đoạn cần quét dày, gọi model mọi frame (không stride / cascade) "
+                    "và không ghi trace profiler; video được xử lý tuần tự")
+            chunk_workers = 1
+        
+        # Bỏ công việc trước của phiên này (nếu còn chạy) khi gửi video mới
+        previous_job = st.session_state.get('analysis_job')
+        if previous_job is not None:
+            get_job_service().cancel(previous_job['id'])
+            st.session_state.analysis_job = None
+        st.session_state.job_message = None
+        st.session_state.processing_complete = False
+        
+        video_digest = (st.session_state.upload['digest'] if 'upload' in st.session_state
+                        else file_digest(st.session_state.temp_video_path))
+        # Khóa theo backend / độ chính xác thực sự được dùng (model int8 / bf16 luôn chạy eager)
+        model_spec = get_model_spec()
+        result_key = cache_key(
+            video_digest,
+            file_digest(model_spec['weights_path']),
+            {**result_options,
+             'backend': model_spec['backend'],
+             'precision': model_spec['precision']}
+        )
+        
+        # Cùng video, weights và cấu hình (kể cả ngưỡng và chế độ ghi) thì dùng lại công việc
+        # đang chạy hoặc vừa xong, ví dụ khi mở lại tab
+        job_key = cache_key(video_digest, result_key, {**options, **scan_options, **output_options,
+                                                        'chunk_workers': chunk_workers,
+                                                        'profile_model': profile_model})
+        # Đầu ra theo khóa nội dung của công việc: các phiên tải lên video cùng tên không ghi đè
+        # kết quả của nhau, công việc được dùng lại thì dùng chung đầu ra
+        output_dir = os.path.join("outputs", job_key[:16])
+        output_path = os.path.join(output_dir, output_filename)
+        profile_path = None
+        if profile_model:
+            profile_path = os.path.join(output_dir, f"profile_{os.path.splitext(uploaded_file.name)[0]}.json")
+        os.makedirs(output_dir, exist_ok=True)
+        st.session_state.profile_path = profile_path
+        st.session_state.output_dir = output_dir
+        
+        # Cache theo nội dung video + weights + tham số (chỉ cho chế độ ghi cả video,
+        # bỏ qua khi cần trace profiler)
+        cache = None
+        if get_config('RESULT_CACHE') and profile_path is None and output_mode == 'full':
+            cache = ResultCache(get_config('RESULT_CACHE_DIR'), get_config('RESULT_CACHE_MAX_MB') * 1024 * 1024)
+            cached = cache.get(result_key)
+            if cached is not None:
+                cached_config = cached['metadata'].get('config', options)
+                thresholds = (cached_config['confidence_threshold'], cached_config['motion_threshold'])
+                st.session_state.analysis_data = cached['analysis_data']
+                st.session_state.analysis_thresholds = thresholds
+                st.session_state.video_thresholds = thresholds
                 st.session_state.processing_complete = True
-                st.session_state.output_path = output_path
+                st.session_state.output_mode = output_mode
+                st.session_state.output_path = cached['output_path']
                 st.session_state.output_filename = output_filename
-                
-            except Exception as e:
-                st.error(f"❌ Lỗi trong quá trình xử lý: {e}")
+                st.session_state.skipped_spans = []
+                st.session_state.precision_report = None
+                st.session_state.analysis_info = None
+                st.info("⚡ Video này đã được phân tích với cùng cấu hình, kết quả được lấy từ cache")
+                return
         
-        # Cleanup temp file
-        if hasattr(st.session_state, 'temp_video_path'):
-            os.unlink(st.session_state.temp_video_path)
+        spec = {
+            'video_path': st.session_state.temp_video_path,
+            'output_path': output_path,
+            'model_spec': model_spec,
+            'options': {
+                'profile_path': profile_path,
+                'video_info': st.session_state.upload['info'] if 'upload' in st.session_state else None,
+                'chunk_workers': chunk_workers,
+                **scan_options,
+                **output_options,
+                **options
+            },
+            'preview_window': get_config('CHART_WINDOW_SIZE'),
+            'preview_interval': get_config('CHART_UPDATE_INTERVAL'),
+            # So sánh với fp32 khi dùng model độ chính xác thấp (so theo từng frame nên chỉ khi quét dày)
+            'precision_report': get_config('PRECISION_REPORT') and scan_options['scan_mode'] == 'dense',
+            'cache': {
+                'root': cache.root,
+                'max_bytes': cache.max_bytes,
+                'key': result_key,
+                'metadata': {'video_name': uploaded_file.name, 'config': options}
+            } if cache is not None else None
+        }
+        st.session_state.analysis_job = {
+            'id': get_job_service().submit(spec, key=job_key),
+            'thresholds': (options['confidence_threshold'], options['motion_threshold']),
+            'output_mode': output_mode,
+            'output_path': output_path,
+            'output_filename': output_filename
+        }
+
+def display_job_progress():
+    """Hiển thị tiến độ công việc phân tích của phiên (tự làm mới mỗi CHART_UPDATE_INTERVAL giây)"""
+    job = st.session_state.analysis_job
+    service = get_job_service()
+    status = service.status(job['id'])
+    if status is None:
+        finish_job(job, ('error', "❌ Không còn thông tin về công việc phân tích, hãy phân tích lại"))
+    
+    if status['status'] == 'queued':
+        st.info(f"⏳ Đang chờ trong hàng đợi phân tích (vị trí {status['queue_position']})")
+    elif status['status'] == 'running':
+        progress = status['progress']
+        total_frames = progress['total_frames']
+        st.progress(min(progress['frames'] / total_frames, 1.0) if total_frames > 0 else 0.0)
+        st.text(f"Đang xử lý frame {progress['frames']}/{total_frames} - Thời gian: {progress['time']:.1f}s")
+        if status['preview'] is not None:
+            update_real_time_chart(st.empty(), create_real_time_chart(*job['thresholds']), status['preview'])
+    elif status['status'] == 'failed':
+        finish_job(job, ('error', f"❌ Lỗi trong quá trình xử lý: {status['error']}"))
+    elif status['status'] == 'cancelled':
+        finish_job(job, ('warning', "⏹️ Đã hủy phân tích"))
+    else:
+        collect_job_result(job, service.result(job['id']))
+        st.rerun()
+    
+    if st.button("⏹️ Hủy phân tích"):
+        service.cancel(job['id'])
+
+def finish_job(job, message):
+    """
+    Kết thúc theo dõi công việc bị lỗi / bị hủy: bỏ công việc khỏi phiên và khỏi dịch vụ,
+    giữ lại thông báo, chạy lại cả trang để fragment ngừng tự làm mới
+    """
+    get_job_service().discard(job['id'])
+    st.session_state.analysis_job = None
+    st.session_state.job_message = message
+    st.rerun()
+
+def collect_job_result(job, result):
+    """Chép kết quả của công việc đã xong vào phiên (kho dữ liệu riêng vì công việc có thể được nhiều phiên dùng chung)"""
+    info = result['info']
+    source = result['analysis_data']
+    analysis_data = create_analysis_data()
+    analysis_data.extend(**{name: source.codes(name) for name in source.columns})
+    
+    st.session_state.analysis_data = analysis_data
+    st.session_state.analysis_thresholds = job['thresholds']
+    st.session_state.video_thresholds = job['thresholds']
+    st.session_state.output_mode = job['output_mode']
+    st.session_state.output_clips = info.get('clips', [])
+    st.session_state.output_path = job['output_path']
+    st.session_state.output_filename = job['output_filename']
+    st.session_state.skipped_spans = info.get('skipped_spans', [])
+    st.session_state.precision_report = result['precision_report']
+    st.session_state.analysis_info = info
+    st.session_state.processing_complete = True
+    st.session_state.analysis_job = None
+
+def current_thresholds():
+    """(ngưỡng tin cậy, ngưỡng chuyển động) đang chọn trong sidebar"""
+    return (get_config('CONFIDENCE_THRESHOLD'), get_config('MOTION_THRESHOLD'))
 
 def display_final_results():
     """Hiển thị kết quả cuối cùng"""
     st.success("✅ Phân tích hoàn tất!")
+    if st.session_state.get('analysis_info') is not None:
+        display_analysis_summary(st.session_state.analysis_info, st.session_state.analysis_data)
+    
+    # Ngưỡng đổi sau khi phân tích: quyết định lại trên xác suất đã lưu, không chạy lại model
+    thresholds = current_thresholds()
+    if st.session_state.get('analysis_thresholds') != thresholds:
+        st.session_state.unscored_frames = redecide_detection(st.session_state.analysis_data, *thresholds)
+        st.session_state.analysis_thresholds = thresholds
+    
+    schedule_motion_threshold = st.session_state.get('schedule_motion_threshold')
+    if schedule_motion_threshold is not None and schedule_motion_threshold != thresholds[1]:
+        st.caption(f"ℹ️ Lịch gọi model (stride thích ứng / cascade) được tính với ngưỡng chuyển động "
+                   f"{schedule_motion_threshold}; phân tích lại để áp dụng ngưỡng mới cho cả lịch gọi model.")
+    unscored_frames = st.session_state.get('unscored_frames', 0)
+    if unscored_frames:
+        st.warning(f"⚠️ {unscored_frames} frame bị cascade bỏ qua (chưa chạy model) có chuyển động vượt ngưỡng "
+                   f"mới {thresholds[1]} nên vẫn được tính là Normal; phân tích lại để model chấm điểm các frame này.")
     
     # Display results in tabs
     tab1, tab2, tab3 = st.tabs(["🎥 Video kết quả", "📈 Biểu đồ phân tích", "📋 Báo cáo chi tiết"])
@@ -82,7 +279,22 @@ def display_final_results():
 
 def display_video_result():
     """Hiển thị video kết quả"""
+    output_mode = st.session_state.get('output_mode', 'full')
+    if output_mode == 'signals':
+        st.info("Chế độ chỉ dữ liệu phân tích: không ghi video kết quả. Xem biểu đồ và báo cáo ở các tab bên cạnh.")
+        return
+    if output_mode == 'clips':
+        display_event_clips()
+        return
+    
     st.subheader("📊 Video đã xử lý")
+    
+    video_thresholds = st.session_state.get('video_thresholds')
+    if video_thresholds is not None and video_thresholds != current_thresholds():
+        st.warning(f"Video được vẽ với ngưỡng cũ (tin cậy {video_thresholds[0]}, "
+                   f"chuyển động {video_thresholds[1]}); biểu đồ và báo cáo đã dùng ngưỡng mới.")
+        if st.session_state.get('temp_video_path') and st.button("🎬 Vẽ lại video với ngưỡng mới"):
+            rerender_video()
     st.video(st.session_state.output_path)
     
     # Download button
@@ -92,4 +304,49 @@ def display_video_result():
             data=file,
             file_name=st.session_state.output_filename,
             mime="video/mp4"
-        )
\ No newline at end of file
+        )
+
+def display_event_clips():
+    """Hiển thị và cho tải các clip sự kiện"""
+    clips = st.session_state.get('output_clips', [])
+    st.subheader(f"🎞️ Clip sự kiện ({len(clips)})")
+    
+    if not clips:
+        st.success("🎉 Không có sự kiện bạo lực nào, không có clip được ghi")
+        return
+    
+    for i, clip in enumerate(clips, 1):
+        with st.expander(f"Sự kiện #{i}: {clip['start']:.1f}s - {clip['end']:.1f}s", expanded=(i == 1)):
+            st.video(clip['path'])
+            with open(clip['path'], "rb") as file:
+                st.download_button(
+                    label="📥 Tải clip",
+                    data=file,
+                    file_name=os.path.basename(clip['path']),
+                    mime="video/mp4",
+                    key=f"clip_download_{i}"
+                )
+
+def rerender_video():
+    """Vẽ lại video kết quả với ngưỡng hiện tại từ dữ liệu đã phân tích (không chạy model)"""
+    thresholds = current_thresholds()
+    options = st.session_state.get('analysis_options', {})
+    # Mỗi bộ ngưỡng một thư mục riêng trong thư mục đầu ra của phân tích, không ghi đè video
+    # gốc mà phiên khác dùng chung công việc có thể đang xem
+    output_path = os.path.join(st.session_state.output_dir, f"thresholds_{thresholds[0]}_{thresholds[1]}",
+                               st.session_state.output_filename)
+    with st.spinner("🎬 Đang vẽ lại video..."):
+        try:
+            render_annotated_video(
+                st.session_state.temp_video_path, output_path, st.session_state.analysis_data,
+                confidence_threshold=thresholds[0],
+                motion_threshold=thresholds[1],
+                sequence_length=options.get('sequence_length', get_config('SEQUENCE_LENGTH')),
+                motion_estimator=options.get('motion_estimator', get_config('MOTION_ESTIMATOR'))
+            )
+        except IOError as e:
+            st.error(f"❌ {e}")
+            return
+    st.session_state.output_path = output_path
+    st.session_state.video_thresholds = thresholds
+    st.rerun()
@@ -1,7 +1,14 @@
 import streamlit as st
 from utils.config import get_config, update_config
+from utils.motion_analysis import MOTION_ESTIMATORS
+from utils.decimation import DECIMATION_METHODS
+from utils.video_output import OUTPUT_MODES
+from utils.coarse_scan import SCAN_MODES
+from models.backends import BACKENDS
+from models.quantization import PRECISIONS
 import torch
 import cv2
+import os
 
 def render_sidebar():
     """Render thanh sidebar với các cài đặt"""
@@ -16,6 +23,47 @@ def render_sidebar():
     )
     update_config('MODEL_WEIGHTS_PATH', model_weights)
     
+    backend_labels = {
+        'eager': "PyTorch (eager)",
+        'torchscript': "TorchScript",
+        'onnxruntime': "ONNX Runtime (CPU)"
+    }
+    inference_backend = st.sidebar.selectbox(
+        "Backend suy luận",
+        options=BACKENDS,
+        index=BACKENDS.index(get_config('INFERENCE_BACKEND')),
+        format_func=lambda name: backend_labels[name]
+    )
+    update_config('INFERENCE_BACKEND', inference_backend)
+    
+    precision_labels = {
+        'fp32': "FP32 (gốc)",
+        'dynamic_int8': "INT8 động (LSTM + FC)",
+        'static_int8': "INT8 tĩnh (toàn bộ, cần clip hiệu chỉnh)",
+        'bf16': "BFloat16"
+    }
+    model_precision = st.sidebar.selectbox(
+        "Độ chính xác suy luận (CPU)",
+        options=PRECISIONS,
+        index=PRECISIONS.index(get_config('MODEL_PRECISION')),
+        format_func=lambda name: precision_labels[name]
+    )
+    update_config('MODEL_PRECISION', model_precision)
+    
+    if model_precision != 'fp32':
+        if model_precision == 'static_int8':
+            calibration_dir = st.sidebar.text_input(
+                "Thư mục clip hiệu chỉnh",
+                value=get_config('CALIBRATION_DIR')
+            )
+            update_config('CALIBRATION_DIR', calibration_dir)
+        
+        precision_report = st.sidebar.checkbox(
+            "So sánh với fp32 sau khi phân tích",
+            value=get_config('PRECISION_REPORT')
+        )
+        update_config('PRECISION_REPORT', precision_report)
+    
     confidence_threshold = st.sidebar.slider(
         "Ngưỡng tin cậy AI",
         min_value=0.1, max_value=1.0, 
@@ -50,6 +98,170 @@ def render_sidebar():
     )
     update_config('MOTION_THRESHOLD', motion_threshold)
     
+    estimator_labels = {
+        'farneback': "Farneback (chính xác nhất)",
+        'dis': "DIS Optical Flow (nhanh)",
+        'lucas_kanade': "Lucas-Kanade thưa (nhanh)",
+        'frame_diff': "Sai khác frame (nhanh nhất)"
+    }
+    motion_estimator = st.sidebar.selectbox(
+        "Phương pháp tính chuyển động",
+        options=MOTION_ESTIMATORS,
+        index=MOTION_ESTIMATORS.index(get_config('MOTION_ESTIMATOR')),
+        format_func=lambda name: estimator_labels[name]
+    )
+    update_config('MOTION_ESTIMATOR', motion_estimator)
+    
+    # Event settings
+    st.sidebar.subheader("Lọc sự kiện")
+    
+    event_merge_gap = st.sidebar.slider(
+        "Gộp sự kiện cách nhau không quá (giây)",
+        min_value=0.0, max_value=5.0,
+        value=get_config('EVENT_MERGE_GAP'),
+        step=0.25
+    )
+    update_config('EVENT_MERGE_GAP', event_merge_gap)
+    
+    event_min_duration = st.sidebar.slider(
+        "Thời lượng tối thiểu của sự kiện (giây)",
+        min_value=0.0, max_value=5.0,
+        value=get_config('EVENT_MIN_DURATION'),
+        step=0.25
+    )
+    update_config('EVENT_MIN_DURATION', event_min_duration)
+    
+    # Inference scheduling settings
+    st.sidebar.subheader("Tối ưu suy luận")
+    
+    inference_modes = ['per_frame', 'batched']
+    inference_mode = st.sidebar.selectbox(
+        "Chế độ suy luận",
+        options=inference_modes,
+        index=inference_modes.index(get_config('INFERENCE_MODE')),
+        format_func=lambda mode: "Từng frame" if mode == 'per_frame' else "Theo lô (batch)"
+    )
+    update_config('INFERENCE_MODE', inference_mode)
+    
+    if inference_mode == 'batched':
+        batch_size = st.sidebar.slider(
+            "Số frame mỗi lô (K)",
+            min_value=2, max_value=64,
+            value=get_config('INFERENCE_BATCH_SIZE'),
+            step=2
+        )
+        update_config('INFERENCE_BATCH_SIZE', batch_size)
+    
+    min_stride, max_stride = st.sidebar.slider(
+        "Bước gọi model (chuyển động cao - thấp)",
+        min_value=1, max_value=16,
+        value=(get_config('MIN_INFERENCE_STRIDE'), get_config('MAX_INFERENCE_STRIDE')),
+        step=1,
+        help="Model được gọi mỗi N frame: N nhỏ khi chuyển động vượt ngưỡng, N lớn khi video gần như tĩnh"
+    )
+    update_config('MIN_INFERENCE_STRIDE', min_stride)
+    update_config('MAX_INFERENCE_STRIDE', max_stride)
+    
+    cascade_mode = st.sidebar.checkbox(
+        "Cascade: chỉ chạy model khi có chuyển động",
+        value=get_config('CASCADE_MODE')
+    )
+    update_config('CASCADE_MODE', cascade_mode)
+    
+    if cascade_mode:
+        cascade_hysteresis = st.sidebar.slider(
+            "Biên trễ dưới ngưỡng chuyển động",
+            min_value=0.0, max_value=2.0,
+            value=get_config('CASCADE_HYSTERESIS'),
+            step=0.25
+        )
+        update_config('CASCADE_HYSTERESIS', cascade_hysteresis)
+    
+    scan_mode_labels = {
+        'dense': "Phân tích toàn bộ frame",
+        'two_pass': "Hai lượt: quét thô rồi phân tích đoạn nghi vấn"
+    }
+    scan_mode = st.sidebar.selectbox(
+        "Chế độ quét (video dài)",
+        options=SCAN_MODES,
+        index=SCAN_MODES.index(get_config('SCAN_MODE')),
+        format_func=lambda name: scan_mode_labels[name]
+    )
+    update_config('SCAN_MODE', scan_mode)
+    
+    if scan_mode == 'two_pass':
+        coarse_interval = st.sidebar.slider(
+            "Khoảng cách giữa các mẫu thô (giây)",
+            min_value=1.0, max_value=30.0,
+            value=get_config('COARSE_INTERVAL'),
+            step=1.0
+        )
+        update_config('COARSE_INTERVAL', coarse_interval)
+        
+        coarse_threshold = st.sidebar.slider(
+            "Ngưỡng lượt quét thô",
+            min_value=0.05, max_value=1.0,
+            value=get_config('COARSE_THRESHOLD'),
+            step=0.05,
+            help="Đoạn có xác suất thô từ ngưỡng này trở lên được phân tích dày; nên thấp hơn ngưỡng tin cậy AI"
+        )
+        update_config('COARSE_THRESHOLD', coarse_threshold)
+    
+    chunk_workers = st.sidebar.slider(
+        "Số process xử lý song song (chia video theo đoạn)",
+        min_value=1, max_value=max(2, os.cpu_count() or 1),
+        value=get_config('CHUNK_WORKERS'),
+        step=1,
+        help="Mỗi process nạp một bản model và phân tích một đoạn của video; kết quả giống hệt xử lý tuần tự"
+    )
+    update_config('CHUNK_WORKERS', chunk_workers)
+    
+    profile_model = st.sidebar.checkbox(
+        "Ghi trace torch.profiler cho model",
+        value=get_config('PROFILE_MODEL')
+    )
+    update_config('PROFILE_MODEL', profile_model)
+    
+    result_cache = st.sidebar.checkbox(
+        "Dùng lại kết quả đã phân tích (cache)",
+        value=get_config('RESULT_CACHE'),
+        help="Bỏ qua xử lý khi cùng video đã được phân tích với cùng weights và tham số"
+    )
+    update_config('RESULT_CACHE', result_cache)
+    
+    # Output settings
+    st.sidebar.subheader("Đầu ra")
+    
+    output_mode_labels = {
+        'full': "Toàn bộ video đã chú thích",
+        'clips': "Chỉ các clip sự kiện",
+        'signals': "Chỉ dữ liệu phân tích (không ghi video)"
+    }
+    output_mode = st.sidebar.selectbox(
+        "Chế độ đầu ra",
+        options=OUTPUT_MODES,
+        index=OUTPUT_MODES.index(get_config('OUTPUT_MODE')),
+        format_func=lambda name: output_mode_labels[name]
+    )
+    update_config('OUTPUT_MODE', output_mode)
+    
+    if output_mode == 'clips':
+        clip_pre_roll = st.sidebar.slider(
+            "Thời gian trước sự kiện (giây)",
+            min_value=0.0, max_value=5.0,
+            value=get_config('CLIP_PRE_ROLL'),
+            step=0.5
+        )
+        update_config('CLIP_PRE_ROLL', clip_pre_roll)
+        
+        clip_post_roll = st.sidebar.slider(
+            "Thời gian sau sự kiện (giây)",
+            min_value=0.0, max_value=5.0,
+            value=get_config('CLIP_POST_ROLL'),
+            step=0.5
+        )
+        update_config('CLIP_POST_ROLL', clip_post_roll)
+    
     # Chart settings
     st.sidebar.subheader("Cài đặt biểu đồ")
     
@@ -61,6 +273,26 @@ def render_sidebar():
     )
     update_config('CHART_WINDOW_SIZE', chart_window_size)
     
+    chart_update_interval = st.sidebar.slider(
+        "Chu kỳ cập nhật biểu đồ real-time (giây)",
+        min_value=0.25, max_value=5.0,
+        value=get_config('CHART_UPDATE_INTERVAL'),
+        step=0.25
+    )
+    update_config('CHART_UPDATE_INTERVAL', chart_update_interval)
+    
+    decimation_labels = {
+        'minmax': "Min/Max (giữ đỉnh)",
+        'lttb': "LTTB (giữ hình dạng)"
+    }
+    chart_decimation = st.sidebar.selectbox(
+        "Giảm điểm biểu đồ (video dài)",
+        options=DECIMATION_METHODS,
+        index=DECIMATION_METHODS.index(get_config('CHART_DECIMATION')),
+        format_func=lambda name: decimation_labels[name]
+    )
+    update_config('CHART_DECIMATION', chart_decimation)
+    
     # System information
     st.sidebar.markdown("---")
     st.sidebar.subheader("ℹ️ Thông tin hệ thống")
@@ -1,7 +1,18 @@
 import streamlit as st
-import cv2
+import hashlib
+import shutil
 import tempfile
+import time
+import uuid
 import os
+from utils.video_analysis import probe_video
+from components.results_display import get_job_service
+
+# Thư mục chứa video tải lên, mỗi phiên làm việc có một thư mục con riêng
+UPLOAD_ROOT = os.path.join(tempfile.gettempdir(), "violence_detection_uploads")
+# Thư mục của các phiên không còn hoạt động quá thời gian này (giây) sẽ bị xóa
+UPLOAD_MAX_AGE = 24 * 3600
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
 
 def render_upload_section():
     """Render phần upload video"""
@@ -12,34 +23,111 @@ def render_upload_section():
         type=['mp4', 'avi', 'mov', 'mkv']
     )
     
-    if uploaded_file is not None:
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_file:
-            temp_file.write(uploaded_file.read())
-            st.session_state.temp_video_path = temp_file.name
-        
-        # Display original video and stats
-        col1, col2 = st.columns([2, 1])
-        
-        with col1:
-            st.subheader("🎬 Video gốc")
-            st.video(st.session_state.temp_video_path)
-        
-        with col2:
-            st.subheader("📊 Thống kê video")
-            display_video_stats(st.session_state.temp_video_path)
-        
-        # Store uploaded file info
-        st.session_state.uploaded_file = uploaded_file
-
-def display_video_stats(video_path):
-    """Hiển thị thống kê video"""
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / fps if fps > 0 else 0
-    
-    st.metric("Tổng số frame", f"{total_frames:,}")
-    st.metric("FPS", f"{fps:.1f}")
-    st.metric("Thời lượng", f"{duration:.1f}s")
-    cap.release()
\ No newline at end of file
+    if uploaded_file is None:
+        # Người dùng đã bỏ file: xóa bản lưu trên đĩa
+        discard_upload()
+        return
+    
+    # Mỗi file tải lên chỉ được ghi ra đĩa một lần, các lần rerun dùng lại bản đã lưu
+    upload_id = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+    upload = st.session_state.get('upload')
+    if upload is None or upload['id'] != upload_id or not os.path.exists(upload['path']):
+        try:
+            upload = store_upload(uploaded_file, upload_id)
+        except IOError as e:
+            st.error(f"❌ {e}")
+            return
+    # Đánh dấu phiên còn hoạt động để không bị cleanup_stale_uploads xóa
+    os.utime(os.path.dirname(upload['path']))
+    
+    # Display original video and stats
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        st.subheader("🎬 Video gốc")
+        st.video(upload['path'])
+    
+    with col2:
+        st.subheader("📊 Thống kê video")
+        display_video_stats(upload['info'])
+    
+    # Store uploaded file info
+    st.session_state.uploaded_file = uploaded_file
+
+def session_upload_dir():
+    """Thư mục upload của phiên hiện tại (tạo khi cần, dọn các phiên cũ)"""
+    if 'upload_dir' not in st.session_state:
+        os.makedirs(UPLOAD_ROOT, exist_ok=True)
+        cleanup_stale_uploads()
+        st.session_state.upload_dir = os.path.join(UPLOAD_ROOT, uuid.uuid4().hex)
+    os.makedirs(st.session_state.upload_dir, exist_ok=True)
+    return st.session_state.upload_dir
+
+def store_upload(uploaded_file, upload_id):
+    """
+    Ghi file tải lên ra đĩa theo từng khối, đặt tên theo SHA-256 của nội dung
+    (cùng nội dung thì không ghi lại), probe thông tin video một lần.
+    """
+    upload_dir = session_upload_dir()
+    ext = os.path.splitext(uploaded_file.name)[1].lower() or '.mp4'
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f, uploaded_file.getbuffer() as buffer:
+            for offset in range(0, len(buffer), UPLOAD_CHUNK_SIZE):
+                chunk = buffer[offset:offset + UPLOAD_CHUNK_SIZE]
+                digest.update(chunk)
+                f.write(chunk)
+        path = os.path.join(upload_dir, f"{digest.hexdigest()}{ext}")
+        if os.path.exists(path):
+            os.unlink(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    
+    previous = st.session_state.get('upload')
+    if previous is not None and previous['path'] != path:
+        remove_upload_file(previous['path'])
+    
+    upload = {
+        'id': upload_id,
+        'path': path,
+        'digest': digest.hexdigest(),
+        'info': probe_video(path)
+    }
+    st.session_state.upload = upload
+    st.session_state.temp_video_path = path
+    return upload
+
+def discard_upload():
+    """Xóa file đã lưu của lần tải lên trước (khi người dùng bỏ file)"""
+    upload = st.session_state.pop('upload', None)
+    if upload is not None:
+        remove_upload_file(upload['path'])
+    st.session_state.pop('temp_video_path', None)
+    st.session_state.uploaded_file = None
+
+def remove_upload_file(path):
+    """
+    Xóa file video đã lưu, trừ khi công việc phân tích đang chờ / đang chạy (của phiên này hoặc
+    phiên khác dùng chung công việc) vẫn đọc file; khi đó file được cleanup_stale_uploads dọn sau.
+    """
+    if os.path.exists(path) and path not in get_job_service().active_video_paths():
+        os.unlink(path)
+
+def cleanup_stale_uploads(max_age=UPLOAD_MAX_AGE):
+    """Xóa thư mục upload của các phiên cũ đã lâu không dùng"""
+    now = time.time()
+    for name in os.listdir(UPLOAD_ROOT):
+        path = os.path.join(UPLOAD_ROOT, name)
+        if os.path.isdir(path) and now - os.path.getmtime(path) > max_age:
+            shutil.rmtree(path, ignore_errors=True)
+
+def display_video_stats(video_info):
+    """Hiển thị thống kê video (từ kết quả probe đã lưu)"""
+    st.metric("Tổng số frame", f"{video_info['total_frames']:,}")
+    st.metric("FPS", f"{video_info['fps']:.1f}")
+    st.metric("Thời lượng", f"{video_info['duration']:.1f}s")
+    st.metric("Độ phân giải", f"{video_info['width']}x{video_info['height']}")
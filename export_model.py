@@ -0,0 +1,47 @@
+"""
+Export weights ViolenceDetector sang TorchScript và ONNX, kèm kiểm tra độ khớp với eager.
+
+Ví dụ:
+    python export_model.py --weights weights/best_model_pytorch.pth
+"""
+import argparse
+import sys
+
+import torch
+
+from models.backends import EagerBackend, OnnxRuntimeBackend, TorchScriptBackend, check_parity, export_dir_for, export_model
+from models.violence_detector import load_violence_detector
+from utils.config import DEFAULT_CONFIG
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export ViolenceDetector sang TorchScript / ONNX")
+    parser.add_argument('--weights', default=DEFAULT_CONFIG['MODEL_WEIGHTS_PATH'])
+    parser.add_argument('--output-dir', default=None, help="Mặc định: <thư mục weights>/exported/<tên weights>_<hash nội dung>")
+    parser.add_argument('--image-size', type=int, default=DEFAULT_CONFIG['IMAGE_SIZE'])
+    parser.add_argument('--sequence-length', type=int, default=DEFAULT_CONFIG['SEQUENCE_LENGTH'])
+    parser.add_argument('--tolerance', type=float, default=1e-4, help="Độ lệch xác suất tối đa cho phép")
+    args = parser.parse_args(argv)
+
+    model = load_violence_detector(args.weights, torch.device("cpu"))
+    output_dir = args.output_dir or export_dir_for(args.weights)
+    paths = export_model(model, output_dir, args.image_size, args.sequence_length)
+
+    reference = EagerBackend(model)
+    backends = {
+        'torchscript': lambda: TorchScriptBackend(*paths['torchscript']),
+        'onnxruntime': lambda: OnnxRuntimeBackend(*paths['onnxruntime'])
+    }
+    ok = True
+    for name, build in backends.items():
+        try:
+            max_diff = check_parity(reference, build(), args.image_size, args.sequence_length)
+        except ImportError as e:
+            print(f"{name}: bỏ qua ({e})")
+            continue
+        passed = max_diff <= args.tolerance
+        ok = ok and passed
+        print(f"{name}: {paths[name][0]}, {paths[name][1]} | độ lệch {max_diff:.2e} {'OK' if passed else 'VƯỢT NGƯỠNG'}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
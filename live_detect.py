@@ -0,0 +1,96 @@
+"""
+Phát hiện bạo lực trên nguồn trực tiếp (camera, URL stream hoặc file phát lại theo FPS gốc).
+
+Ví dụ:
+    python live_detect.py 0                                   # webcam
+    python live_detect.py rtsp://camera.local/stream
+    python live_detect.py outputs/test.mp4 --output outputs/live.mp4
+
+Khi phân tích chậm hơn thời gian thực, frame cũ bị bỏ để độ trễ luôn bị giới hạn.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import torch
+
+from models.backends import BACKENDS, export_dir_for
+from utils.config import DEFAULT_CONFIG
+from utils.live_stream import run_live_detection
+from utils.model_registry import get_model_registry
+from utils.motion_analysis import MOTION_ESTIMATORS
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Phát hiện bạo lực trên nguồn video trực tiếp")
+    parser.add_argument('source', help="Chỉ số camera, URL stream hoặc file video")
+    parser.add_argument('--weights', default=DEFAULT_CONFIG['MODEL_WEIGHTS_PATH'])
+    parser.add_argument('--device', default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_CONFIG['INFERENCE_BACKEND'])
+    parser.add_argument('--output', default=None, help="Ghi video đã chú thích (tùy chọn)")
+    parser.add_argument('--max-buffered', type=int, default=2,
+                        help="Số frame tối đa chờ phân tích, vượt quá sẽ bỏ frame cũ")
+    parser.add_argument('--history', type=int, default=3000, help="Số frame giữ trong lịch sử phân tích")
+    parser.add_argument('--no-realtime-replay', action='store_true',
+                        help="Đọc file nhanh nhất có thể thay vì phát lại theo FPS gốc")
+    parser.add_argument('--confidence-threshold', type=float, default=DEFAULT_CONFIG['CONFIDENCE_THRESHOLD'])
+    parser.add_argument('--motion-threshold', type=float, default=DEFAULT_CONFIG['MOTION_THRESHOLD'])
+    parser.add_argument('--sequence-length', type=int, default=DEFAULT_CONFIG['SEQUENCE_LENGTH'])
+    parser.add_argument('--image-size', type=int, default=DEFAULT_CONFIG['IMAGE_SIZE'])
+    parser.add_argument('--motion-estimator', choices=MOTION_ESTIMATORS, default=DEFAULT_CONFIG['MOTION_ESTIMATOR'])
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.weights):
+        print(f"Không tìm thấy file weights: {args.weights}", file=sys.stderr)
+        return 2
+    # Model được khởi động (warm-up) khi nạp nên frame đầu tiên không chịu thêm độ trễ
+    model, report = get_model_registry().get(args.weights, args.device, args.backend,
+                                             export_dir=export_dir_for(args.weights),
+                                             image_size=args.image_size, sequence_length=args.sequence_length)
+    device = model.device
+    print(f"Đã nạp model trong {report['load_seconds']:.2f}s (khởi động {report['warmup_seconds'] * 1000:.0f} ms)",
+          file=sys.stderr, flush=True)
+
+    last_status = {'status': None, 'report_at': 0.0}
+
+    def on_update(record, stats):
+        status = record['detection_status']
+        if status == "VIOLENCE" and last_status['status'] != "VIOLENCE":
+            print(f"🚨 VIOLENCE tại {record['time']:.1f}s (xác suất {record['violence_prob']:.0%}, "
+                  f"chuyển động {record['avg_motion']:.1f}, trễ {stats['lag'] * 1000:.0f} ms)", flush=True)
+        last_status['status'] = status
+
+        now = time.time()
+        if now - last_status['report_at'] >= 1.0:
+            last_status['report_at'] = now
+            print(f"Đã xử lý {stats['processed_frames']} frame | trễ {stats['lag'] * 1000:.0f} ms | "
+                  f"bỏ {stats['dropped_frames']} frame", file=sys.stderr, flush=True)
+
+    stop_event = threading.Event()
+    try:
+        _, stats = run_live_detection(
+            model, device, args.source,
+            confidence_threshold=args.confidence_threshold,
+            sequence_length=args.sequence_length,
+            image_size=args.image_size,
+            motion_threshold=args.motion_threshold,
+            max_buffered=args.max_buffered,
+            history_size=args.history,
+            motion_estimator=args.motion_estimator,
+            output_path=args.output,
+            on_update=on_update,
+            stop_event=stop_event,
+            realtime_replay=False if args.no_realtime_replay else None
+        )
+    except KeyboardInterrupt:
+        stop_event.set()
+        return 130
+
+    print(f"Kết thúc: {stats['processed_frames']} frame đã xử lý, {stats['dropped_frames']} frame bị bỏ")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
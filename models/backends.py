@@ -0,0 +1,214 @@
+import copy
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+from models.violence_detector import unwrap_model
+from utils.hashing import file_digest
+
+BACKENDS = ['eager', 'torchscript', 'onnxruntime']
+
+class _FeatureExtractor(nn.Module):
+    """Backbone + pooling của ViolenceDetector, dùng để export"""
+    def __init__(self, detector):
+        super(_FeatureExtractor, self).__init__()
+        self.cnn_backbone = detector.cnn_backbone
+
+    def forward(self, frames):
+        c_out = self.cnn_backbone(frames)
+        return nn.functional.adaptive_avg_pool2d(c_out, (1, 1)).flatten(1)
+
+
+class _TemporalHead(nn.Module):
+    """LSTM + FC của ViolenceDetector, dùng để export"""
+    def __init__(self, detector):
+        super(_TemporalHead, self).__init__()
+        self.lstm = detector.lstm
+        self.fc = detector.fc
+
+    def forward(self, features):
+        lstm_out, _ = self.lstm(features)
+        return self.fc(lstm_out[:, -1, :])
+
+
+class InferenceBackend:
+    """
+    Giao diện chung cho các backend suy luận. Backend có cùng các entry point với
+    ViolenceDetector (extract_features, classify_sequence, cnn_out_features) nên có thể
+    truyền thẳng vào analyze_video thay cho model.
+    """
+    name = None
+    cnn_out_features = 1280
+    device = torch.device("cpu")
+
+    def extract_features(self, frames):
+        raise NotImplementedError
+
+    def classify_sequence(self, features):
+        raise NotImplementedError
+
+    def __call__(self, x):
+        batch_size, seq_len, c, h, w = x.size()
+        features = self.extract_features(x.reshape(batch_size * seq_len, c, h, w))
+        return self.classify_sequence(features.view(batch_size, seq_len, -1))
+
+
+class EagerBackend(InferenceBackend):
+    """PyTorch eager mode (mặc định)"""
+    name = 'eager'
+
+    def __init__(self, model):
+        self.model = model
+        self.detector = unwrap_model(model)
+        self.cnn_out_features = self.detector.cnn_out_features
+        # Model đã lượng tử hóa có thể không còn tham số float, khi đó chạy trên CPU
+        params = list(self.detector.parameters())
+        self.device = params[0].device if params else torch.device("cpu")
+
+    def extract_features(self, frames):
+        with torch.no_grad():
+            return self.detector.extract_features(frames)
+
+    def classify_sequence(self, features):
+        with torch.no_grad():
+            return self.detector.classify_sequence(features)
+
+
+class TorchScriptBackend(InferenceBackend):
+    """Module TorchScript đã trace và freeze (hợp nhất Conv+BN, bỏ overhead Python)"""
+    name = 'torchscript'
+
+    def __init__(self, backbone_path, head_path, device="cpu"):
+        self.device = torch.device(device)
+        self.paths = (backbone_path, head_path)
+        self.backbone = torch.jit.load(backbone_path, map_location=self.device)
+        self.head = torch.jit.load(head_path, map_location=self.device)
+
+    def extract_features(self, frames):
+        with torch.no_grad():
+            return self.backbone(frames)
+
+    def classify_sequence(self, features):
+        with torch.no_grad():
+            return self.head(features)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """ONNX Runtime trên CPU với tối ưu đồ thị ở mức cao nhất (input/output luôn ở CPU)"""
+    name = 'onnxruntime'
+
+    def __init__(self, backbone_path, head_path, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("Backend 'onnxruntime' cần cài đặt: pip install onnxruntime") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = ['CPUExecutionProvider']
+        self.paths = (backbone_path, head_path)
+        self.backbone = ort.InferenceSession(backbone_path, options, providers=providers)
+        self.head = ort.InferenceSession(head_path, options, providers=providers)
+
+    def extract_features(self, frames):
+        out = self.backbone.run(None, {'frames': frames.detach().cpu().numpy().astype(np.float32, copy=False)})
+        return torch.from_numpy(out[0])
+
+    def classify_sequence(self, features):
+        out = self.head.run(None, {'features': features.detach().cpu().numpy().astype(np.float32, copy=False)})
+        return torch.from_numpy(out[0])
+
+
+def exported_paths(export_dir, backend, image_size=64, sequence_length=16):
+    """
+    Đường dẫn file backbone / head của một backend đã export.
+    Graph export cố định kích thước ảnh (backbone) và độ dài chuỗi (head TorchScript),
+    nên tên file mang theo hai giá trị này để không nạp nhầm graph của cấu hình khác.
+    """
+    ext = '.pt' if backend == 'torchscript' else '.onnx'
+    return (os.path.join(export_dir, f"violence_detector_backbone_{image_size}px{ext}"),
+            os.path.join(export_dir, f"violence_detector_head_seq{sequence_length}{ext}"))
+
+
+def export_dir_for(weights_path, root=None):
+    """
+    Thư mục export riêng cho từng file weights, theo tên và SHA-256 nội dung (copy hoặc touch
+    file không export lại, sửa nội dung thì export mới). Mặc định nằm trong thư mục exported/
+    cạnh file weights nên không phụ thuộc thư mục làm việc hiện tại.
+    """
+    if root is None:
+        root = os.path.join(os.path.dirname(os.path.abspath(weights_path)), "exported")
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    return os.path.join(root, f"{stem}_{file_digest(weights_path)[:16]}")
+
+
+def export_model(model, export_dir, image_size=64, sequence_length=16):
+    """
+    Export ViolenceDetector đã nạp weights thành TorchScript (trace + freeze) và ONNX.
+    Backbone và head được export riêng để giữ cơ chế cache đặc trưng theo frame.
+    Trả về dict {backend: (backbone_path, head_path)}.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    # Export trên bản sao CPU để không di chuyển model đang được sử dụng
+    detector = copy.deepcopy(unwrap_model(model)).cpu().eval()
+    feature_extractor = _FeatureExtractor(detector).eval()
+    head = _TemporalHead(detector).eval()
+
+    frames = torch.rand(2, 3, image_size, image_size)
+    features = torch.rand(2, sequence_length, detector.cnn_out_features)
+
+    paths = {}
+    with torch.no_grad():
+        backbone_path, head_path = exported_paths(export_dir, 'torchscript', image_size, sequence_length)
+        traced_backbone = torch.jit.freeze(torch.jit.trace(feature_extractor, frames))
+        traced_head = torch.jit.freeze(torch.jit.trace(head, features))
+        torch.jit.save(traced_backbone, backbone_path)
+        torch.jit.save(traced_head, head_path)
+        paths['torchscript'] = (backbone_path, head_path)
+
+        backbone_path, head_path = exported_paths(export_dir, 'onnxruntime', image_size, sequence_length)
+        torch.onnx.export(
+            feature_extractor, (frames,), backbone_path,
+            input_names=['frames'], output_names=['features'],
+            dynamic_axes={'frames': {0: 'batch'}, 'features': {0: 'batch'}},
+            dynamo=False
+        )
+        torch.onnx.export(
+            head, (features,), head_path,
+            input_names=['features'], output_names=['logits'],
+            dynamic_axes={'features': {0: 'batch', 1: 'sequence'}, 'logits': {0: 'batch'}},
+            dynamo=False
+        )
+        paths['onnxruntime'] = (backbone_path, head_path)
+
+    return paths
+
+
+def create_backend(name, model, device, export_dir="weights/exported", image_size=64, sequence_length=16):
+    """Tạo backend suy luận theo tên, export từ model hiện tại nếu chưa có file"""
+    if name not in BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: {name}")
+    if name == 'eager':
+        return EagerBackend(model)
+
+    backbone_path, head_path = exported_paths(export_dir, name, image_size, sequence_length)
+    if not (os.path.exists(backbone_path) and os.path.exists(head_path)):
+        export_model(model, export_dir, image_size, sequence_length)
+    if name == 'torchscript':
+        return TorchScriptBackend(backbone_path, head_path, device)
+    return OnnxRuntimeBackend(backbone_path, head_path)
+
+
+def check_parity(reference, backend, image_size=64, sequence_length=16, batch_size=2, seed=0):
+    """
+    So sánh xác suất bạo lực của backend với backend tham chiếu (eager) trên input ngẫu nhiên.
+    Trả về độ lệch tuyệt đối lớn nhất.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.rand(batch_size, sequence_length, 3, image_size, image_size, generator=generator)
+    with torch.no_grad():
+        expected = torch.softmax(reference(x.to(reference.device)), dim=1)[:, 1].cpu()
+        actual = torch.softmax(backend(x.to(backend.device)), dim=1)[:, 1].cpu()
+    return float((expected - actual).abs().max())
@@ -0,0 +1,85 @@
+import copy
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+from models.violence_detector import unwrap_model
+
+PRECISIONS = ['fp32', 'dynamic_int8', 'static_int8', 'bf16']
+
+class ReducedPrecisionDetector(nn.Module):
+    """Chạy ViolenceDetector với trọng số bfloat16, input/output vẫn là float32"""
+    def __init__(self, detector, dtype=torch.bfloat16):
+        super(ReducedPrecisionDetector, self).__init__()
+        self.detector = detector.to(dtype)
+        self.dtype = dtype
+        self.cnn_out_features = detector.cnn_out_features
+
+    def extract_features(self, frames):
+        return self.detector.extract_features(frames.to(self.dtype)).float()
+
+    def classify_sequence(self, features):
+        return self.detector.classify_sequence(features.to(self.dtype)).float()
+
+    def forward(self, x):
+        return self.detector(x.to(self.dtype)).float()
+
+
+def collect_calibration_frames(video_paths, image_size=64, max_frames=256):
+    """
+    Lấy mẫu đều các frame từ các clip mẫu, tiền xử lý giống pipeline suy luận
+    (resize, chia 255, layout C, H, W). Trả về tensor (N, 3, image_size, image_size).
+    """
+    per_video = max(1, max_frames // max(1, len(video_paths)))
+    frames = []
+    for path in video_paths:
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, total // per_video)
+        for index in range(0, max(total, 1), step):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            resized = cv2.resize(frame, (image_size, image_size))
+            frames.append(np.transpose(resized, (2, 0, 1)))
+            if len(frames) >= max_frames:
+                break
+        cap.release()
+    if not frames:
+        raise ValueError("Không đọc được frame nào để hiệu chỉnh (calibration)")
+    return torch.from_numpy(np.stack(frames)).float().div_(255.0)
+
+
+def quantize_detector(model, precision, calibration_frames=None, engine="x86"):
+    """
+    Tạo bản sao ViolenceDetector ở độ chính xác thấp hơn để chạy trên CPU:
+    - 'dynamic_int8': int8 động cho nn.LSTM và nn.Linear
+    - 'static_int8': như trên + int8 tĩnh (post-training) cho cnn_backbone,
+      hiệu chỉnh trên calibration_frames (N, 3, H, W)
+    - 'bf16': trọng số và phép tính bfloat16
+    Model gốc không bị thay đổi.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Độ chính xác không hợp lệ: {precision}")
+    detector = copy.deepcopy(unwrap_model(model)).cpu().eval()
+    if precision == 'fp32':
+        return detector
+    if precision == 'bf16':
+        return ReducedPrecisionDetector(detector).eval()
+
+    from torch.ao.quantization import quantize_dynamic, get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if precision == 'static_int8':
+        if calibration_frames is None or len(calibration_frames) == 0:
+            raise ValueError("static_int8 cần calibration_frames")
+        torch.backends.quantized.engine = engine
+        qconfig_mapping = get_default_qconfig_mapping(engine)
+        prepared = prepare_fx(detector.cnn_backbone, qconfig_mapping, (calibration_frames[:1],))
+        with torch.no_grad():
+            for batch in torch.split(calibration_frames, 32):
+                prepared(batch)
+        detector.cnn_backbone = convert_fx(prepared)
+
+    return quantize_dynamic(detector, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
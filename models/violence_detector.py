@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 import torch.nn as nn
 from torchvision import models
@@ -20,10 +21,137 @@ class ViolenceDetector(nn.Module):
             nn.Linear(128, num_classes)
         )
 
+    def extract_features(self, frames):
+        """Trích xuất đặc trưng CNN cho từng frame: (N, C, H, W) -> (N, 1280)"""
+        c_out = self.cnn_backbone(frames)
+        return nn.functional.adaptive_avg_pool2d(c_out, (1, 1)).flatten(1)
+
+    def classify_sequence(self, features):
+        """Phân loại chuỗi đặc trưng: (B, T, 1280) -> logits (B, num_classes)"""
+        lstm_out, _ = self.lstm(features)
+        return self.fc(lstm_out[:, -1, :])
+
     def forward(self, x):
         batch_size, seq_len, c, h, w = x.size()
         c_in = x.view(batch_size * seq_len, c, h, w)
-        c_out = self.cnn_backbone(c_in)
-        c_out = nn.functional.adaptive_avg_pool2d(c_out, (1, 1)).view(batch_size, seq_len, -1)
-        lstm_out, _ = self.lstm(c_out)
-        return self.fc(lstm_out[:, -1, :])
\ No newline at end of file
+        c_out = self.extract_features(c_in).view(batch_size, seq_len, -1)
+        return self.classify_sequence(c_out)
+
+
+class FrameFeatureBuffer:
+    """
+    Ring buffer lưu đặc trưng CNN của các frame gần nhất.
+    Mỗi frame chỉ cần chạy backbone một lần, cửa sổ trượt được ghép lại từ cache.
+    Frame có thể được đưa vào dưới dạng ảnh uint8 chưa qua backbone (push_input) và chỉ
+    được trích xuất đặc trưng khi một cửa sổ chứa nó thực sự được phân loại.
+    Ảnh input được lưu trong một tensor uint8 cấp phát sẵn (pinned khi chạy CUDA);
+    việc chuẩn hóa float32 và đổi layout sang (C, H, W) chỉ diễn ra ngay trước forward.
+    """
+    def __init__(self, capacity, feature_dim=1280, device="cpu"):
+        self.capacity = capacity
+        self.device = torch.device(device)
+        self.features = torch.zeros(capacity, feature_dim, device=self.device)
+        self.inputs = None
+        self._staging = None
+        self.pending = np.zeros(capacity, dtype=bool)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def push(self, feature):
+        """Thêm đặc trưng (1280,) của frame mới, ghi đè frame cũ nhất"""
+        slot = self.count % self.capacity
+        self.features[slot] = feature
+        self.pending[slot] = False
+        self.count += 1
+
+    def push_input(self, frame_input):
+        """Thêm ảnh uint8 (H, W, C) đã resize của frame mới, backbone sẽ được chạy khi cần"""
+        if self.inputs is None or self.inputs.shape[1:] != frame_input.shape:
+            self._allocate_inputs(frame_input.shape)
+        slot = self.count % self.capacity
+        self.inputs[slot].copy_(torch.from_numpy(frame_input))
+        self.pending[slot] = True
+        self.count += 1
+
+    def _allocate_inputs(self, frame_shape):
+        pin = self.device.type == "cuda"
+        shape = (self.capacity,) + tuple(frame_shape)
+        self.inputs = torch.empty(shape, dtype=torch.uint8, pin_memory=pin)
+        self._staging = torch.empty(shape, dtype=torch.uint8, pin_memory=pin)
+        self.pending[:] = False
+
+    def embed_pending(self, detector, positions):
+        """Chạy backbone (một batch) cho các frame chưa có đặc trưng tại các vị trí cho trước"""
+        oldest = self.count - self.capacity
+        slots = [pos % self.capacity for pos in positions
+                 if pos >= oldest and self.pending[pos % self.capacity]]
+        if slots:
+            # Gom các frame vào buffer staging cấp phát sẵn rồi chuẩn hóa float32 một lần
+            idx = torch.tensor(slots)
+            staged = torch.index_select(self.inputs, 0, idx, out=self._staging[:len(slots)])
+            batch = staged.to(self.device, non_blocking=True).permute(0, 3, 1, 2).float().div_(255.0)
+            self.features[slots] = detector.extract_features(batch)
+            self.pending[slots] = False
+        return len(slots)
+
+    def windows(self, ends, n, detector=None):
+        """
+        Ghép các cửa sổ n frame kết thúc tại các vị trí ends (giá trị của count ngay sau
+        khi push frame cuối cửa sổ): (len(ends), n, 1280). Mọi frame chưa có đặc trưng
+        trong các cửa sổ được đưa qua backbone trong cùng một batch.
+        """
+        if detector is not None:
+            positions = sorted({pos for end in ends for pos in range(end - n, end)})
+            self.embed_pending(detector, positions)
+        idx = torch.tensor([[(end - n + i) % self.capacity for i in range(n)] for end in ends],
+                           device=self.features.device)
+        return self.features[idx]
+
+    def latest(self, n, detector=None):
+        """Trả về đặc trưng của n frame gần nhất theo thứ tự thời gian: (n, 1280)"""
+        n = min(n, len(self))
+        return self.windows([self.count], n, detector)[0]
+
+    def reset(self):
+        self.count = 0
+        self.pending[:] = False
+
+
+def load_violence_detector(weights_path, device, mmap=False):
+    """
+    Khởi tạo ViolenceDetector, nạp weights và chuyển sang chế độ eval.
+    mmap: ánh xạ file weights vào bộ nhớ thay vì đọc cả file vào một buffer trung gian.
+    Tham số vẫn được sao chép vào model (không giữ ánh xạ) để ghi đè file weights khi
+    đang chạy không làm hỏng model đã nạp.
+    """
+    model = ViolenceDetector()
+    
+    # Multi-GPU support
+    if torch.cuda.device_count() > 1:
+        model = nn.DataParallel(model)
+    
+    model.to(device)
+    
+    try:
+        state = torch.load(weights_path, map_location=device, mmap=mmap)
+    except RuntimeError:
+        if not mmap:
+            raise
+        # File lưu theo định dạng cũ (không phải zip) không ánh xạ được
+        state = torch.load(weights_path, map_location=device)
+    # Handle DataParallel prefix
+    if list(state.keys())[0].startswith('module.') and not isinstance(model, nn.DataParallel):
+        state = {k.replace("module.", ""): v for k, v in state.items()}
+    model.load_state_dict(state)
+    model.eval()
+    return model
+
+
+def unwrap_model(model):
+    """Lấy model gốc nếu đang được bọc bởi nn.DataParallel"""
+    return model.module if isinstance(model, nn.DataParallel) else model
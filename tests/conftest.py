@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+
+# Chạy được bằng `pytest` từ thư mục gốc của repo (các module được import theo đường dẫn gốc)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def weights_path(tmp_path_factory):
+    """File weights ngẫu nhiên cố định (seed 0), không cần weights đã huấn luyện"""
+    import torch
+    from models.violence_detector import ViolenceDetector
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("weights") / "detector.pth"
+    torch.save(ViolenceDetector().state_dict(), path)
+    return str(path)
+
+@pytest.fixture(scope="session")
+def detector():
+    """ViolenceDetector với weights ngẫu nhiên cố định (seed 0)"""
+    import torch
+    from models.violence_detector import ViolenceDetector
+    torch.manual_seed(0)
+    return ViolenceDetector().eval()
+
+@pytest.fixture(scope="session")
+def video_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("videos"))
+
+@pytest.fixture(scope="session")
+def synthetic_video(video_dir):
+    """Tạo (một lần cho cả phiên test) video tổng hợp nhỏ: synthetic_video(num_frames)"""
+    from benchmarks.synthetic_video import synthetic_video_path
+
+    def make(num_frames=60, width=96, height=72):
+        return synthetic_video_path(video_dir, width, height, num_frames)
+    return make
@@ -0,0 +1,99 @@
+import json
+import os
+import numpy as np
+import pytest
+from utils.config import ANALYSIS_COLUMNS
+from utils.analysis_store import AnalysisStore, STATUS_LABELS
+from utils.video_analysis import save_analysis, load_analysis
+
+def make_rows(n):
+    return {
+        'timestamps': np.arange(n) / 25.0,
+        'violence_probs': np.linspace(0.0, 1.0, n),
+        'detection_status': [STATUS_LABELS[i % len(STATUS_LABELS)] for i in range(n)],
+        'prob_source': ['model'] * n
+    }
+
+def test_append_frame_and_grow():
+    store = AnalysisStore(ANALYSIS_COLUMNS, initial_capacity=2)
+    for i in range(5):
+        store.append_frame(timestamps=i * 0.5, detection_status="VIOLENCE" if i == 3 else "Normal",
+                           prob_source="model")
+    assert len(store) == 5 and store.capacity >= 5
+    assert store['timestamps'].tolist() == [0.0, 0.5, 1.0, 1.5, 2.0]
+    assert store['detection_status'].tolist() == ["Normal"] * 3 + ["VIOLENCE", "Normal"]
+    assert store.value_counts('detection_status') == {'Normal': 4, 'FALSE ALARM': 0, 'VIOLENCE': 1}
+
+def test_categorical_columns_are_int8_codes():
+    store = AnalysisStore(ANALYSIS_COLUMNS)
+    store.extend(**make_rows(6))
+    codes = store.codes('detection_status')
+    assert codes.dtype == np.int8
+    assert codes.tolist() == [0, 1, 2, 0, 1, 2]
+    assert list(store['detection_status']) == make_rows(6)['detection_status']
+
+def test_extend_copies_input():
+    rows = make_rows(4)
+    store = AnalysisStore(ANALYSIS_COLUMNS)
+    store.extend(**rows)
+    rows['timestamps'][:] = -1.0
+    assert (store['timestamps'] >= 0).all()
+
+def test_spill_to_disk_keeps_data_and_close_removes_files(tmp_path):
+    store = AnalysisStore(ANALYSIS_COLUMNS, initial_capacity=8, spill_limit=16, spill_dir=str(tmp_path))
+    rows = make_rows(100)
+    store.extend(**rows)
+    assert store.spilled
+    assert isinstance(store._arrays['timestamps'], np.memmap)
+    assert np.array_equal(store['timestamps'], rows['timestamps'])
+    assert list(store['detection_status']) == rows['detection_status']
+    spill_dir = store._spill_path
+    assert os.listdir(spill_dir)
+
+    store.close()
+    assert not os.path.exists(spill_dir)
+    assert len(store) == 0 and not store.spilled
+    # Dùng lại được sau close
+    store.extend(**make_rows(3))
+    assert len(store) == 3
+
+def test_close_clears_in_memory_store():
+    store = AnalysisStore(ANALYSIS_COLUMNS)
+    store.extend(**make_rows(10))
+    store.close()
+    assert len(store) == 0
+    assert len(store['timestamps']) == 0
+
+def test_ring_buffer_keeps_latest_rows():
+    store = AnalysisStore(ANALYSIS_COLUMNS, max_history=4)
+    for i in range(10):
+        store.append_frame(timestamps=float(i), detection_status="Normal", prob_source="model")
+    assert store['timestamps'].tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert store.tail('timestamps', 2).tolist() == [8.0, 9.0]
+
+def test_npz_round_trip(tmp_path):
+    store = AnalysisStore(ANALYSIS_COLUMNS)
+    store.extend(**make_rows(20))
+    path = str(tmp_path / "analysis.npz")
+    save_analysis(store, path, metadata={'video': 'test.mp4'})
+    loaded, metadata = load_analysis(path)
+    assert metadata['video'] == 'test.mp4'
+    for name in ANALYSIS_COLUMNS:
+        assert np.array_equal(loaded.codes(name), store.codes(name))
+        assert loaded.codes(name).dtype == store.codes(name).dtype
+
+def test_json_writes_gated_frames_as_null(tmp_path):
+    rows = make_rows(6)
+    rows['violence_probs'][[1, 4]] = np.nan
+    rows['prob_source'][1] = rows['prob_source'][4] = 'gated'
+    store = AnalysisStore(ANALYSIS_COLUMNS)
+    store.extend(**rows)
+    path = str(tmp_path / "analysis.json")
+    save_analysis(store, path)
+    with open(path, encoding='utf-8') as f:
+        # JSON chuẩn: không có token NaN
+        payload = json.load(f, parse_constant=lambda token: pytest.fail(f"JSON không hợp lệ: {token}"))
+    assert payload['analysis']['violence_probs'][1] is None
+    loaded, _ = load_analysis(path)
+    assert np.array_equal(loaded['violence_probs'], store['violence_probs'], equal_nan=True)
+    assert loaded['prob_source'].tolist() == store['prob_source'].tolist()
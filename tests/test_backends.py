@@ -0,0 +1,17 @@
+import pytest
+import torch
+from models.backends import EagerBackend, check_parity, create_backend, export_dir_for
+
+@pytest.mark.parametrize("backend", ["torchscript", "onnxruntime"])
+def test_backend_reexports_for_new_image_size(tmp_path, weights_path, detector, backend):
+    """Export ở 64px rồi nạp ở 96px / chuỗi 8 frame phải export graph mới, không dùng lại graph cũ"""
+    if backend == "onnxruntime":
+        pytest.importorskip("onnxruntime")
+    export_dir = export_dir_for(weights_path, root=str(tmp_path))
+    small = create_backend(backend, detector, "cpu", export_dir, image_size=64, sequence_length=16)
+    large = create_backend(backend, detector, "cpu", export_dir, image_size=96, sequence_length=8)
+    assert set(small.paths).isdisjoint(large.paths)
+
+    x = torch.rand(1, 8, 3, 96, 96)
+    assert large(x).shape == (1, 2)
+    assert check_parity(EagerBackend(detector), large, image_size=96, sequence_length=8) < 1e-4
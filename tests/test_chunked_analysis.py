@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from utils.chunked_analysis import chunk_plan, analyze_video_chunked, CHUNK_MIN_FRAMES
+from utils.config import create_analysis_data
+from utils.model_registry import get_model_registry
+from utils.video_analysis import analyze_video
+
+def covered_frames(plan, total_frames):
+    """Các frame được giữ lại (từ frame đầu tới frame cuối) của từng đoạn"""
+    return [list(range(start, (end if end is not None else total_frames) + 1)) for _, start, end in plan]
+
+@pytest.mark.parametrize("total_frames, chunks", [(1024, 4), (1000, 3), (5000, 7), (CHUNK_MIN_FRAMES * 2, 2)])
+def test_chunk_plan_covers_every_frame_once(total_frames, chunks):
+    plan = chunk_plan(total_frames, chunks, warmup=16)
+    assert len(plan) == chunks
+    frames = [frame for chunk in covered_frames(plan, total_frames) for frame in chunk]
+    assert frames == list(range(1, total_frames + 1))
+    assert plan[-1][2] is None
+    for read_start, start, _ in plan:
+        assert read_start == max(1, start - 16)
+
+def test_chunk_plan_limits_chunks_for_short_videos():
+    assert len(chunk_plan(CHUNK_MIN_FRAMES * 3 - 1, 8, warmup=16)) == 2
+    assert chunk_plan(100, 4, warmup=16) == [(1, 1, None)]
+
+def test_chunk_plan_aligns_boundaries_and_warmup():
+    plan = chunk_plan(2000, 3, warmup=16, align=6)
+    for read_start, start, _ in plan[1:]:
+        assert (start - 1) % 6 == 0
+        assert (start - read_start) % 6 == 0 and start - read_start >= 16
+
+@pytest.mark.parametrize("inference_mode", ["per_frame", "batched"])
+def test_chunked_matches_sequential(weights_path, synthetic_video, inference_mode):
+    video = synthetic_video(CHUNK_MIN_FRAMES * 2 + 20)
+    # Ảnh nhỏ, cửa sổ ngắn và ước lượng chuyển động rẻ để test nhanh
+    model_spec = {'weights_path': weights_path, 'device_name': "cpu", 'image_size': 32, 'sequence_length': 8}
+    options = {'confidence_threshold': 0.5, 'motion_threshold': 0.15, 'inference_mode': inference_mode,
+               'batch_size': 4, 'image_size': 32, 'sequence_length': 8, 'motion_estimator': "frame_diff"}
+
+    model, _ = get_model_registry().get(**model_spec)
+    sequential = create_analysis_data()
+    analyze_video(model, model.device, video, None, analysis_data=sequential, output_mode="signals", **options)
+
+    chunked = create_analysis_data()
+    info = analyze_video_chunked(model_spec, video, None, workers=2, analysis_data=chunked,
+                                 output_mode="signals", torch_threads=1, **options)
+
+    assert info['processed_frames'] == CHUNK_MIN_FRAMES * 2 + 20
+    assert len(chunked) == len(sequential)
+    for name in ('timestamps', 'violence_probs', 'motion_scores', 'detection_status', 'prob_source'):
+        assert np.array_equal(chunked.codes(name), sequential.codes(name)), name
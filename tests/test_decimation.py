@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from utils.decimation import minmax_indices, lttb_indices, decimate, rolling_mean_on_grid
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(0)
+    y = rng.random(10_001)
+    y[1234], y[7777] = 5.0, -5.0
+    return np.arange(len(y)) / 25.0, y
+
+@pytest.mark.parametrize("max_points", [2, 3, 4, 10, 101, 2000])
+def test_minmax_keeps_endpoints_and_budget(series, max_points):
+    _, y = series
+    indices = minmax_indices(y, max_points)
+    assert indices[0] == 0 and indices[-1] == len(y) - 1
+    assert len(indices) <= max_points
+    assert np.all(np.diff(indices) > 0)
+
+def test_minmax_keeps_spikes(series):
+    _, y = series
+    indices = minmax_indices(y, 100)
+    assert 1234 in indices and 7777 in indices
+
+@pytest.mark.parametrize("max_points", [3, 10, 101, 2000])
+def test_lttb_keeps_endpoints_and_budget(series, max_points):
+    x, y = series
+    indices = lttb_indices(x, y, max_points)
+    assert indices[0] == 0 and indices[-1] == len(y) - 1
+    assert len(indices) == max_points
+    assert np.all(np.diff(indices) > 0)
+
+def test_short_series_is_not_decimated(series):
+    x, y = series
+    assert np.array_equal(minmax_indices(y[:50], 100), np.arange(50))
+    assert np.array_equal(lttb_indices(x[:50], y[:50], 100), np.arange(50))
+
+def test_nan_values_are_not_chosen_as_extremes(series):
+    x, y = series
+    y = y.copy()
+    y[2000:4000] = np.nan
+    indices = minmax_indices(y, 100)
+    assert 1234 in indices and 7777 in indices
+    assert len(lttb_indices(x, y, 100)) == 100
+
+@pytest.mark.parametrize("method", ["minmax", "lttb"])
+def test_decimate_returns_matching_points(series, method):
+    x, y = series
+    x_small, y_small = decimate(x, y, 200, method)
+    assert len(x_small) == len(y_small) <= 200
+    assert np.array_equal(y_small, y[np.searchsorted(x, x_small)])
+
+def test_rolling_mean_matches_full_rolling_mean():
+    y = np.random.default_rng(1).random(500)
+    grid, means = rolling_mean_on_grid(y, 20, 50)
+    full = np.convolve(y, np.ones(20) / 20, mode='valid')
+    assert np.allclose(means, full[grid - 19])
+
+def test_rolling_mean_skips_nan():
+    y = np.array([1.0, np.nan, 3.0, np.nan, np.nan, np.nan])
+    grid, means = rolling_mean_on_grid(y, 3, 10)
+    assert grid.tolist() == [2, 3, 4, 5]
+    assert means[0] == 2.0 and means[1] == 3.0 and means[2] == 3.0 and np.isnan(means[3])
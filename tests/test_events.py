@@ -0,0 +1,60 @@
+import json
+import numpy as np
+from utils.analysis_store import STATUS_LABELS
+from utils.events import events_to_json, extract_events
+
+NORMAL, VIOLENCE = STATUS_LABELS.index("Normal"), STATUS_LABELS.index("VIOLENCE")
+
+def events_for(statuses, min_duration=0.0, merge_gap=0.0, fps=10.0):
+    codes = np.array([VIOLENCE if s == "V" else NORMAL for s in statuses], dtype=np.int8)
+    timestamps = np.arange(1, len(codes) + 1) / fps
+    probs = np.linspace(0.0, 1.0, len(codes))
+    motion = np.arange(len(codes), dtype=np.float32)
+    return extract_events(timestamps, codes, probs, motion, min_duration, merge_gap)
+
+def test_no_violence_gives_no_events():
+    assert len(events_for("....")) == 0
+
+def test_runs_become_events_with_inclusive_end():
+    events = events_for("..VVV...VV.")
+    assert events['start_index'].tolist() == [2, 8]
+    assert events['end_index'].tolist() == [4, 9]
+    assert np.allclose(events['start'], [0.3, 0.9])
+    assert np.allclose(events['end'], [0.5, 1.0])
+
+def test_event_at_end_of_series():
+    events = events_for("...VV")
+    assert events['start_index'].tolist() == [3]
+    assert events['end_index'].tolist() == [4]
+
+def test_merge_gap_joins_close_events_only():
+    # Khoảng trống 0.3s (giữa frame 4 và 7) được gộp, khoảng trống 0.6s thì không
+    statuses = "VVVV..VV.....VV"
+    assert len(events_for(statuses)) == 3
+    events = events_for(statuses, merge_gap=0.3)
+    assert events['start_index'].tolist() == [0, 13]
+    assert events['end_index'].tolist() == [7, 14]
+
+def test_min_duration_drops_short_events_after_merging():
+    statuses = "V.V.......VVVVV"
+    events = events_for(statuses, min_duration=0.3)
+    assert events['start_index'].tolist() == [10]
+    # Sau khi gộp, hai đoạn một frame thành một đoạn đủ dài
+    events = events_for(statuses, min_duration=0.15, merge_gap=0.2)
+    assert events['start_index'].tolist() == [0, 10]
+
+def test_event_statistics():
+    events = events_for("..VVV..")
+    probs = np.linspace(0.0, 1.0, 7)
+    assert np.isclose(events['peak_prob'][0], probs[4])
+    assert np.isclose(events['mean_motion'][0], 3.0)
+
+def test_merged_gap_with_gated_frames_keeps_peak_finite():
+    # Frame bị gate trong khoảng trống được gộp có xác suất NaN
+    codes = np.array([VIOLENCE, VIOLENCE, NORMAL, NORMAL, VIOLENCE], dtype=np.int8)
+    timestamps = np.arange(1, 6) / 10.0
+    probs = np.array([0.9, 0.95, np.nan, np.nan, 0.92])
+    events = extract_events(timestamps, codes, probs, np.zeros(5), merge_gap=0.3)
+    assert len(events) == 1
+    assert np.isclose(events['peak_prob'][0], 0.95)
+    assert json.loads(events_to_json(events))[0]['peak_prob'] > 0.9
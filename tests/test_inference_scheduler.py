@@ -0,0 +1,46 @@
+from utils.inference_scheduler import InferenceScheduler
+
+def test_stride_interpolates_between_max_and_min():
+    scheduler = InferenceScheduler(motion_threshold=2.0, min_stride=1, max_stride=5)
+    assert scheduler.stride_for(0.0) == 5
+    assert scheduler.stride_for(1.0) == 3
+    assert scheduler.stride_for(2.0) == 1
+    assert scheduler.stride_for(10.0) == 1
+
+def test_stride_is_min_stride_without_motion_threshold():
+    scheduler = InferenceScheduler(motion_threshold=0.0, min_stride=2, max_stride=8)
+    assert scheduler.stride_for(0.0) == 2
+
+def test_max_stride_is_never_below_min_stride():
+    scheduler = InferenceScheduler(motion_threshold=2.0, min_stride=4, max_stride=2)
+    assert scheduler.max_stride == 4
+    assert scheduler.stride_for(0.0) == 4
+
+def test_next_action_runs_model_every_stride_frames():
+    scheduler = InferenceScheduler(motion_threshold=2.0, min_stride=1, max_stride=3)
+    actions = [scheduler.next_action(0.0) for _ in range(7)]
+    assert actions == ["model", "carried", "carried", "model", "carried", "carried", "model"]
+
+def test_next_action_runs_model_every_frame_above_threshold():
+    scheduler = InferenceScheduler(motion_threshold=2.0, min_stride=1, max_stride=4)
+    assert [scheduler.next_action(5.0) for _ in range(3)] == ["model"] * 3
+
+def test_gated_frames_skip_model_and_invalidate_carried_result():
+    scheduler = InferenceScheduler(motion_threshold=2.0, min_stride=1, max_stride=4, gate_margin=0.5)
+    assert scheduler.next_action(3.0) == "model"
+    assert scheduler.next_action(1.6) == "carried"  # trong vùng trễ: không bị chặn
+    assert scheduler.next_action(1.0) == "gated"
+    # Cổng mở lại: kết quả cũ không được giữ, phải chạy model ngay
+    assert scheduler.next_action(1.6) == "model"
+
+def test_no_gating_without_margin():
+    scheduler = InferenceScheduler(motion_threshold=2.0)
+    assert not scheduler.is_gated(0.0)
+    assert scheduler.next_action(0.0) == "model"
+
+def test_reset_forces_model_on_next_frame():
+    scheduler = InferenceScheduler(motion_threshold=2.0, min_stride=1, max_stride=4)
+    assert scheduler.next_action(0.0) == "model"
+    assert scheduler.next_action(0.0) == "carried"
+    scheduler.reset()
+    assert scheduler.next_action(0.0) == "model"
@@ -0,0 +1,126 @@
+import time
+import pytest
+import utils.job_service
+from utils.job_service import AnalysisJobService, JOB_FINISHED
+
+def job_spec(video_path, model_spec, tmp_path):
+    return {
+        'video_path': video_path,
+        'output_path': str(tmp_path / "output.mp4"),
+        'model_spec': model_spec,
+        'options': {'output_mode': "signals", 'image_size': 32, 'sequence_length': 8,
+                    'motion_estimator': "frame_diff"}
+    }
+
+def wait_for(service, job_id, statuses, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = service.status(job_id)
+        if status['status'] in statuses:
+            return status
+        time.sleep(0.05)
+    raise TimeoutError(f"Công việc {job_id} không đạt trạng thái {statuses}")
+
+@pytest.fixture
+def model_spec(weights_path):
+    return {'weights_path': weights_path, 'device_name': "cpu", 'image_size': 32, 'sequence_length': 8}
+
+def test_job_runs_to_completion(synthetic_video, model_spec, tmp_path):
+    service = AnalysisJobService()
+    job_id = service.submit(job_spec(synthetic_video(60), model_spec, tmp_path))
+    status = wait_for(service, job_id, JOB_FINISHED)
+    assert status['status'] == 'done'
+    assert status['progress']['frames'] == 60
+    assert len(service.result(job_id)['analysis_data']) > 0
+
+def test_submit_with_same_key_reuses_job(synthetic_video, model_spec, tmp_path):
+    service = AnalysisJobService()
+    spec = job_spec(synthetic_video(60), model_spec, tmp_path)
+    job_id = service.submit(spec, key="same")
+    assert service.submit(spec, key="same") == job_id
+    wait_for(service, job_id, JOB_FINISHED)
+    # Công việc đã xong vẫn được dùng lại, key khác hoặc không có key thì chạy mới
+    assert service.submit(spec, key="same") == job_id
+    assert service.submit(spec, key="other") != job_id
+    assert service.submit(spec) != job_id
+
+def test_failed_job_is_not_reused(model_spec, tmp_path):
+    service = AnalysisJobService()
+    spec = job_spec(str(tmp_path / "missing.mp4"), model_spec, tmp_path)
+    job_id = service.submit(spec, key="bad")
+    status = wait_for(service, job_id, JOB_FINISHED)
+    assert status['status'] == 'failed' and status['error']
+    assert service.result(job_id) is None
+    assert service.submit(spec, key="bad") != job_id
+
+def test_cancel_queued_job(synthetic_video, model_spec, tmp_path):
+    service = AnalysisJobService(max_workers=1)
+    running_id = service.submit(job_spec(synthetic_video(300), model_spec, tmp_path))
+    wait_for(service, running_id, ('running',) + JOB_FINISHED)
+    queued_id = service.submit(job_spec(synthetic_video(60), model_spec, tmp_path))
+    assert service.status(queued_id)['queue_position'] == 1
+    service.cancel(queued_id)
+    assert service.status(queued_id)['status'] == 'cancelled'
+
+    assert wait_for(service, running_id, JOB_FINISHED)['status'] == 'done'
+    assert service.status(queued_id)['status'] == 'cancelled'
+    assert service.result(queued_id) is None
+    # Hủy lại công việc đã kết thúc không có tác dụng
+    service.cancel(running_id)
+    assert service.status(running_id)['status'] == 'done'
+
+def test_cancel_running_job(synthetic_video, model_spec, tmp_path):
+    service = AnalysisJobService()
+    job_id = service.submit(job_spec(synthetic_video(300), model_spec, tmp_path))
+    deadline = time.monotonic() + 120
+    while service.status(job_id)['progress']['frames'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    service.cancel(job_id)
+    status = wait_for(service, job_id, JOB_FINISHED)
+    assert status['status'] == 'cancelled'
+    assert status['progress']['frames'] < 300
+    assert service.result(job_id) is None
+
+def test_active_video_paths(synthetic_video, model_spec, tmp_path):
+    service = AnalysisJobService(max_workers=1)
+    running = job_spec(synthetic_video(300), model_spec, tmp_path)
+    queued = job_spec(synthetic_video(60), model_spec, tmp_path)
+    running_id = service.submit(running)
+    queued_id = service.submit(queued)
+    assert service.active_video_paths() == {running['video_path'], queued['video_path']}
+    service.cancel(running_id)
+    wait_for(service, queued_id, JOB_FINISHED)
+    assert service.active_video_paths() == set()
+
+def test_discard_and_history(synthetic_video, model_spec, tmp_path):
+    service = AnalysisJobService(history=1)
+    spec = job_spec(synthetic_video(60), model_spec, tmp_path)
+    first = service.submit(spec)
+    wait_for(service, first, JOB_FINISHED)
+    second = service.submit(spec)
+    wait_for(service, second, JOB_FINISHED)
+    # Chỉ giữ `history` công việc đã kết thúc (bị dọn khi gửi công việc mới)
+    third = service.submit(spec)
+    wait_for(service, third, JOB_FINISHED)
+    assert service.status(first) is None
+    service.discard(third)
+    assert service.status(third) is None
+
+def test_cancel_during_precision_reference(synthetic_video, model_spec, tmp_path, monkeypatch):
+    run_reference = utils.job_service.run_reference_analysis
+    received = {}
+
+    def cancel_during_reference(*args, **options):
+        # Người dùng hủy trong lúc lượt fp32 tham chiếu đang chạy
+        received.update(options)
+        options['stop_event'].set()
+        return run_reference(*args, **{**options, 'stop_event': None})
+    monkeypatch.setattr(utils.job_service, "run_reference_analysis", cancel_during_reference)
+
+    service = AnalysisJobService()
+    spec = job_spec(synthetic_video(60), {**model_spec, 'precision': 'dynamic_int8'}, tmp_path)
+    job_id = service.submit({**spec, 'precision_report': True})
+    status = wait_for(service, job_id, JOB_FINISHED)
+    assert received['stop_event'] is not None
+    assert status['status'] == 'cancelled'
+    assert service.result(job_id) is None
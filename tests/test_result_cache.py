@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pytest
+from utils.config import create_analysis_data
+from utils.result_cache import ResultCache, cache_key
+
+VIDEO_BYTES = 10_000
+
+@pytest.fixture
+def output_video(tmp_path):
+    path = tmp_path / "output.mp4"
+    path.write_bytes(os.urandom(VIDEO_BYTES))
+    return str(path)
+
+def make_analysis(n=10):
+    analysis_data = create_analysis_data()
+    analysis_data.extend(timestamps=np.arange(n) / 25.0, violence_probs=np.full(n, 0.5),
+                         detection_status=["Normal"] * n, prob_source=["model"] * n)
+    return analysis_data
+
+def put_at(cache, key, output_video, when):
+    """Lưu một mục rồi đặt thời điểm truy cập (mtime) của nó"""
+    entry = cache.put(key, output_video, make_analysis())
+    os.utime(entry, (when, when))
+
+def test_cache_key_depends_on_every_part():
+    base = cache_key("video", "weights", {'a': 1, 'b': 2})
+    assert base == cache_key("video", "weights", {'b': 2, 'a': 1})
+    assert base != cache_key("video2", "weights", {'a': 1, 'b': 2})
+    assert base != cache_key("video", "weights2", {'a': 1, 'b': 2})
+    assert base != cache_key("video", "weights", {'a': 1, 'b': 3})
+
+def test_put_get_round_trip(tmp_path, output_video):
+    cache = ResultCache(str(tmp_path / "cache"))
+    assert cache.get("missing") is None
+    cache.put("key", output_video, make_analysis(), metadata={'video_name': "a.mp4"})
+    cached = cache.get("key")
+    assert cached['metadata']['video_name'] == "a.mp4"
+    assert len(cached['analysis_data']) == 10
+    assert os.path.getsize(cached['output_path']) == VIDEO_BYTES
+
+def test_evicts_least_recently_used_entries(tmp_path, output_video):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10 ** 9)
+    for i, key in enumerate(["a", "b", "c"]):
+        put_at(cache, key, output_video, 1000 + i)
+    entry_size = max(size for _, size, _ in cache.entries())
+
+    # Dùng lại "a": "b" trở thành mục ít được dùng gần đây nhất
+    assert cache.get("a") is not None
+    cache.max_bytes = 3 * entry_size
+    cache.put("d", output_video, make_analysis())
+    assert sorted(name for _, _, name in cache.entries()) == ["a", "c", "d"]
+
+    cache.max_bytes = entry_size + 1
+    cache.evict()
+    assert [name for _, _, name in cache.entries()] == ["d"]
+
+def test_new_entry_is_kept_even_if_over_budget(tmp_path, output_video):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1)
+    cache.put("big", output_video, make_analysis())
+    assert cache.get("big") is not None
+    cache.put("next", output_video, make_analysis())
+    assert cache.get("big") is None and cache.get("next") is not None
+
+def test_corrupt_entry_is_dropped(tmp_path, output_video):
+    cache = ResultCache(str(tmp_path / "cache"))
+    entry = cache.put("key", output_video, make_analysis())
+    with open(os.path.join(entry, ResultCache.ANALYSIS_NAME), 'wb') as f:
+        f.write(b"not an npz")
+    assert cache.get("key") is None
+    assert not os.path.exists(entry)
@@ -0,0 +1,98 @@
+import os
+import threading
+import numpy as np
+import pytest
+import torch
+from utils.config import create_analysis_data
+from utils.video_analysis import analyze_video, redecide_detection, decide_detection, detection_codes
+from utils.analysis_store import STATUS_LABELS
+from utils.pipeline import PipelineCancelled
+
+# Chuyển động của video tổng hợp: ~0.05 khi tĩnh, ~0.25 ở đoạn chuyển động mạnh giữa video
+MOTION_THRESHOLD = 0.15
+CASCADE_MARGIN = 0.05
+
+@pytest.fixture(scope="module")
+def cascade_data(detector, synthetic_video):
+    analysis_data = create_analysis_data()
+    analyze_video(detector, torch.device("cpu"), synthetic_video(90), None, analysis_data=analysis_data,
+                  output_mode="signals", motion_threshold=MOTION_THRESHOLD, cascade_margin=CASCADE_MARGIN,
+                  max_stride=3)
+    return analysis_data
+
+def test_gated_frames_have_no_probability(cascade_data):
+    sources = cascade_data['prob_source']
+    probs = cascade_data['violence_probs']
+    gated = sources == "gated"
+    assert gated.any() and (sources == "model").any()
+    assert np.isnan(probs[gated]).all()
+    assert np.isfinite(probs[~gated]).all()
+    assert (cascade_data['detection_status'][gated] == "Normal").all()
+
+def test_carried_frames_keep_last_model_probability(cascade_data):
+    sources = cascade_data['prob_source']
+    probs = cascade_data['violence_probs']
+    last_model_prob = None
+    for source, prob in zip(sources, probs):
+        if source == "model":
+            last_model_prob = prob
+        elif source == "carried":
+            assert prob == last_model_prob
+
+def test_redecide_reports_unscored_gated_frames(cascade_data):
+    gated_motion = cascade_data['motion_scores'][cascade_data['prob_source'] == "gated"]
+    assert redecide_detection(cascade_data, 0.85, MOTION_THRESHOLD) == 0
+    lowered = float(np.median(gated_motion))
+    assert redecide_detection(cascade_data, 0.85, lowered) == int((gated_motion > lowered).sum())
+    assert (cascade_data['detection_status'][cascade_data['prob_source'] == "gated"] == "Normal").all()
+
+@pytest.mark.parametrize("thresholds", [(0.5, 1.0), (0.85, 2.0), (0.2, 0.0), (0.99, 5.0)])
+def test_detection_codes_match_decide_detection(thresholds):
+    rng = np.random.default_rng(0)
+    probs = rng.random(1000).astype(np.float32)
+    motion = (rng.random(1000) * 4).astype(np.float32)
+    # Giá trị đúng bằng ngưỡng phải được xử lý giống nhau
+    probs[:10], motion[10:20] = thresholds[0], thresholds[1]
+    codes = detection_codes(probs, motion, *thresholds)
+    expected = [decide_detection(float(p), float(m), *thresholds)[0] for p, m in zip(probs, motion)]
+    assert [STATUS_LABELS[c] for c in codes] == expected
+
+def test_redecide_matches_analysis_with_new_thresholds(detector, synthetic_video):
+    video = synthetic_video(60)
+    analysis_data = create_analysis_data()
+    analyze_video(detector, torch.device("cpu"), video, None, analysis_data=analysis_data,
+                  output_mode="signals", confidence_threshold=0.85, motion_threshold=2.0)
+    probs = analysis_data['violence_probs']
+    motion = analysis_data['motion_scores']
+    # Model ngẫu nhiên cho xác suất gần như không đổi: ngưỡng tin cậy ngay dưới xác suất nhỏ nhất,
+    # ngưỡng chuyển động ở giữa để có cả VIOLENCE lẫn FALSE ALARM
+    thresholds = (float(probs.min()) - 1e-3, float(np.median(motion)))
+    redecide_detection(analysis_data, *thresholds)
+
+    expected = create_analysis_data()
+    analyze_video(detector, torch.device("cpu"), video, None, analysis_data=expected,
+                  output_mode="signals", confidence_threshold=thresholds[0], motion_threshold=thresholds[1])
+    assert len(set(analysis_data['detection_status'])) > 1
+    assert list(analysis_data['detection_status']) == list(expected['detection_status'])
+
+def output_snapshot(root):
+    """{đường dẫn tương đối: kích thước} của mọi file dưới root"""
+    return {os.path.relpath(os.path.join(d, f), root): os.path.getsize(os.path.join(d, f))
+            for d, _, files in os.walk(root) for f in files}
+
+@pytest.mark.parametrize("output_mode", ["full", "clips"])
+def test_cancelled_run_keeps_previous_output(tmp_path, detector, synthetic_video, output_mode):
+    video = synthetic_video(30)
+    output_path = str(tmp_path / "processed.mp4")
+    options = dict(output_mode=output_mode, confidence_threshold=0.0, motion_threshold=0.0,
+                   image_size=32, sequence_length=8)
+    analyze_video(detector, torch.device("cpu"), video, output_path, **options)
+    before = output_snapshot(tmp_path)
+    assert before
+
+    stop_event = threading.Event()
+    with pytest.raises(PipelineCancelled):
+        analyze_video(detector, torch.device("cpu"), video, output_path, stop_event=stop_event,
+                      progress_callback=lambda *args: stop_event.set(), **options)
+    # Không còn file / thư mục tạm, đầu ra của lần chạy trước vẫn nguyên vẹn
+    assert output_snapshot(tmp_path) == before
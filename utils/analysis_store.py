@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+# Trạng thái và nguồn xác suất được lưu dưới dạng mã số nguyên nhỏ
+STATUS_LABELS = ['Normal', 'FALSE ALARM', 'VIOLENCE']
+# 'coarse': mẫu thưa của lượt quét thô, đánh dấu đoạn không được phân tích dày (utils.coarse_scan)
+PROB_SOURCE_LABELS = ['model', 'carried', 'gated', 'coarse']
+
+CATEGORICAL_COLUMNS = {
+    'detection_status': STATUS_LABELS,
+    'prob_source': PROB_SOURCE_LABELS
+}
+
+class AnalysisStore:
+    """
+    Lưu dữ liệu phân tích theo cột trong các mảng NumPy cấp phát sẵn.
+    - Cột số được đọc trực tiếp dưới dạng view (không copy): store['violence_probs']
+    - Cột trạng thái / nguồn xác suất lưu mã int8, đọc nhãn bằng store['detection_status']
+      hoặc mã bằng store.codes('detection_status')
+    - Vượt quá spill_limit dòng thì dữ liệu được chuyển sang file memory-mapped trong thư mục
+      tạm (tempfile), thư mục bị xóa khi gọi close(), khi store bị thu hồi hoặc khi thoát process
+    - max_history: chỉ giữ N dòng gần nhất (ring buffer, dùng cho chế độ trực tiếp)
+    """
+    def __init__(self, columns, initial_capacity=4096, spill_limit=1_000_000, spill_dir=None, max_history=None):
+        self.columns = dict(columns)
+        self.max_history = max_history
+        self.spill_limit = spill_limit
+        self.spill_dir = spill_dir
+        self.spilled = False
+        self._spill_path = None
+        self._size = 0
+        self._count = 0
+        self._initial_capacity = max_history if max_history is not None else initial_capacity
+        self._arrays = self._allocate(self._initial_capacity)
+        self._finalizer = None
+
+    @property
+    def capacity(self):
+        return len(next(iter(self._arrays.values())))
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+    def items(self):
+        return ((name, self[name]) for name in self.columns)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.columns else default
+
+    def clear(self):
+        self._size = 0
+        self._count = 0
+
+    def append_frame(self, **values):
+        """Thêm một dòng; nhãn của cột phân loại được chuyển sang mã số"""
+        if self.max_history is not None:
+            row = self._count % self.max_history
+        else:
+            if self._size == self.capacity:
+                self._grow()
+            row = self._size
+        for name, value in values.items():
+            labels = CATEGORICAL_COLUMNS.get(name)
+            self._arrays[name][row] = labels.index(value) if labels is not None else value
+        self._count += 1
+        self._size = min(self._count, self.max_history) if self.max_history is not None else self._count
+
+    def extend(self, **columns):
+        """Thêm nhiều dòng một lần từ các mảng cùng độ dài (nhãn hoặc mã cho cột phân loại)"""
+        size = len(next(iter(columns.values()))) if columns else 0
+        if self.max_history is not None:
+            for row in range(size):
+                self.append_frame(**{name: values[row] for name, values in columns.items()})
+            return
+        while self._size + size > self.capacity:
+            self._grow()
+        for name, values in columns.items():
+            values = np.asarray(values)
+            labels = CATEGORICAL_COLUMNS.get(name)
+            if labels is not None and values.dtype.kind in ('U', 'S', 'O'):
+                lookup = {label: code for code, label in enumerate(labels)}
+                values = np.array([lookup[v] for v in values], dtype=self.columns[name])
+            self._arrays[name][self._size:self._size + size] = values
+        self._size = self._count = self._size + size
+
+    def codes(self, key):
+        """Mảng giá trị thô của một cột theo thứ tự thời gian (view khi không quay vòng)"""
+        array = self._arrays[key]
+        if self.max_history is not None and self._count > self.max_history:
+            start = self._count % self.max_history
+            return np.concatenate([array[start:], array[:start]])
+        return array[:self._size]
+
+    def tail(self, key, n):
+        """n dòng cuối của một cột (view khi không quay vòng), kích thước không phụ thuộc độ dài dữ liệu"""
+        if self.max_history is not None and self._count > self.max_history:
+            return self[key][-n:]
+        start = max(0, self._size - n)
+        values = self._arrays[key][start:self._size]
+        labels = CATEGORICAL_COLUMNS.get(key)
+        return np.asarray(labels, dtype=object)[values] if labels is not None else values
+
+    def assign(self, key, values):
+        """Ghi đè toàn bộ một cột (theo thứ tự thời gian), nhãn phân loại nhận mã số"""
+        values = np.asarray(values)
+        array = self._arrays[key]
+        if self.max_history is not None and self._count > self.max_history:
+            start = self._count % self.max_history
+            array[start:] = values[:self.max_history - start]
+            array[:start] = values[self.max_history - start:]
+        else:
+            array[:self._size] = values
+
+    def __getitem__(self, key):
+        values = self.codes(key)
+        labels = CATEGORICAL_COLUMNS.get(key)
+        if labels is not None:
+            return np.asarray(labels, dtype=object)[values]
+        return values
+
+    def value_counts(self, key):
+        """Số dòng theo từng nhãn của một cột phân loại, đếm trực tiếp trên mã số"""
+        labels = CATEGORICAL_COLUMNS[key]
+        counts = np.bincount(self.codes(key), minlength=len(labels))
+        return {label: int(count) for label, count in zip(labels, counts)}
+
+    def to_dataframe(self):
+        """DataFrame của toàn bộ dữ liệu (có copy, chỉ dùng khi thực sự cần pandas)"""
+        import pandas as pd
+        return pd.DataFrame({name: self[name] for name in self.columns})
+
+    def export_npz(self, path, metadata=None):
+        """
+        Ghi toàn bộ cột (mã số cho cột phân loại) ra file .npz nén, kèm bảng nhãn
+        và metadata (chuỗi JSON) nếu có
+        """
+        extra = {'metadata': np.array(json.dumps(metadata, ensure_ascii=False))} if metadata else {}
+        np.savez_compressed(path, **{name: self.codes(name) for name in self.columns},
+                            status_labels=np.array(STATUS_LABELS), prob_source_labels=np.array(PROB_SOURCE_LABELS),
+                            **extra)
+
+    def export_parquet(self, path):
+        """Ghi ra Parquet (cần pyarrow), cột phân loại được lưu dạng category"""
+        import pandas as pd
+        frame = pd.DataFrame({name: self.codes(name) for name in self.columns})
+        for name, labels in CATEGORICAL_COLUMNS.items():
+            if name in frame:
+                frame[name] = pd.Categorical.from_codes(frame[name], categories=labels)
+        frame.to_parquet(path, index=False)
+
+    @classmethod
+    def from_arrays(cls, columns, arrays, **kwargs):
+        """Tạo store từ các cột đã có (mảng mã số hoặc nhãn cho cột phân loại)"""
+        lengths = {len(arrays[name]) for name in columns if name in arrays}
+        size = lengths.pop() if lengths else 0
+        store = cls(columns, initial_capacity=max(size, 1), **kwargs)
+        for name in columns:
+            if name not in arrays:
+                continue
+            values = np.asarray(arrays[name])
+            labels = CATEGORICAL_COLUMNS.get(name)
+            if labels is not None and values.dtype.kind in ('U', 'S', 'O'):
+                lookup = {label: code for code, label in enumerate(labels)}
+                values = np.array([lookup[v] for v in values], dtype=store.columns[name])
+            store._arrays[name][:size] = values
+        store._size = store._count = size
+        return store
+
+    def _allocate(self, capacity):
+        return {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.columns.items()}
+
+    def _grow(self):
+        new_capacity = self.capacity * 2
+        if self.spilled or new_capacity > self.spill_limit:
+            self._grow_on_disk(new_capacity)
+            return
+        for name, array in self._arrays.items():
+            grown = np.zeros(new_capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._arrays[name] = grown
+
+    def _grow_on_disk(self, new_capacity):
+        """Chuyển (hoặc mở rộng) các cột sang file memory-mapped"""
+        if self._spill_path is None:
+            self._spill_path = tempfile.mkdtemp(prefix="analysis_store_", dir=self.spill_dir)
+            # Chạy khi close(), khi store bị thu hồi (__del__) hoặc lúc thoát process (atexit)
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_path, True)
+        generation = os.urandom(4).hex()
+        for name, array in self._arrays.items():
+            path = os.path.join(self._spill_path, f"{name}_{generation}.dat")
+            mapped = np.memmap(path, dtype=array.dtype, mode='w+', shape=(new_capacity,))
+            mapped[:self._size] = array[:self._size]
+            old_path = getattr(array, 'filename', None)
+            self._arrays[name] = mapped
+            del array
+            if old_path and os.path.exists(old_path):
+                os.unlink(old_path)
+        self.spilled = True
+
+    def close(self):
+        """Bỏ toàn bộ dữ liệu (store trở về rỗng, dùng lại được) và xóa file tạm trên đĩa nếu đã spill"""
+        # Bỏ tham chiếu tới memmap trước khi xóa file
+        self._arrays = self._allocate(self._initial_capacity)
+        self._size = self._count = 0
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+            self._spill_path = None
+            self.spilled = False
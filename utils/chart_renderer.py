@@ -3,23 +3,30 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import pandas as pd
-from utils.config import get_config
+from utils.config import get_config, TIMING_STAGES
+from utils.decimation import decimate, rolling_mean_on_grid
+from utils.events import extract_analysis_events, events_to_json, events_to_csv
+import numpy as np
+import io
+import os
+
+# Số sự kiện tối đa được tô nền trên biểu đồ phân tích
+MAX_EVENT_SHAPES = 200
 
 def display_analysis_charts():
     """Hiển thị biểu đồ phân tích theo thời gian"""
     data = st.session_state.analysis_data
     
-    if not data['timestamps']:
+    if len(data) == 0:
         st.warning("Không có dữ liệu phân tích để hiển thị")
         return
     
-    # Create DataFrame for easier plotting
-    df = pd.DataFrame({
-        'Thời gian (s)': data['timestamps'],
-        'Xác suất bạo lực': data['violence_probs'],
-        'Điểm chuyển động': data['motion_scores'],
-        'Trạng thái': data['detection_status']
-    })
+    # Các cột được đọc trực tiếp từ kho dữ liệu (view NumPy, không copy) rồi giảm
+    # xuống số điểm vừa màn hình, vẫn giữ các đỉnh xác suất / chuyển động
+    max_points = get_config('CHART_MAX_POINTS')
+    method = get_config('CHART_DECIMATION')
+    prob_times, violence_probs = decimate(data['timestamps'], data['violence_probs'], max_points, method)
+    motion_times, motion_scores = decimate(data['timestamps'], data['motion_scores'], max_points, method)
     
     # Main analysis chart
     fig = make_subplots(
@@ -31,8 +38,8 @@ def display_analysis_charts():
     # Add violence probability trace
     fig.add_trace(
         go.Scatter(
-            x=df['Thời gian (s)'],
-            y=df['Xác suất bạo lực'],
+            x=prob_times,
+            y=violence_probs,
             mode='lines',
             name='Xác suất bạo lực',
             line=dict(color='red', width=2),
@@ -55,8 +62,8 @@ def display_analysis_charts():
     # Add motion scores
     fig.add_trace(
         go.Scatter(
-            x=df['Thời gian (s)'],
-            y=df['Điểm chuyển động'],
+            x=motion_times,
+            y=motion_scores,
             mode='lines',
             name='Điểm chuyển động',
             line=dict(color='blue', width=2),
@@ -76,6 +83,22 @@ def display_analysis_charts():
         row=2, col=1
     )
     
+    # Tô nền các sự kiện bạo lực (giới hạn số vùng để biểu đồ vẫn nhẹ)
+    for event in get_event_index()[:MAX_EVENT_SHAPES]:
+        fig.add_vrect(
+            x0=event['start'], x1=event['end'],
+            fillcolor="red", opacity=0.15, line_width=0,
+            row="all", col=1
+        )
+    
+    # Quét hai lượt: tô xám các đoạn chỉ có mẫu thô (không được phân tích dày)
+    for start, end in st.session_state.get('skipped_spans', [])[:MAX_EVENT_SHAPES]:
+        fig.add_vrect(
+            x0=start, x1=end,
+            fillcolor="gray", opacity=0.1, line_width=0,
+            row="all", col=1
+        )
+    
     # Update layout
     fig.update_layout(
         height=600,
@@ -93,13 +116,14 @@ def display_analysis_charts():
     display_status_distribution(data)
     
     # Moving average chart
-    display_moving_average(df)
+    display_moving_average(data)
 
 def display_status_distribution(data):
     """Hiển thị biểu đồ phân bố trạng thái"""
     st.subheader("Phân bố trạng thái phát hiện")
     
-    status_counts = pd.Series(data['detection_status']).value_counts()
+    status_counts = pd.Series(data.value_counts('detection_status'))
+    status_counts = status_counts[status_counts > 0].sort_values(ascending=False)
 
     color_map = {
         'VIOLENCE': 'red',
@@ -118,28 +142,30 @@ def display_status_distribution(data):
     fig_pie.update_layout(title="Tỉ lệ các trạng thái phát hiện")
     st.plotly_chart(fig_pie, use_container_width=True)
 
-def display_moving_average(df):
+def display_moving_average(data):
     """Hiển thị biểu đồ trung bình động"""
     st.subheader("Xu hướng phát hiện (Trung bình động)")
     
-    if len(df) > 10:
-        window_size = min(get_config('CHART_WINDOW_SIZE'), len(df) // 4)
-        df['Violence_MA'] = df['Xác suất bạo lực'].rolling(window=window_size).mean()
-        df['Motion_MA'] = df['Điểm chuyển động'].rolling(window=window_size).mean()
+    if len(data) > 10:
+        window_size = min(get_config('CHART_WINDOW_SIZE'), len(data) // 4)
+        max_points = get_config('CHART_MAX_POINTS')
+        grid, violence_ma = rolling_mean_on_grid(data['violence_probs'], window_size, max_points)
+        _, motion_ma = rolling_mean_on_grid(data['motion_scores'], window_size, max_points)
+        timestamps = data['timestamps'][grid]
         
         fig_ma = go.Figure()
         
         fig_ma.add_trace(go.Scatter(
-            x=df['Thời gian (s)'],
-            y=df['Violence_MA'],
+            x=timestamps,
+            y=violence_ma,
             mode='lines',
             name=f'Xác suất bạo lực (MA{window_size})',
             line=dict(color='red', width=3)
         ))
         
         fig_ma.add_trace(go.Scatter(
-            x=df['Thời gian (s)'],
-            y=df['Motion_MA'],
+            x=timestamps,
+            y=motion_ma,
             mode='lines',
             name=f'Chuyển động (MA{window_size})',
             line=dict(color='blue', width=3),
@@ -160,17 +186,16 @@ def display_detailed_report():
     """Hiển thị báo cáo chi tiết về phân tích"""
     data = st.session_state.analysis_data
     
-    if not data['timestamps']:
+    if len(data) == 0:
         st.warning("Không có dữ liệu để tạo báo cáo")
         return
     
-    df = pd.DataFrame(data)
-    
-    # Calculate statistics
-    total_frames = len(df)
-    violence_frames = len(df[df['detection_status'] == 'VIOLENCE'])
-    false_alarm_frames = len(df[df['detection_status'] == 'FALSE ALARM'])
-    normal_frames = len(df[df['detection_status'] == 'Normal'])
+    # Calculate statistics (đếm trực tiếp trên mã trạng thái)
+    total_frames = len(data)
+    status_counts = data.value_counts('detection_status')
+    violence_frames = status_counts['VIOLENCE']
+    false_alarm_frames = status_counts['FALSE ALARM']
+    normal_frames = status_counts['Normal']
     
     # Display metrics
     col1, col2, col3, col4 = st.columns(4)
@@ -185,54 +210,271 @@ def display_detailed_report():
         st.metric("Frame bình thường", f"{normal_frames} ({normal_frames/total_frames*100:.1f}%)")
     
     # Detailed statistics
-    display_detailed_stats(df)
+    display_detailed_stats(data)
+    
+    # Inference savings
+    display_inference_stats(data)
+    
+    # Per-stage timings
+    display_stage_timings(data)
     
     # Timeline of events
-    display_timeline_events(df)
+    display_timeline_events(data)
+    
+    # Export
+    display_analysis_export(data)
+    
+    # Reduced-precision comparison
+    report = st.session_state.get('precision_report')
+    if report:
+        display_precision_report(report)
 
-def display_detailed_stats(df):
+def display_detailed_stats(data):
     """Hiển thị thống kê chi tiết"""
     st.subheader("Thống kê chi tiết")
     
+    violence_probs = data['violence_probs']
+    motion_scores = data['motion_scores']
     stats_col1, stats_col2 = st.columns(2)
     
     with stats_col1:
+        # Frame bị cascade bỏ qua không có xác suất (NaN) và không được tính
         st.write("**Xác suất bạo lực:**")
-        st.write(f"- Trung bình: {df['violence_probs'].mean():.3f}")
-        st.write(f"- Cao nhất: {df['violence_probs'].max():.3f}")
-        st.write(f"- Thấp nhất: {df['violence_probs'].min():.3f}")
-        st.write(f"- Độ lệch chuẩn: {df['violence_probs'].std():.3f}")
+        st.write(f"- Trung bình: {np.nanmean(violence_probs):.3f}")
+        st.write(f"- Cao nhất: {np.nanmax(violence_probs):.3f}")
+        st.write(f"- Thấp nhất: {np.nanmin(violence_probs):.3f}")
+        st.write(f"- Độ lệch chuẩn: {np.nanstd(violence_probs, ddof=1):.3f}")
     
     with stats_col2:
         st.write("**Điểm chuyển động:**")
-        st.write(f"- Trung bình: {df['motion_scores'].mean():.2f}")
-        st.write(f"- Cao nhất: {df['motion_scores'].max():.2f}")
-        st.write(f"- Thấp nhất: {df['motion_scores'].min():.2f}")
-        st.write(f"- Độ lệch chuẩn: {df['motion_scores'].std():.2f}")
+        st.write(f"- Trung bình: {motion_scores.mean():.2f}")
+        st.write(f"- Cao nhất: {motion_scores.max():.2f}")
+        st.write(f"- Thấp nhất: {motion_scores.min():.2f}")
+        st.write(f"- Độ lệch chuẩn: {motion_scores.std(ddof=1):.2f}")
+
+def display_inference_stats(data):
+    """Hiển thị số lần gọi model đã chạy và đã được bỏ qua"""
+    counts = data.value_counts('prob_source')
+    total = sum(counts.values())
+    if total == 0:
+        return
+    
+    st.subheader("Hiệu quả suy luận")
+    
+    skipped = counts['carried'] + counts['gated']
+    # Mẫu thô của quét hai lượt không thay thế lần gọi model nào cho từng frame
+    total -= counts['coarse']
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Lần gọi model", f"{counts['model']:,}")
+    with col2:
+        st.metric("Bỏ qua theo bước suy luận", f"{counts['carried']:,}")
+    with col3:
+        st.metric("Bỏ qua do cascade", f"{counts['gated']:,}")
+    
+    if total > 0:
+        st.write(f"Tiết kiệm **{skipped/total*100:.1f}%** số lần gọi model")
+    if counts['coarse'] > 0:
+        st.write(f"Quét hai lượt: **{counts['coarse']}** mẫu thô đánh dấu các đoạn không được phân tích dày")
+
+def display_stage_timings(data):
+    """Hiển thị thời gian xử lý theo từng giai đoạn và FPS hiệu dụng"""
+    stage_columns = [f'stage_{stage}' for stage in TIMING_STAGES if f'stage_{stage}' in data]
+    if not stage_columns or len(data) == 0:
+        return
+    
+    st.subheader("Thời gian theo giai đoạn")
+    
+    stage_names = {
+        'stage_decode': "Giải mã (decode)",
+        'stage_motion': "Optical Flow",
+        'stage_preprocess': "Tiền xử lý",
+        'stage_inference': "Model",
+        'stage_overlay': "Vẽ overlay",
+        'stage_encode': "Mã hóa (encode)"
+    }
+    means = np.array([data[c].mean() for c in stage_columns])
+    timing_table = pd.DataFrame({
+        'Giai đoạn': [stage_names[c] for c in stage_columns],
+        'Trung bình (ms)': means,
+        'P95 (ms)': [np.percentile(data[c], 95) for c in stage_columns],
+        'Tỉ trọng (%)': means / means.sum() * 100 if means.sum() > 0 else 0.0
+    })
+    st.dataframe(timing_table.style.format({
+        'Trung bình (ms)': "{:.2f}", 'P95 (ms)': "{:.2f}", 'Tỉ trọng (%)': "{:.1f}"
+    }), use_container_width=True, hide_index=True)
+    
+    # FPS hiệu dụng so với FPS gốc của video
+    # max: dòng cuối theo thời gian video có thể là mẫu thô ghi sớm hơn (quét hai lượt)
+    elapsed = data['frame_times'].max()
+    effective_fps = len(data) / elapsed if elapsed > 0 else 0.0
+    time_steps = np.diff(data['timestamps'])
+    native_fps = 1.0 / np.median(time_steps) if len(time_steps) > 0 and np.median(time_steps) > 0 else 0.0
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("FPS xử lý", f"{effective_fps:.1f}")
+    with col2:
+        st.metric("FPS gốc của video", f"{native_fps:.1f}")
+    with col3:
+        st.metric("So với thời gian thực", f"{effective_fps / native_fps:.2f}x" if native_fps > 0 else "-")
+    
+    profile_path = st.session_state.get('profile_path')
+    if profile_path and os.path.exists(profile_path):
+        st.write(f"Trace torch.profiler của stage model: `{profile_path}` (mở bằng chrome://tracing hoặc Perfetto)")
+        with open(profile_path, "rb") as file:
+            st.download_button(
+                label="📥 Tải trace profiler",
+                data=file,
+                file_name=os.path.basename(profile_path),
+                mime="application/json"
+            )
+
+def get_event_index():
+    """
+    Chỉ mục sự kiện bạo lực của analysis_data hiện tại, dùng chung cho biểu đồ,
+    báo cáo và file tải về. Chỉ tính lại khi dữ liệu, ngưỡng hoặc tham số lọc thay đổi.
+    """
+    data = st.session_state.analysis_data
+    min_duration = get_config('EVENT_MIN_DURATION')
+    merge_gap = get_config('EVENT_MERGE_GAP')
+    key = (id(data), len(data), st.session_state.get('analysis_thresholds'), min_duration, merge_gap)
+    if st.session_state.get('event_index_key') != key:
+        st.session_state.event_index = extract_analysis_events(data, min_duration, merge_gap)
+        st.session_state.event_index_key = key
+    return st.session_state.event_index
 
-def display_timeline_events(df):
+def display_timeline_events(data):
     """Hiển thị dòng thời gian sự kiện"""
     st.subheader("Dòng thời gian sự kiện")
     
-    violence_frames = len(df[df['detection_status'] == 'VIOLENCE'])
+    events = get_event_index()
     
-    if violence_frames > 0:
-        violence_periods = []
-        current_start = None
-        
-        for i, (time, status) in enumerate(zip(df['timestamps'], df['detection_status'])):
-            if status == 'VIOLENCE' and current_start is None:
-                current_start = time
-            elif status != 'VIOLENCE' and current_start is not None:
-                violence_periods.append((current_start, df['timestamps'][i-1]))
-                current_start = None
+    if len(events) > 0:
+        st.write(f"**{len(events)} sự kiện bạo lực** (gộp khoảng trống ≤ {get_config('EVENT_MERGE_GAP')}s, "
+                 f"bỏ sự kiện ngắn hơn {get_config('EVENT_MIN_DURATION')}s)")
+        event_table = pd.DataFrame({
+            'Bắt đầu (s)': events['start'],
+            'Kết thúc (s)': events['end'],
+            'Kéo dài (s)': events['end'] - events['start'],
+            'Xác suất cao nhất': events['peak_prob'],
+            'Chuyển động TB': events['mean_motion']
+        }, index=pd.RangeIndex(1, len(events) + 1, name='#'))
+        st.dataframe(event_table.style.format({
+            'Bắt đầu (s)': "{:.1f}", 'Kết thúc (s)': "{:.1f}", 'Kéo dài (s)': "{:.1f}",
+            'Xác suất cao nhất': "{:.0%}", 'Chuyển động TB': "{:.2f}"
+        }), use_container_width=True)
         
-        # Handle case where violence continues to the end
-        if current_start is not None:
-            violence_periods.append((current_start, df['timestamps'].iloc[-1]))
-        
-        for i, (start, end) in enumerate(violence_periods, 1):
-            duration = end - start
-            st.write(f"**Sự kiện bạo lực #{i}:** {start:.1f}s - {end:.1f}s (Kéo dài: {duration:.1f}s)")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="📥 Tải danh sách sự kiện (.json)",
+                data=events_to_json(events),
+                file_name="events.json",
+                mime="application/json"
+            )
+        with col2:
+            st.download_button(
+                label="📥 Tải danh sách sự kiện (.csv)",
+                data=events_to_csv(events),
+                file_name="events.csv",
+                mime="text/csv"
+            )
+    else:
+        st.success("🎉 Không phát hiện sự kiện bạo lực nào trong video!")
+
+def get_analysis_exports(data):
+    """
+    Nội dung file .npz / .parquet (None nếu thiếu pyarrow) của analysis_data. Chỉ mã hóa lại
+    khi dữ liệu hoặc ngưỡng thay đổi, không phải ở mỗi lần Streamlit chạy lại script.
+    """
+    key = (id(data), len(data), st.session_state.get('analysis_thresholds'))
+    if st.session_state.get('analysis_exports_key') != key:
+        buffer = io.BytesIO()
+        data.export_npz(buffer)
+        exports = {'npz': buffer.getvalue(), 'parquet': None}
+        try:
+            buffer = io.BytesIO()
+            data.export_parquet(buffer)
+            exports['parquet'] = buffer.getvalue()
+        except ImportError:
+            pass
+        st.session_state.analysis_exports = exports
+        st.session_state.analysis_exports_key = key
+    return st.session_state.analysis_exports
+
+def display_analysis_export(data):
+    """Cho phép tải dữ liệu phân tích theo frame (.npz, hoặc Parquet nếu có pyarrow)"""
+    st.subheader("Xuất dữ liệu phân tích")
+    
+    exports = get_analysis_exports(data)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label="📥 Tải dữ liệu (.npz)",
+            data=exports['npz'],
+            file_name="analysis.npz",
+            mime="application/octet-stream"
+        )
+    with col2:
+        if exports['parquet'] is None:
+            st.caption("Cài pyarrow để xuất Parquet")
+        else:
+            st.download_button(
+                label="📥 Tải dữ liệu (.parquet)",
+                data=exports['parquet'],
+                file_name="analysis.parquet",
+                mime="application/octet-stream"
+            )
+
+def display_precision_report(report):
+    """Hiển thị so sánh kết quả giữa model độ chính xác thấp và fp32"""
+    st.subheader(f"So sánh {report['precision']} với fp32")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Tăng tốc", f"{report['speedup']:.2f}x")
+    with col2:
+        st.metric("Trùng trạng thái", f"{report['status_agreement']*100:.1f}%")
+    with col3:
+        st.metric("Lệch xác suất lớn nhất", f"{report['max_prob_diff']:.3f}")
+    with col4:
+        st.metric("Lệch xác suất trung bình", f"{report['mean_prob_diff']:.4f}")
+    
+    # Giảm số điểm như biểu đồ phân tích chính (giữ các đỉnh xác suất)
+    max_points = get_config('CHART_MAX_POINTS')
+    method = get_config('CHART_DECIMATION')
+    reference_times, reference_probs = decimate(report['timestamps'], report['reference_probs'], max_points, method)
+    candidate_times, candidate_probs = decimate(report['timestamps'], report['candidate_probs'], max_points, method)
+    
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=reference_times,
+        y=reference_probs,
+        mode='lines',
+        name='fp32',
+        line=dict(color='gray', width=2)
+    ))
+    fig.add_trace(go.Scatter(
+        x=candidate_times,
+        y=candidate_probs,
+        mode='lines',
+        name=report['precision'],
+        line=dict(color='red', width=2, dash='dot')
+    ))
+    fig.update_layout(
+        title="Xác suất bạo lực: fp32 và độ chính xác thấp",
+        xaxis_title="Thời gian (giây)",
+        yaxis_title="Xác suất",
+        showlegend=True
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    
+    if report['status_changes']:
+        st.write("**Trạng thái bị thay đổi (fp32 → độ chính xác thấp):**")
+        for change, count in report['status_changes'].items():
+            st.write(f"- {change}: {count} frame")
     else:
-        st.success("🎉 Không phát hiện sự kiện bạo lực nào trong video!")
\ No newline at end of file
+        st.success("Trạng thái phát hiện trùng khớp hoàn toàn với fp32")
@@ -0,0 +1,174 @@
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+import torch
+from utils.config import ANALYSIS_COLUMNS
+from utils.analysis_store import AnalysisStore
+from utils.model_registry import get_model_registry
+from utils.pipeline import PipelineCancelled
+from utils.video_analysis import analyze_video, probe_video, render_annotated_video
+
+# Đoạn ngắn hơn số frame này không đáng chia thêm (mỗi đoạn tốn thêm sequence_length frame khởi động)
+CHUNK_MIN_FRAMES = 256
+# Worker báo tiến độ sau mỗi số frame này
+CHUNK_PROGRESS_FRAMES = 25
+
+# Model, hàng đợi tiến độ và event dừng của mỗi process worker
+_worker_model = None
+_worker_device = None
+_worker_progress = None
+_worker_stop = None
+
+def init_chunk_worker(model_spec, torch_threads, progress_queue, stop_event):
+    """
+    Chạy một lần trong mỗi process worker: giới hạn thread torch và nạp model theo mô tả
+    của process chính (utils.config.get_model_spec) nên cho cùng kết quả với model ở đó
+    """
+    global _worker_model, _worker_device, _worker_progress, _worker_stop
+    torch.set_num_threads(torch_threads)
+    _worker_model, _ = get_model_registry().get(**model_spec)
+    _worker_device = _worker_model.device
+    _worker_progress = progress_queue
+    _worker_stop = stop_event
+
+def chunk_plan(total_frames, chunks, warmup, align=1):
+    """
+    Chia video thành tối đa chunks đoạn liên tiếp, trả về [(frame bắt đầu đọc, frame đầu,
+    frame cuối)] (đánh số từ 1). Mỗi đoạn đọc sớm hơn warmup frame để cửa sổ model và
+    chuyển động đầy giống như khi chạy tuần tự; đoạn cuối đọc tới hết video (None).
+    align: biên các đoạn và số frame đọc sớm là bội của align (kích thước batch suy luận)
+    để các frame được gom batch đúng như khi chạy tuần tự.
+    """
+    chunks = max(1, min(chunks, total_frames // CHUNK_MIN_FRAMES))
+    warmup = -(-warmup // align) * align
+    bounds = sorted({align * round(total_frames * i / chunks / align) for i in range(chunks)})
+    plan = []
+    for i, bound in enumerate(bounds):
+        start = bound + 1
+        end = bounds[i + 1] if i < len(bounds) - 1 else None
+        plan.append((max(1, start - warmup), start, end))
+    return plan
+
+def analyze_chunk(index, video_path, read_start, start, end, options):
+    """
+    Phân tích một đoạn trong process worker (không ghi video). Các dòng của phần
+    khởi động (trước frame start) bị bỏ. Trả về (thời điểm bắt đầu, số frame của đoạn, các cột).
+    """
+    fps = options['video_info']['fps']
+    start_time = time.time()
+    frames = 0
+
+    def on_progress(frame_count, total_frames, current_time):
+        nonlocal frames
+        if frame_count >= start:
+            frames += 1
+            if frames % CHUNK_PROGRESS_FRAMES == 0:
+                _worker_progress.put((index, frames))
+
+    chunk_data = AnalysisStore(ANALYSIS_COLUMNS)
+    try:
+        analyze_video(_worker_model, _worker_device, video_path, None, analysis_data=chunk_data,
+                      output_mode="signals", frame_ranges=[(read_start, end)],
+                      progress_callback=on_progress, stop_event=_worker_stop, **options)
+        # Cùng công thức thời gian với decode_frames
+        keep = chunk_data['timestamps'] >= (start - 0.5) / (fps if fps > 0 else 30)
+        return start_time, frames, {name: chunk_data.codes(name)[keep].copy() for name in chunk_data.columns}
+    finally:
+        chunk_data.close()
+
+def analyze_video_chunked(model_spec, video_path, output_path, workers=2, analysis_data=None,
+                          confidence_threshold=0.85, motion_threshold=2.0, sequence_length=16,
+                          motion_estimator="farneback", min_stride=1, max_stride=1, cascade_margin=None,
+                          output_mode="full", clip_pre_roll=2.0, clip_post_roll=2.0,
+                          video_info=None, progress_callback=None, stop_event=None, torch_threads=None, **options):
+    """
+    Phân tích một video dài song song trên nhiều process: video được chia thành các đoạn
+    liên tiếp (chunk_plan), mỗi worker tự nạp model theo model_spec và phân tích một đoạn.
+    Kết quả được ghép theo thứ tự vào analysis_data rồi video kết quả được vẽ một lần từ
+    dữ liệu đã ghép (render_annotated_video), nên giống hệt khi chạy tuần tự.
+    Chỉ hỗ trợ gọi model mọi frame: stride thích ứng / cascade phụ thuộc toàn bộ lịch sử
+    phía trước nên không khởi động lại được ở giữa video.
+    stop_event: set để dừng giữa chừng (các đoạn chưa chạy bị hủy, đoạn đang chạy dừng
+    ở frame kế tiếp), khi đó PipelineCancelled được raise như analyze_video.
+    Trả về thông tin video giống analyze_video.
+    """
+    if min_stride > 1 or max_stride > 1 or cascade_margin is not None:
+        raise ValueError("Xử lý song song theo đoạn chỉ hỗ trợ gọi model mọi frame (không stride / cascade)")
+
+    video_info = video_info or probe_video(video_path)
+    fps = video_info['fps']
+    total_frames = video_info['total_frames']
+    batch_size = max(1, int(options.get('batch_size', 8))) if options.get('inference_mode') == "batched" else 1
+    plan = chunk_plan(total_frames, workers, sequence_length, batch_size)
+    workers = min(workers, len(plan))
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    chunk_options = {
+        'confidence_threshold': confidence_threshold,
+        'motion_threshold': motion_threshold,
+        'sequence_length': sequence_length,
+        'motion_estimator': motion_estimator,
+        'video_info': video_info,
+        **options
+    }
+
+    results = [None] * len(plan)
+    chunk_frames = {}
+    # spawn: tránh fork một process đã khởi tạo thread pool của torch
+    context = multiprocessing.get_context("spawn")
+    progress_queue = context.Queue()
+    # stop_event của bên gọi (threading.Event) không chia sẻ được giữa các process
+    worker_stop = context.Event()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_chunk_worker,
+                             initargs=(model_spec, torch_threads, progress_queue, worker_stop)) as executor:
+        futures = {executor.submit(analyze_chunk, i, video_path, *chunk, chunk_options): i
+                   for i, chunk in enumerate(plan)}
+        pending = set(futures)
+        try:
+            while pending:
+                if stop_event is not None and stop_event.is_set():
+                    raise PipelineCancelled()
+                finished, pending = wait(pending, timeout=0.2)
+                for future in finished:
+                    results[futures[future]] = future.result()
+                    chunk_frames[futures[future]] = results[futures[future]][1]
+                while True:
+                    try:
+                        index, frames = progress_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if results[index] is None:
+                        chunk_frames[index] = frames
+                if progress_callback is not None:
+                    done = sum(chunk_frames.values())
+                    progress_callback(done, total_frames, done / fps if fps > 0 else done / 30)
+        except BaseException:
+            worker_stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    # Ghép theo thứ tự đoạn; frame_times tính từ lúc bắt đầu đoạn đầu tiên
+    stitched = analysis_data if analysis_data is not None else AnalysisStore(ANALYSIS_COLUMNS)
+    first_start = min(start_time for start_time, _, _ in results)
+    for start_time, _, columns in results:
+        columns['frame_times'] = columns['frame_times'] + (start_time - first_start)
+        stitched.extend(**columns)
+
+    output = {}
+    if output_mode != 'signals':
+        output = render_annotated_video(video_path, output_path, stitched, confidence_threshold,
+                                        motion_threshold, sequence_length, motion_estimator,
+                                        output_mode, clip_pre_roll, clip_post_roll)
+        output.pop('processed_frames')
+    if stitched is not analysis_data:
+        stitched.close()
+
+    return {
+        'fps': fps,
+        'width': video_info['width'],
+        'height': video_info['height'],
+        'total_frames': total_frames,
+        'processed_frames': sum(frames for _, frames, _ in results),
+        **output
+    }
@@ -0,0 +1,208 @@
+import time
+import cv2
+import numpy as np
+import torch
+from models.violence_detector import FrameFeatureBuffer, unwrap_model
+from utils.motion_analysis import MotionAnalyzer
+from utils.analysis_store import AnalysisStore, PROB_SOURCE_LABELS
+from utils.video_analysis import analyze_video, probe_video, read_video_info, seek_frame, detection_codes
+
+# 'dense': phân tích mọi frame, 'two_pass': quét thô trước rồi chỉ phân tích dày các đoạn nghi vấn
+SCAN_MODES = ['dense', 'two_pass']
+
+# Mỗi mẫu thô là một cửa sổ sequence_length frame liên tiếp (chỉ số frame đánh số từ 1)
+COARSE_SAMPLE_DTYPE = np.dtype([
+    ('start_index', np.int64),
+    ('end_index', np.int64),
+    ('time', np.float64),
+    ('violence_prob', np.float32),
+    ('motion', np.float32),
+    ('elapsed', np.float64)
+])
+
+def coarse_step(fps, interval, sequence_length):
+    """Khoảng cách (frame) giữa hai mẫu thô, không nhỏ hơn một cửa sổ"""
+    return max(sequence_length, int(round(interval * (fps if fps > 0 else 30))))
+
+def coarse_scan(model, device, video_path, sequence_length=16, image_size=64, interval=2.0,
+                motion_estimator="farneback", video_info=None, progress_callback=None, stop_event=None):
+    """
+    Lượt quét thô: cứ interval giây lấy một cửa sổ sequence_length frame liên tiếp để
+    tính xác suất bạo lực và điểm chuyển động trung bình; các frame ở giữa được bỏ qua
+    bằng grab() / CAP_PROP_POS_FRAMES (xem seek_frame) nên không phải chuyển đổi ảnh.
+    Trả về mảng có cấu trúc COARSE_SAMPLE_DTYPE.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Lỗi mở video: {video_path}")
+
+    video_info = video_info or read_video_info(cap)
+    fps = video_info['fps'] if video_info['fps'] > 0 else 30
+    total_frames = video_info['total_frames']
+    step = coarse_step(fps, interval, sequence_length)
+
+    detector = unwrap_model(model)
+    feature_buffer = FrameFeatureBuffer(sequence_length, detector.cnn_out_features, device)
+    motion_analyzer = MotionAnalyzer(motion_estimator)
+    start_time = time.time()
+    samples = []
+    position = 0
+    start = 1
+
+    try:
+        while total_frames <= 0 or start + sequence_length - 1 <= total_frames:
+            if stop_event is not None and stop_event.is_set():
+                break
+            position = seek_frame(cap, position, start - 1)
+            feature_buffer.reset()
+            motion_analyzer.reset()
+            motion_scores = []
+            for _ in range(sequence_length):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                position += 1
+                motion_scores.append(motion_analyzer.update(frame))
+                feature_buffer.push_input(cv2.resize(frame, (image_size, image_size)))
+            if feature_buffer.count < sequence_length:
+                break
+
+            with torch.no_grad():
+                window = feature_buffer.windows([feature_buffer.count], sequence_length, detector)
+                violence_prob = torch.softmax(detector.classify_sequence(window), dim=1)[0, 1].item()
+            # Frame đầu cửa sổ không có frame trước để so sánh chuyển động
+            avg_motion = float(np.mean(motion_scores[1:])) if len(motion_scores) > 1 else 0.0
+            end = start + sequence_length - 1
+            samples.append((start, end, end / fps, violence_prob, avg_motion, time.time() - start_time))
+
+            if progress_callback is not None:
+                progress_callback(end, total_frames, end / fps)
+            start += step
+    finally:
+        cap.release()
+
+    return np.array(samples, dtype=COARSE_SAMPLE_DTYPE)
+
+def candidate_ranges(samples, threshold, step, sequence_length, total_frames=0):
+    """
+    Các đoạn frame cần phân tích dày: quanh mỗi mẫu thô có xác suất >= threshold, mở rộng
+    step frame về hai phía (sự kiện có thể nằm giữa hai mẫu) và thêm sequence_length frame
+    phía trước để cửa sổ kịp đầy. Các đoạn chồng hoặc liền nhau được gộp lại.
+    """
+    ranges = []
+    for sample in samples[samples['violence_prob'] >= threshold]:
+        start = max(1, int(sample['start_index']) - step - sequence_length)
+        end = int(sample['end_index']) + step
+        if total_frames > 0:
+            end = min(end, total_frames)
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+def skipped_spans(ranges, total_frames, fps):
+    """Các khoảng thời gian (giây) không được phân tích dày, phần bù của ranges trong video"""
+    fps = fps if fps > 0 else 30
+    spans = []
+    previous_end = 0
+    for start, end in ranges:
+        if start > previous_end + 1:
+            spans.append(((previous_end + 1) / fps, (start - 1) / fps))
+        previous_end = end
+    if total_frames > previous_end:
+        spans.append(((previous_end + 1) / fps, total_frames / fps))
+    return spans
+
+def merge_two_pass(analysis_data, dense_data, samples, ranges, confidence_threshold, motion_threshold,
+                   dense_offset=0.0):
+    """
+    Ghi vào analysis_data các dòng của lượt dày cùng các mẫu thô nằm ngoài mọi đoạn dày
+    (prob_source 'coarse', đánh dấu phần bị bỏ qua), sắp theo thời gian.
+    dense_offset: thời gian của lượt thô, cộng vào frame_times của lượt dày.
+    """
+    ends = samples['end_index']
+    outside = np.ones(len(samples), dtype=bool)
+    for start, end in ranges:
+        outside &= (ends < start) | (ends > end)
+    coarse = samples[outside]
+
+    coarse_columns = {name: np.zeros(len(coarse), dtype=dtype) for name, dtype in analysis_data.columns.items()}
+    coarse_columns.update(
+        timestamps=coarse['time'],
+        violence_probs=coarse['violence_prob'],
+        motion_scores=coarse['motion'],
+        detection_status=detection_codes(coarse['violence_prob'], coarse['motion'],
+                                         confidence_threshold, motion_threshold),
+        frame_times=coarse['elapsed'],
+        prob_source=np.full(len(coarse), PROB_SOURCE_LABELS.index('coarse'), dtype=np.int8)
+    )
+    dense_columns = {name: dense_data.codes(name) for name in analysis_data.columns}
+    dense_columns['frame_times'] = dense_columns['frame_times'] + dense_offset
+
+    order = np.argsort(np.concatenate([dense_columns['timestamps'], coarse_columns['timestamps']]), kind='stable')
+    analysis_data.extend(**{
+        name: np.concatenate([dense_columns[name], coarse_columns[name]])[order]
+        for name in analysis_data.columns
+    })
+
+def analyze_video_two_pass(model, device, video_path, output_path, analysis_data=None,
+                           coarse_interval=2.0, coarse_threshold=0.5,
+                           confidence_threshold=0.85, motion_threshold=2.0,
+                           sequence_length=16, image_size=64, motion_estimator="farneback",
+                           output_mode="clips", video_info=None, progress_callback=None,
+                           stop_event=None, **options):
+    """
+    Phân tích hai lượt cho video dài: lượt thô (coarse_scan) tìm các đoạn có xác suất
+    >= coarse_threshold (ngưỡng lỏng hơn ngưỡng tin cậy), lượt dày (analyze_video với
+    frame_ranges) chỉ chạy trên các đoạn đó. options được truyền thẳng cho analyze_video.
+    Không hỗ trợ output_mode 'full' vì phần lớn video không được giải mã.
+    Trả về thông tin của analyze_video kèm số mẫu thô, 'dense_ranges' và 'skipped_spans' (giây).
+    """
+    if output_mode == 'full':
+        raise ValueError("Quét hai lượt không ghi được toàn bộ video, hãy chọn chế độ 'clips' hoặc 'signals'")
+
+    video_info = video_info or probe_video(video_path)
+    fps = video_info['fps'] if video_info['fps'] > 0 else 30
+    total_frames = video_info['total_frames']
+
+    start_time = time.time()
+    samples = coarse_scan(model, device, video_path, sequence_length, image_size, coarse_interval,
+                          motion_estimator, video_info, progress_callback, stop_event)
+    coarse_seconds = time.time() - start_time
+    ranges = candidate_ranges(samples, coarse_threshold, coarse_step(fps, coarse_interval, sequence_length),
+                              sequence_length, total_frames)
+
+    dense_data = None
+    if analysis_data is not None:
+        dense_data = AnalysisStore(analysis_data.columns, spill_limit=analysis_data.spill_limit,
+                                   spill_dir=analysis_data.spill_dir)
+    try:
+        info = analyze_video(
+            model, device, video_path, output_path,
+            confidence_threshold=confidence_threshold,
+            sequence_length=sequence_length,
+            image_size=image_size,
+            motion_threshold=motion_threshold,
+            analysis_data=dense_data,
+            motion_estimator=motion_estimator,
+            output_mode=output_mode,
+            video_info=video_info,
+            progress_callback=progress_callback,
+            stop_event=stop_event,
+            frame_ranges=ranges,
+            **options
+        )
+        if analysis_data is not None:
+            merge_two_pass(analysis_data, dense_data, samples, ranges,
+                           confidence_threshold, motion_threshold, coarse_seconds)
+    finally:
+        if dense_data is not None:
+            dense_data.close()
+
+    return {
+        **info,
+        'coarse_samples': len(samples),
+        'dense_ranges': [(start / fps, end / fps) for start, end in ranges],
+        'skipped_spans': skipped_spans(ranges, total_frames, fps)
+    }
@@ -1,8 +1,10 @@
 import streamlit as st
 import torch
-import torch.nn as nn
 import os
-from models.violence_detector import ViolenceDetector
+import numpy as np
+from models.backends import export_dir_for
+from utils.analysis_store import AnalysisStore
+from utils.model_registry import get_model_registry
 
 # Default configuration
 DEFAULT_CONFIG = {
@@ -11,19 +13,70 @@ DEFAULT_CONFIG = {
     'SEQUENCE_LENGTH': 16,
     'IMAGE_SIZE': 64,
     'MOTION_THRESHOLD': 2.0,
-    'CHART_WINDOW_SIZE': 200
+    'EVENT_MIN_DURATION': 0.5,
+    'EVENT_MERGE_GAP': 1.0,
+    'CHART_WINDOW_SIZE': 200,
+    'CHART_UPDATE_INTERVAL': 1.0,
+    'CHART_MAX_POINTS': 2000,
+    'CHART_DECIMATION': 'minmax',
+    'MIN_INFERENCE_STRIDE': 1,
+    'MAX_INFERENCE_STRIDE': 1,
+    'CASCADE_MODE': False,
+    'CASCADE_HYSTERESIS': 0.5,
+    'INFERENCE_MODE': 'per_frame',
+    'INFERENCE_BATCH_SIZE': 8,
+    'MOTION_ESTIMATOR': 'farneback',
+    'SCAN_MODE': 'dense',
+    'COARSE_INTERVAL': 2.0,
+    'COARSE_THRESHOLD': 0.5,
+    'CHUNK_WORKERS': 1,
+    # Số video được phân tích đồng thời trên server (dùng chung cho mọi phiên)
+    'MAX_CONCURRENT_JOBS': 1,
+    # Tổng dung lượng các model giữ trong bộ nhớ (registry dùng chung cho mọi phiên)
+    'MODEL_MEMORY_BUDGET_MB': 1024,
+    'INFERENCE_BACKEND': 'eager',
+    'MODEL_PRECISION': 'fp32',
+    'CALIBRATION_DIR': "calibration",
+    'PRECISION_REPORT': False,
+    'PROFILE_MODEL': False,
+    'OUTPUT_MODE': 'full',
+    'CLIP_PRE_ROLL': 2.0,
+    'CLIP_POST_ROLL': 2.0,
+    'RESULT_CACHE': True,
+    'RESULT_CACHE_DIR': "cache/results",
+    'RESULT_CACHE_MAX_MB': 2048
 }
 
+# Các giai đoạn xử lý được đo thời gian cho từng frame (lưu trong analysis_data['stage_<tên>'], ms)
+TIMING_STAGES = ['decode', 'motion', 'preprocess', 'inference', 'overlay', 'encode']
+
+# Kiểu dữ liệu của từng cột (trạng thái và nguồn xác suất lưu dạng mã int8)
+ANALYSIS_COLUMNS = {
+    'timestamps': np.float64,
+    'violence_probs': np.float32,
+    'motion_scores': np.float32,
+    'detection_status': np.int8,
+    'frame_times': np.float64,
+    'prob_source': np.int8,
+    # Độ trễ của frame (ms): từ lúc giải mã xong tới lúc ghi xong đầu ra
+    'frame_latency': np.float32,
+    **{f'stage_{stage}': np.float32 for stage in TIMING_STAGES}
+}
+
+# Số dòng tối đa giữ trong RAM trước khi chuyển dữ liệu phân tích sang file trên đĩa
+ANALYSIS_SPILL_ROWS = 1_000_000
+
+def create_analysis_data(max_history=None, spill_limit=ANALYSIS_SPILL_ROWS):
+    """
+    Tạo kho dữ liệu phân tích rỗng (lưu theo cột, xem utils.analysis_store).
+    max_history: chỉ giữ N frame gần nhất (dùng cho chế độ trực tiếp)
+    """
+    return AnalysisStore(ANALYSIS_COLUMNS, spill_limit=spill_limit, max_history=max_history)
+
 def initialize_session_state():
     """Khởi tạo session state"""
     if 'analysis_data' not in st.session_state:
-        st.session_state.analysis_data = {
-            'timestamps': [],
-            'violence_probs': [],
-            'motion_scores': [],
-            'detection_status': [],
-            'frame_times': []
-        }
+        st.session_state.analysis_data = create_analysis_data()
     
     if 'model_loaded' not in st.session_state:
         st.session_state.model_loaded = False
@@ -35,42 +88,73 @@ def initialize_session_state():
         if key not in st.session_state:
             st.session_state[key] = value
 
-@st.cache_resource
 def initialize_model():
-    """Khởi tạo model với cache"""
-    if not st.session_state.model_loaded:
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        st.info(f"🔄 Đang khởi tạo model trên thiết bị: {device}")
-        
-        model = ViolenceDetector()
-        
-        # Multi-GPU support
-        if torch.cuda.device_count() > 1:
-            model = nn.DataParallel(model)
-        
-        model.to(device)
-        
-        # Load weights
-        weights_path = st.session_state['MODEL_WEIGHTS_PATH']
-        if os.path.exists(weights_path):
-            try:
-                state = torch.load(weights_path, map_location=device)
-                # Handle DataParallel prefix
-                if list(state.keys())[0].startswith('module.') and not isinstance(model, nn.DataParallel):
-                    new_state = {k.replace("module.", ""): v for k, v in state.items()}
-                    model.load_state_dict(new_state)
-                else:
-                    model.load_state_dict(state)
-                
-                model.eval()
-                st.session_state.model_loaded = True
-                st.session_state.model = model
-                st.session_state.device = device
-                st.success("✅ Model đã được tải thành công!")
-            except Exception as e:
-                st.error(f"❌ Lỗi khi tải model: {e}")
-        else:
-            st.error(f"⚠️ Không tìm thấy file weights: {weights_path}")
+    """
+    Lấy model theo cấu hình hiện tại (weights, backend, độ chính xác) từ registry dùng chung
+    của process (utils.model_registry): mỗi model chỉ được nạp một lần cho mọi phiên, và được
+    nạp lại khi đổi đường dẫn / nội dung weights, backend hay độ chính xác.
+    """
+    st.session_state.model_loaded = False
+    st.session_state.model = None
+    st.session_state.device = None
+    
+    weights_path = get_config('MODEL_WEIGHTS_PATH')
+    if not os.path.exists(weights_path):
+        st.error(f"⚠️ Không tìm thấy file weights: {weights_path}")
+        return
+    spec = get_model_spec()
+    if spec['precision'] == 'static_int8' and not spec['calibration_videos']:
+        st.error(f"⚠️ Không có clip hiệu chỉnh trong thư mục: {get_config('CALIBRATION_DIR')}")
+        return
+    
+    try:
+        with st.spinner(f"🔄 Đang tải model ({spec['backend']}, {spec['precision']})..."):
+            registry = get_model_registry(get_config('MODEL_MEMORY_BUDGET_MB') * 1024 * 1024)
+            model, report = registry.get(**spec)
+    except Exception as e:
+        st.error(f"❌ Lỗi khi tải model: {e}")
+        return
+    
+    st.session_state.model_loaded = True
+    st.session_state.model = model
+    st.session_state.device = model.device
+    st.session_state.model_precision = spec['precision']
+    
+    if not report['cached'] and report['parity'] is not None:
+        st.info(f"🔧 Backend {spec['backend']}: độ lệch xác suất so với eager {report['parity']:.2e}")
+    st.sidebar.caption(
+        f"Model {spec['backend']} / {spec['precision']} trên {model.device}: "
+        f"{'dùng chung, ' if report['cached'] else ''}nạp {report['load_seconds']:.2f}s, "
+        f"khởi động {report['warmup_seconds'] * 1000:.0f} ms, {report['nbytes'] / 1024 ** 2:.1f} MB"
+    )
+
+def calibration_videos(calibration_dir):
+    """Danh sách clip hiệu chỉnh (static_int8) trong thư mục"""
+    if not os.path.isdir(calibration_dir):
+        return []
+    return [os.path.join(calibration_dir, name) for name in sorted(os.listdir(calibration_dir))
+            if name.lower().endswith(('.mp4', '.avi', '.mov', '.mkv'))]
+
+def get_model_spec():
+    """
+    Mô tả model theo cấu hình hiện tại (weights, thiết bị, backend, độ chính xác), dùng làm
+    tham số cho ModelRegistry.get trong process chính, worker của dịch vụ phân tích và
+    các process worker (xem utils.chunked_analysis.init_chunk_worker)
+    """
+    precision = get_config('MODEL_PRECISION')
+    weights_path = get_config('MODEL_WEIGHTS_PATH')
+    return {
+        'weights_path': weights_path,
+        # Model int8 / bf16 chạy trên CPU
+        'device_name': "cuda" if torch.cuda.is_available() and precision == 'fp32' else "cpu",
+        # Model lượng tử hóa chỉ chạy được bằng PyTorch eager
+        'backend': get_config('INFERENCE_BACKEND') if precision == 'fp32' else 'eager',
+        'precision': precision,
+        'export_dir': export_dir_for(weights_path),
+        'image_size': get_config('IMAGE_SIZE'),
+        'sequence_length': get_config('SEQUENCE_LENGTH'),
+        'calibration_videos': calibration_videos(get_config('CALIBRATION_DIR')) if precision == 'static_int8' else None
+    }
 
 def get_config(key):
     """Lấy giá trị cấu hình từ session state"""
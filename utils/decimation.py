@@ -0,0 +1,79 @@
+import numpy as np
+
+DECIMATION_METHODS = ['minmax', 'lttb']
+
+def minmax_indices(y, max_points):
+    """
+    Chỉ số các điểm giữ lại khi giảm chuỗi y xuống khoảng max_points điểm:
+    mỗi bucket giữ điểm nhỏ nhất và lớn nhất nên không mất các đỉnh (spike)
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = (max_points - 2) // 2
+    if buckets < 1:
+        # Không đủ chỗ cho cặp nhỏ nhất / lớn nhất: giữ hai đầu và đỉnh lớn nhất
+        peak = int(np.argmax(np.nan_to_num(np.asarray(y, dtype=np.float64), nan=-np.inf)))
+        return np.unique([0, peak, n - 1] if max_points >= 3 else [0, n - 1][:max(1, max_points)])
+    bucket_size = -(-n // buckets)
+    # Đệm bằng giá trị cuối để reshape thành (buckets, bucket_size); argmin/argmax
+    # trả về vị trí xuất hiện đầu tiên nên không chọn phần đệm thay cho điểm thật
+    padded = np.pad(np.asarray(y, dtype=np.float64), (0, buckets * bucket_size - n),
+                    mode='edge').reshape(buckets, bucket_size)
+    # Giá trị NaN (frame không có xác suất) không được chọn làm điểm nhỏ nhất / lớn nhất
+    missing = np.isnan(padded)
+    offsets = np.arange(buckets) * bucket_size
+    indices = np.concatenate([[0, n - 1], offsets + np.where(missing, np.inf, padded).argmin(axis=1),
+                              offsets + np.where(missing, -np.inf, padded).argmax(axis=1)])
+    return np.unique(np.minimum(indices, n - 1))
+
+def lttb_indices(x, y, max_points):
+    """Chỉ số các điểm giữ lại theo Largest-Triangle-Three-Buckets (giữ hình dạng chuỗi)"""
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    # Diện tích tam giác tính với NaN thay bằng 0 (chỉ để chọn điểm)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        # Điểm trung bình của bucket kế tiếp là đỉnh thứ ba của tam giác
+        next_start, next_end = end, max(edges[min(bucket + 2, max_points - 2)], end + 1)
+        next_x = x[next_start:min(next_end, n)].mean()
+        next_y = y[next_start:min(next_end, n)].mean()
+        areas = np.abs((x[selected] - next_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(areas.argmax())
+        indices[bucket + 1] = selected
+    return indices
+
+def decimate(x, y, max_points=2000, method='minmax'):
+    """Giảm số điểm của chuỗi (x, y) để vẽ biểu đồ, trả về (x, y) đã giảm"""
+    if method == 'lttb':
+        indices = lttb_indices(x, y, max_points)
+    else:
+        indices = minmax_indices(y, max_points)
+    return np.asarray(x)[indices], np.asarray(y)[indices]
+
+def rolling_mean_on_grid(y, window_size, max_points=2000):
+    """
+    Trung bình động (cửa sổ window_size frame) chỉ tại khoảng max_points vị trí cách đều,
+    tính bằng tổng tích lũy nên không cần rolling trên toàn bộ chuỗi. Giá trị NaN bị bỏ qua
+    (trung bình trên các giá trị có trong cửa sổ, NaN nếu cả cửa sổ đều thiếu).
+    Trả về (chỉ số các vị trí, giá trị trung bình).
+    """
+    n = len(y)
+    if n < window_size or window_size < 1:
+        return np.arange(0), np.zeros(0)
+    y = np.asarray(y, dtype=np.float64)
+    present = ~np.isnan(y)
+    cumsum = np.concatenate([[0.0], np.cumsum(np.where(present, y, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(present)])
+    grid = np.unique(np.linspace(window_size - 1, n - 1, min(max_points, n - window_size + 1)).astype(np.int64))
+    window_counts = counts[grid + 1] - counts[grid + 1 - window_size]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return grid, (cumsum[grid + 1] - cumsum[grid + 1 - window_size]) / window_counts
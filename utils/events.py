@@ -0,0 +1,95 @@
+import json
+import numpy as np
+from utils.analysis_store import STATUS_LABELS
+
+# Chỉ mục sự kiện: mỗi dòng là một đoạn bạo lực liên tục (sau khi gộp / lọc)
+EVENT_DTYPE = np.dtype([
+    ('start', np.float64),
+    ('end', np.float64),
+    ('peak_prob', np.float32),
+    ('mean_motion', np.float32),
+    ('start_index', np.int64),
+    ('end_index', np.int64)
+])
+
+def extract_events(timestamps, status_codes, violence_probs, motion_scores,
+                   min_duration=0.0, merge_gap=0.0, status="VIOLENCE"):
+    """
+    Tìm các đoạn liên tục có trạng thái status bằng run-length encoding (NumPy, không vòng lặp):
+    - merge_gap: gộp hai đoạn cách nhau không quá merge_gap giây (chống nhấp nháy)
+    - min_duration: bỏ các đoạn ngắn hơn min_duration giây sau khi gộp
+    Trả về mảng có cấu trúc EVENT_DTYPE; end / end_index là frame cuối của đoạn.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    mask = np.asarray(status_codes) == STATUS_LABELS.index(status)
+    if not mask.any():
+        return np.zeros(0, dtype=EVENT_DTYPE)
+
+    edges = np.diff(np.concatenate([[False], mask, [False]]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+
+    # Gộp các đoạn có khoảng trống ngắn: mỗi khoảng trống lớn hơn merge_gap mở một nhóm mới
+    new_group = np.concatenate([[True], timestamps[starts[1:]] - timestamps[ends[:-1]] > merge_gap])
+    starts = starts[new_group]
+    ends = ends[np.concatenate([new_group[1:], [True]])]
+
+    keep = timestamps[ends] - timestamps[starts] >= min_duration
+    starts, ends = starts[keep], ends[keep]
+
+    events = np.zeros(len(starts), dtype=EVENT_DTYPE)
+    if len(starts) == 0:
+        return events
+    events['start'] = timestamps[starts]
+    events['end'] = timestamps[ends]
+    events['start_index'] = starts
+    events['end_index'] = ends
+    events['peak_prob'] = _segment_max(violence_probs, starts, ends)
+    motion_cumsum = np.concatenate([[0.0], np.cumsum(motion_scores, dtype=np.float64)])
+    events['mean_motion'] = (motion_cumsum[ends + 1] - motion_cumsum[starts]) / (ends - starts + 1)
+    return events
+
+def _segment_max(values, starts, ends):
+    """Giá trị lớn nhất trên từng đoạn [start, end] (các đoạn không chồng nhau, tăng dần)"""
+    values = np.asarray(values)
+    # reduceat trên các biên [start_0, end_0 + 1, start_1, end_1 + 1, ...], lấy kết quả ở vị trí chẵn
+    # fmax bỏ qua NaN: khoảng trống được gộp có thể chứa frame bị gate (không chấm điểm)
+    bounds = np.column_stack([starts, ends + 1]).ravel()
+    if bounds[-1] >= len(values):
+        bounds = bounds[:-1]
+    return np.fmax.reduceat(values, bounds)[::2]
+
+def extract_analysis_events(analysis_data, min_duration=0.0, merge_gap=0.0):
+    """extract_events trên analysis_data (đọc trực tiếp các cột của kho dữ liệu)"""
+    if len(analysis_data) == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    return extract_events(analysis_data['timestamps'], analysis_data.codes('detection_status'),
+                          analysis_data['violence_probs'], analysis_data['motion_scores'],
+                          min_duration, merge_gap)
+
+def events_to_records(events):
+    """Danh sách dict (JSON được) của chỉ mục sự kiện"""
+    return [
+        {
+            'start': float(e['start']),
+            'end': float(e['end']),
+            'duration': float(e['end'] - e['start']),
+            'peak_prob': float(e['peak_prob']),
+            'mean_motion': float(e['mean_motion']),
+            'start_index': int(e['start_index']),
+            'end_index': int(e['end_index'])
+        }
+        for e in events
+    ]
+
+def events_to_json(events):
+    return json.dumps(events_to_records(events), ensure_ascii=False, indent=2)
+
+def events_to_csv(events):
+    """CSV của chỉ mục sự kiện (một dòng mỗi sự kiện)"""
+    columns = ['start', 'end', 'duration', 'peak_prob', 'mean_motion', 'start_index', 'end_index']
+    lines = [",".join(columns)]
+    for record in events_to_records(events):
+        lines.append(",".join(f"{record[c]:.3f}" if isinstance(record[c], float) else str(record[c])
+                              for c in columns))
+    return "\n".join(lines) + "\n"
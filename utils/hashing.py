@@ -0,0 +1,17 @@
+import hashlib
+import os
+
+# Hash của các file đã đọc (weights, video), tránh đọc lại file khi kích thước và thời điểm sửa đổi không đổi
+_file_digests = {}
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 của nội dung file, đọc theo từng khối"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        _file_digests[memo_key] = digest.hexdigest()
+    return _file_digests[memo_key]
@@ -0,0 +1,51 @@
+class InferenceScheduler:
+    """
+    Quyết định khi nào cần gọi model dựa trên mức chuyển động trung bình.
+    Chuyển động thấp -> gọi model mỗi max_stride frame,
+    chuyển động vượt ngưỡng -> gọi model mỗi min_stride frame.
+    Ở chế độ cascade (gate_margin khác None), model không chạy khi chuyển động
+    thấp hơn ngưỡng quá gate_margin vì khi đó kết quả không thể là VIOLENCE.
+    """
+    def __init__(self, motion_threshold, min_stride=1, max_stride=1, gate_margin=None):
+        self.motion_threshold = motion_threshold
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, int(max_stride))
+        self.gate_margin = gate_margin
+        self.frames_since_inference = 0
+        self.has_result = False
+
+    def reset(self):
+        """Bắt đầu lại từ đầu (khi luồng frame bị ngắt quãng, cửa sổ cũ không còn giá trị)"""
+        self.frames_since_inference = 0
+        self.has_result = False
+
+    def stride_for(self, avg_motion):
+        """Tính stride nội suy tuyến tính giữa max_stride (đứng yên) và min_stride (ngưỡng)"""
+        if avg_motion >= self.motion_threshold or self.motion_threshold <= 0:
+            return self.min_stride
+        ratio = avg_motion / self.motion_threshold
+        stride = self.max_stride - (self.max_stride - self.min_stride) * ratio
+        return max(self.min_stride, int(round(stride)))
+
+    def is_gated(self, avg_motion):
+        """Cascade: chuyển động nằm dưới vùng trễ quanh ngưỡng thì không cần chạy model"""
+        if self.gate_margin is None:
+            return False
+        return avg_motion <= self.motion_threshold - self.gate_margin
+
+    def next_action(self, avg_motion):
+        """
+        Gọi mỗi frame khi cửa sổ đã đầy. Trả về nguồn xác suất cho frame này:
+        'model' (chạy model), 'carried' (giữ kết quả trước) hoặc 'gated' (bị cascade chặn)
+        """
+        if self.is_gated(avg_motion):
+            # Kết quả cũ không còn giá trị khi cổng mở lại
+            self.has_result = False
+            return "gated"
+
+        self.frames_since_inference += 1
+        if not self.has_result or self.frames_since_inference >= self.stride_for(avg_motion):
+            self.frames_since_inference = 0
+            self.has_result = True
+            return "model"
+        return "carried"
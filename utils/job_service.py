@@ -0,0 +1,239 @@
+import queue
+import threading
+import time
+import uuid
+from utils.config import create_analysis_data
+from utils.pipeline import PipelineCancelled
+from utils.video_analysis import analyze_video
+from utils.coarse_scan import analyze_video_two_pass
+from utils.chunked_analysis import analyze_video_chunked
+from utils.precision_report import run_reference_analysis, compare_precision_results
+from utils.result_cache import ResultCache
+from utils.model_registry import get_model_registry
+
+# queued → running → done / failed / cancelled
+JOB_STATUSES = ['queued', 'running', 'done', 'failed', 'cancelled']
+JOB_FINISHED = ('done', 'failed', 'cancelled')
+
+def run_analysis(model, device, video_path, output_path, scan_mode="dense", chunk_workers=1,
+                 model_spec=None, stop_event=None, **options):
+    """
+    Chạy phân tích một video theo chế độ đã chọn, không phụ thuộc giao diện:
+    chunk_workers > 1: chia đoạn xử lý song song, mỗi process tự nạp model theo model_spec
+    (analyze_video_chunked); scan_mode 'two_pass': quét hai lượt (analyze_video_two_pass);
+    còn lại quét dày (analyze_video). stop_event: set để dừng giữa chừng ở mọi chế độ.
+    Trả về thông tin video của hàm phân tích tương ứng.
+    """
+    if chunk_workers > 1:
+        return analyze_video_chunked(model_spec, video_path, output_path, workers=chunk_workers,
+                                     stop_event=stop_event, **options)
+    if scan_mode == "two_pass":
+        return analyze_video_two_pass(model, device, video_path, output_path, stop_event=stop_event, **options)
+    return analyze_video(model, device, video_path, output_path, stop_event=stop_event, **options)
+
+def tail_preview(analysis_data, window_size=200):
+    """Bản sao window_size frame gần nhất (thời gian, xác suất, chuyển động) cho biểu đồ real-time"""
+    return {name: analysis_data.tail(name, window_size).copy()
+            for name in ('timestamps', 'violence_probs', 'motion_scores')}
+
+class AnalysisJobService:
+    """
+    Dịch vụ phân tích cục bộ, dùng chung cho mọi phiên Streamlit của server.
+    Video được đưa vào hàng đợi (submit) và được max_workers thread worker xử lý lần lượt,
+    nên số phân tích chạy đồng thời bị giới hạn và công việc không mất khi đóng tab.
+    Worker lấy model theo model_spec từ registry của process (xem utils.config.get_model_spec).
+
+    Mô tả công việc (spec) gồm:
+    - video_path, output_path, model_spec
+    - options: tham số cho run_analysis (scan_mode, chunk_workers, output_mode, ...)
+    - preview_window / preview_interval: số frame và chu kỳ (giây) chụp dữ liệu cho biểu đồ real-time
+    - precision_report: chạy lại với fp32 eager để so sánh (compare_precision_results)
+    - cache: {'root', 'max_bytes', 'key', 'metadata'} để lưu kết quả vào ResultCache
+    """
+
+    def __init__(self, max_workers=1, history=20):
+        self.max_workers = max(1, int(max_workers))
+        # Số công việc đã kết thúc được giữ lại để phiên khác / tab mở lại lấy kết quả
+        self.history = history
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def submit(self, spec, key=None):
+        """
+        Đưa một video vào hàng đợi, trả về id công việc. key: nếu đã có công việc cùng key
+        đang chờ / đang chạy / đã xong thì trả về công việc đó thay vì chạy lại.
+        """
+        with self._lock:
+            if key is not None:
+                for job in self._jobs.values():
+                    if job['key'] == key and job['status'] in ('queued', 'running', 'done'):
+                        return job['id']
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                'id': job_id,
+                'key': key,
+                'spec': spec,
+                'status': 'queued',
+                'progress': {'frames': 0, 'total_frames': 0, 'time': 0.0},
+                'preview': None,
+                'error': None,
+                'result': None,
+                'submitted': time.time(),
+                'started': None,
+                'finished': None,
+                'stop_event': threading.Event()
+            }
+            self._prune()
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name=f"analysis-worker-{len(self._workers)}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+        self._queue.put(job_id)
+        return job_id
+
+    def status(self, job_id):
+        """
+        Trạng thái công việc: status, progress (frame đã xử lý / tổng, thời điểm trong video),
+        queue_position (1 = chạy tiếp theo, 0 nếu không còn chờ), preview, error.
+        Trả về None nếu không có công việc này (hoặc đã bị xóa khỏi lịch sử).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            queued = [other['id'] for other in self._jobs.values() if other['status'] == 'queued']
+            return {
+                'id': job_id,
+                'status': job['status'],
+                'progress': dict(job['progress']),
+                'queue_position': queued.index(job_id) + 1 if job_id in queued else 0,
+                'preview': job['preview'],
+                'error': job['error'],
+                'submitted': job['submitted'],
+                'started': job['started'],
+                'finished': job['finished']
+            }
+
+    def result(self, job_id):
+        """Kết quả của công việc đã xong: {'info', 'analysis_data', 'precision_report'}, ngược lại None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job['result'] if job is not None and job['status'] == 'done' else None
+
+    def cancel(self, job_id):
+        """Hủy công việc đang chờ, hoặc yêu cầu dừng công việc đang chạy"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in JOB_FINISHED:
+                return
+            job['stop_event'].set()
+            if job['status'] == 'queued':
+                job['status'] = 'cancelled'
+                job['finished'] = time.time()
+
+    def active_video_paths(self):
+        """Đường dẫn video của các công việc đang chờ / đang chạy (còn đọc file video)"""
+        with self._lock:
+            return {job['spec']['video_path'] for job in self._jobs.values() if job['status'] not in JOB_FINISHED}
+
+    def discard(self, job_id):
+        """Xóa công việc đã kết thúc khỏi lịch sử (công việc chưa kết thúc được giữ nguyên)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] in JOB_FINISHED:
+                del self._jobs[job_id]
+
+    def jobs(self):
+        """Trạng thái mọi công việc còn trong lịch sử, theo thứ tự gửi"""
+        with self._lock:
+            job_ids = list(self._jobs)
+        return [status for status in map(self.status, job_ids) if status is not None]
+
+    def model_for(self, model_spec):
+        """Model (backend) cho model_spec, dùng chung với các phiên và worker khác qua registry"""
+        model, _ = get_model_registry().get(**model_spec)
+        return model
+
+    def _prune(self):
+        """Chỉ giữ history công việc đã kết thúc gần nhất (gọi khi đang giữ khóa)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in JOB_FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        """Vòng lặp của một thread worker: lấy công việc từ hàng đợi và chạy"""
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job['status'] != 'queued':
+                    continue
+                job['status'] = 'running'
+                job['started'] = time.time()
+            try:
+                result = self._run(job)
+            except PipelineCancelled:
+                status, result, error = 'cancelled', None, None
+            except Exception as e:
+                status, result, error = 'failed', None, str(e)
+            else:
+                status, error = ('cancelled' if job['stop_event'].is_set() else 'done'), None
+            with self._lock:
+                job['status'] = status
+                job['result'] = result
+                job['error'] = error
+                job['finished'] = time.time()
+
+    def _run(self, job):
+        """Phân tích video của một công việc, trả về kết quả"""
+        spec = job['spec']
+        options = spec.get('options', {})
+        model_spec = spec['model_spec']
+        model = None
+        if options.get('chunk_workers', 1) <= 1:
+            model = self.model_for(model_spec)
+
+        analysis_data = create_analysis_data()
+        preview_window = spec.get('preview_window', 200)
+        preview_interval = spec.get('preview_interval', 1.0)
+        last_preview = 0.0
+
+        def on_progress(frame_count, total_frames, current_time):
+            nonlocal last_preview
+            job['progress'] = {'frames': frame_count, 'total_frames': total_frames, 'time': current_time}
+            # Dữ liệu cho biểu đồ được chụp trong thread worker, giao diện không đọc kho đang ghi
+            now = time.monotonic()
+            if now - last_preview >= preview_interval and len(analysis_data) > 10:
+                last_preview = now
+                job['preview'] = tail_preview(analysis_data, preview_window)
+
+        info = run_analysis(model, model.device if model is not None else None,
+                            spec['video_path'], spec['output_path'],
+                            model_spec=model_spec, stop_event=job['stop_event'],
+                            analysis_data=analysis_data, progress_callback=on_progress, **options)
+
+        cache = spec.get('cache')
+        if cache is not None and not job['stop_event'].is_set():
+            ResultCache(cache['root'], cache['max_bytes']).put(
+                cache['key'], spec['output_path'], analysis_data,
+                metadata={**cache['metadata'], 'video': info})
+
+        # So sánh với fp32 khi dùng model độ chính xác thấp
+        report = None
+        if spec.get('precision_report') and model_spec['precision'] != 'fp32' and not job['stop_event'].is_set():
+            reference = self.model_for({**model_spec, 'backend': 'eager', 'precision': 'fp32',
+                                        'calibration_videos': None})
+            reference_options = {name: value for name, value in options.items()
+                                 if name not in ('scan_mode', 'chunk_workers', 'output_mode',
+                                                 'clip_pre_roll', 'clip_post_roll', 'profile_path')}
+            reference_data = run_reference_analysis(reference, reference.device, spec['video_path'],
+                                                    stop_event=job['stop_event'], **reference_options)
+            # Bị hủy ngay khi lượt tham chiếu vừa xong: không ghi báo cáo
+            if not job['stop_event'].is_set():
+                report = compare_precision_results(reference_data, analysis_data)
+            if report is not None:
+                report['precision'] = model_spec['precision']
+
+        return {'info': info, 'analysis_data': analysis_data, 'precision_report': report}
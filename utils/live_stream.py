@@ -0,0 +1,173 @@
+import cv2
+import os
+import threading
+import time
+from collections import deque
+from utils.config import create_analysis_data
+from utils.inference_scheduler import InferenceScheduler
+from utils.motion_analysis import MotionAnalyzer
+from utils.video_analysis import analyze_frames, infer_frames, decide_detection, append_analysis
+from utils.video_output import annotate_frame
+
+class LiveFrameSource:
+    """
+    Đọc frame từ camera (chỉ số thiết bị), URL stream hoặc file video trên một thread riêng.
+    Chỉ giữ tối đa max_buffered frame mới nhất: khi phân tích chậm hơn thời gian thực,
+    frame cũ nhất bị bỏ thay vì xếp hàng vô hạn. File video được phát lại theo FPS gốc
+    (realtime_replay) để mô phỏng nguồn trực tiếp.
+    """
+    def __init__(self, source, max_buffered=2, realtime_replay=None):
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self.source = source
+        self.max_buffered = max(1, int(max_buffered))
+        if realtime_replay is None:
+            realtime_replay = isinstance(source, str) and os.path.isfile(source)
+        self.realtime_replay = realtime_replay
+        self.dropped_frames = 0
+        self.captured_frames = 0
+        self.fps = 0.0
+        self.width = 0
+        self.height = 0
+        self._buffer = deque(maxlen=self.max_buffered)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._finished = False
+        self._thread = None
+        self._cap = None
+
+    def start(self):
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            raise IOError(f"Lỗi mở nguồn video: {self.source}")
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._cap is not None:
+            self._cap.release()
+
+    def _capture_loop(self):
+        start = time.time()
+        frame_interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        while not self._stop.is_set():
+            read_start = time.perf_counter()
+            ret, frame = self._cap.read()
+            decoded_at = time.perf_counter()
+            decode_time = decoded_at - read_start
+            if not ret:
+                break
+            self.captured_frames += 1
+            if self.realtime_replay and frame_interval > 0:
+                delay = start + self.captured_frames * frame_interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            now = time.time()
+            with self._cond:
+                if len(self._buffer) == self.max_buffered:
+                    self.dropped_frames += 1
+                self._buffer.append({
+                    'index': self.captured_frames,
+                    'frame': frame,
+                    'time': now - start,
+                    'captured_at': now,
+                    'decoded_at': decoded_at,
+                    'timings': {'decode': decode_time}
+                })
+                self._cond.notify()
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def frames(self):
+        """Generator trả về frame mới nhất theo thứ tự cho tới khi nguồn kết thúc hoặc bị dừng"""
+        while True:
+            with self._cond:
+                while not self._buffer and not self._finished and not self._stop.is_set():
+                    self._cond.wait(timeout=0.1)
+                if not self._buffer:
+                    return
+                record = self._buffer.popleft()
+            yield record
+
+
+def run_live_detection(model, device, source, confidence_threshold=0.85, sequence_length=16,
+                       image_size=64, motion_threshold=2.0, max_buffered=2, history_size=3000,
+                       motion_estimator="farneback", min_stride=1, max_stride=1, cascade_margin=None,
+                       output_path=None, on_update=None, stop_event=None, realtime_replay=None):
+    """
+    Phát hiện bạo lực trên nguồn trực tiếp với độ trễ giới hạn.
+    Lịch sử phân tích chỉ giữ history_size frame gần nhất (cửa sổ trượt).
+    on_update(record, stats) được gọi sau mỗi frame đã phân tích, stats gồm độ trễ
+    hiện tại (giây), số frame bị bỏ và số frame đã xử lý.
+    Trả về analysis_data (cửa sổ cuối) và stats khi nguồn kết thúc hoặc stop_event được set.
+    """
+    stop_event = stop_event or threading.Event()
+    analysis_data = create_analysis_data(max_history=history_size)
+    live_source = LiveFrameSource(source, max_buffered, realtime_replay).start()
+    out = None
+    if output_path is not None:
+        fps = live_source.fps if live_source.fps > 0 else 30
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps,
+                              (live_source.width, live_source.height))
+
+    def source_frames():
+        for record in live_source.frames():
+            if stop_event.is_set():
+                return
+            yield record
+
+    stats = {'lag': 0.0, 'dropped_frames': 0, 'processed_frames': 0}
+    scheduler = InferenceScheduler(motion_threshold, min_stride, max_stride, cascade_margin)
+    records = infer_frames(
+        analyze_frames(source_frames(), image_size, sequence_length, MotionAnalyzer(motion_estimator)),
+        model, device, sequence_length, scheduler
+    )
+    start_time = time.time()
+
+    try:
+        for record in records:
+            avg_motion = record['avg_motion']
+            prob_source = record['prob_source']
+            violence_prob = record['violence_prob']
+
+            if prob_source is not None:
+                detection_status, label_text, box_color = decide_detection(
+                    violence_prob, avg_motion, confidence_threshold, motion_threshold, prob_source
+                )
+            else:
+                detection_status, label_text, box_color = "Processing", "Initializing...", (255, 255, 0)
+            record['detection_status'] = detection_status
+
+            if out is not None:
+                frame = record['frame']
+                stage_start = time.perf_counter()
+                annotate_frame(frame, detection_status, label_text, box_color, avg_motion, record['time'])
+                encode_start = time.perf_counter()
+                out.write(frame)
+                record['timings']['overlay'] = encode_start - stage_start
+                record['timings']['encode'] = time.perf_counter() - encode_start
+
+            if detection_status != "Processing":
+                append_analysis(analysis_data, record, detection_status, time.time() - start_time)
+
+            stats['lag'] = time.time() - record['captured_at']
+            stats['dropped_frames'] = live_source.dropped_frames
+            stats['processed_frames'] += 1
+            if on_update is not None:
+                on_update(record, stats)
+    finally:
+        live_source.stop()
+        if out is not None:
+            out.release()
+
+    return analysis_data, stats
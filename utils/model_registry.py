@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import torch
+import torch.nn as nn
+from models.violence_detector import load_violence_detector
+from models.backends import create_backend, check_parity, EagerBackend
+from models.quantization import quantize_detector, collect_calibration_frames
+from utils.hashing import file_digest
+
+# Tổng dung lượng (ước lượng) các model giữ trong registry trước khi bỏ model ít dùng nhất
+MODEL_MEMORY_BUDGET = 1024 ** 3
+
+def tensor_nbytes(module):
+    """
+    Byte của tham số và buffer trong module, kể cả trọng số int8 đóng gói của các module
+    lượng tử hóa (Linear / Conv: weight(), bias(); LSTM động: get_weight(), get_bias()),
+    vốn không nằm trong parameters() / state_dict() dưới dạng Tensor
+    """
+    nbytes = 0
+    for submodule in module.modules():
+        tensors = list(submodule.parameters(recurse=False)) + list(submodule.buffers(recurse=False))
+        if callable(getattr(submodule, 'get_weight', None)):
+            tensors += list(submodule.get_weight().values()) + list(submodule.get_bias().values())
+        elif callable(getattr(submodule, 'weight', None)):
+            tensors += [submodule.weight(), submodule.bias()]
+        nbytes += sum(tensor.numel() * tensor.element_size() for tensor in tensors if isinstance(tensor, torch.Tensor))
+    return nbytes
+
+def model_nbytes(model, weights_path):
+    """
+    Ước lượng bộ nhớ của model đã nạp (byte): trọng số của các module torch trong backend,
+    hoặc kích thước các file đã export với backend không giữ trọng số dạng module
+    (ONNX Runtime, TorchScript đã freeze), cuối cùng là kích thước file weights
+    """
+    modules = [part for part in (getattr(model, name, None) for name in ('detector', 'backbone', 'head'))
+               if isinstance(part, nn.Module)]
+    nbytes = sum(tensor_nbytes(module) for module in modules)
+    if not nbytes and getattr(model, 'paths', None):
+        nbytes = sum(os.path.getsize(path) for path in model.paths)
+    return nbytes or os.path.getsize(weights_path)
+
+def warm_up(model, image_size=64, sequence_length=16):
+    """
+    Chạy một lượt forward trên input rỗng để cấp phát bộ nhớ và khởi tạo kernel trước
+    lần phân tích đầu tiên, trả về thời gian (giây)
+    """
+    start = time.perf_counter()
+    model(torch.zeros(1, sequence_length, 3, image_size, image_size, device=model.device))
+    return time.perf_counter() - start
+
+class ModelRegistry:
+    """
+    Các model đã nạp, dùng chung cho mọi phiên / thread trong process.
+    Khóa: đường dẫn weights, SHA-256 nội dung weights, backend, độ chính xác và thiết bị
+    (thêm kích thước input với backend export, clip hiệu chỉnh với static_int8), nên sửa
+    file weights hoặc đổi cấu hình sẽ nạp model mới.
+    Khi tổng dung lượng vượt memory_budget, model ít được dùng gần đây nhất bị bỏ khỏi
+    registry (LRU); phiên đang giữ model đó vẫn dùng được tới khi nhả tham chiếu.
+    """
+
+    def __init__(self, memory_budget=MODEL_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._entries = OrderedDict()
+        # Khóa chung chỉ giữ khi đọc / ghi _entries; việc nạp model giữ khóa riêng theo khóa model
+        # (hai phiên cùng mở một model chỉ nạp một lần, model khác vẫn lấy / nạp được song song)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get(self, weights_path, device_name="cpu", backend="eager", precision="fp32",
+            export_dir="weights/exported", image_size=64, sequence_length=16, calibration_videos=None):
+        """
+        Model (backend suy luận) cho bộ tham số (xem utils.config.get_model_spec), nạp nếu chưa có.
+        Trả về (model, report), report gồm nbytes, load_seconds (nạp weights, lượng tử hóa / export),
+        warmup_seconds, parity (độ lệch xác suất so với eager, None với eager) và cached
+        (model đã có sẵn trong registry).
+        """
+        if precision != 'fp32' and backend != 'eager':
+            raise ValueError("Model lượng tử hóa chỉ chạy được bằng PyTorch eager")
+        key = (os.path.abspath(weights_path), file_digest(weights_path), backend, precision, device_name)
+        if backend != 'eager':
+            # Backend export được trace với kích thước input cố định
+            key += (os.path.abspath(export_dir), image_size, sequence_length)
+        if precision == 'static_int8':
+            key += (tuple(calibration_videos or []),)
+
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Phiên khác có thể vừa nạp xong model này trong lúc chờ khóa
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached
+            try:
+                start = time.perf_counter()
+                model, parity = self._load(weights_path, device_name, backend, precision, export_dir,
+                                           image_size, sequence_length, calibration_videos)
+                report = {
+                    'nbytes': model_nbytes(model, weights_path),
+                    'load_seconds': time.perf_counter() - start,
+                    'warmup_seconds': warm_up(model, image_size, sequence_length),
+                    'parity': parity
+                }
+                with self._lock:
+                    self._entries[key] = {'model': model, 'report': report, 'hits': 0}
+                    self._evict(keep=key)
+            finally:
+                with self._lock:
+                    if self._load_locks.get(key) is load_lock:
+                        del self._load_locks[key]
+        return model, {**report, 'cached': False}
+
+    def set_memory_budget(self, memory_budget):
+        """Đổi ngân sách bộ nhớ (byte), bỏ ngay các model vượt ngân sách mới"""
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._evict()
+
+    def entries(self):
+        """Các model đang giữ, từ ít tới nhiều được dùng gần đây: khóa, report và số lần dùng lại"""
+        with self._lock:
+            return [{'key': key, **entry['report'], 'hits': entry['hits']} for key, entry in self._entries.items()]
+
+    def _lookup(self, key):
+        """(model, report) nếu model đã có trong registry (đánh dấu vừa được dùng), ngược lại None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            entry['hits'] += 1
+            return entry['model'], {**entry['report'], 'cached': True}
+
+    def _load(self, weights_path, device_name, backend, precision, export_dir,
+              image_size, sequence_length, calibration_videos):
+        """Tạo model mới, trả về (model, độ lệch so với eager hoặc None)"""
+        if backend == 'eager' and precision == 'fp32':
+            return EagerBackend(load_violence_detector(weights_path, torch.device(device_name), mmap=True)), None
+
+        # Lượng tử hóa và export đều đi từ bản fp32 eager (cũng được giữ trong registry)
+        base, _ = self.get(weights_path, device_name, 'eager', 'fp32')
+        if precision != 'fp32':
+            calibration_frames = None
+            if precision == 'static_int8':
+                calibration_frames = collect_calibration_frames(calibration_videos or [], image_size)
+            return EagerBackend(quantize_detector(base.model, precision, calibration_frames)), None
+
+        model = create_backend(backend, base.model, torch.device(device_name), export_dir=export_dir,
+                               image_size=image_size, sequence_length=sequence_length)
+        return model, check_parity(base, model, image_size, sequence_length)
+
+    def _evict(self, keep=None):
+        """
+        Bỏ các model ít được dùng gần đây nhất cho tới khi tổng dung lượng không vượt ngân sách
+        (gọi khi đang giữ khóa)
+        """
+        total = sum(entry['report']['nbytes'] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            if key != keep:
+                total -= self._entries.pop(key)['report']['nbytes']
+
+# Registry của process (mỗi process worker có registry riêng)
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_model_registry(memory_budget=None):
+    """Registry dùng chung của process, tạo ở lần gọi đầu. memory_budget (byte): đổi ngân sách bộ nhớ"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        if memory_budget is not None and memory_budget != _registry.memory_budget:
+            _registry.set_memory_budget(memory_budget)
+        return _registry
@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+MOTION_ESTIMATORS = ['farneback', 'dis', 'lucas_kanade', 'frame_diff']
+
 def calculate_motion_score(prev_frame, curr_frame):
     """
     Tính toán điểm chuyển động giữa hai frame sử dụng Optical Flow
@@ -26,4 +28,77 @@ def calculate_motion_score(prev_frame, curr_frame):
     
     # Calculate magnitude
     mag, _ = cv2.cartToPolar(flow[..., 0], flow[..., 1])
-    return np.mean(mag)
\ No newline at end of file
+    return np.mean(mag)
+
+class MotionAnalyzer:
+    """
+    Tính điểm chuyển động theo luồng frame, giữ lại ảnh xám đã thu nhỏ của frame
+    trước nên mỗi frame chỉ phải resize + chuyển xám một lần.
+
+    Các estimator (đánh đổi độ chính xác lấy tốc độ):
+    - 'farneback': Optical Flow dày Farneback, giống calculate_motion_score
+    - 'dis': Optical Flow dày DIS (preset ultrafast), nhanh hơn Farneback nhiều
+    - 'lucas_kanade': Optical Flow thưa Lucas-Kanade trên các điểm góc
+    - 'frame_diff': trung bình sai khác tuyệt đối giữa hai frame (rẻ nhất)
+    Thang điểm của 'frame_diff' khác với các estimator Optical Flow nên cần
+    chỉnh lại ngưỡng chuyển động khi dùng.
+    """
+    def __init__(self, estimator='farneback', target_width=320):
+        if estimator not in MOTION_ESTIMATORS:
+            raise ValueError(f"Estimator không hợp lệ: {estimator}")
+        self.estimator = estimator
+        self.target_width = target_width
+        self.prev_gray = None
+        self.flow = None
+        self._dis = None
+        if estimator == 'dis':
+            self._dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST)
+
+    def reset(self):
+        self.prev_gray = None
+
+    def preprocess(self, frame):
+        """Thu nhỏ về target_width và chuyển sang ảnh xám"""
+        scale = self.target_width / frame.shape[1]
+        small = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def update(self, frame):
+        """Nhận frame mới, trả về điểm chuyển động so với frame trước (0.0 cho frame đầu)"""
+        if frame is None:
+            return 0.0
+        
+        curr_gray = self.preprocess(frame)
+        prev_gray = self.prev_gray
+        self.prev_gray = curr_gray
+        if prev_gray is None or prev_gray.shape != curr_gray.shape:
+            return 0.0
+        
+        if self.estimator == 'frame_diff':
+            return float(cv2.absdiff(prev_gray, curr_gray).mean())
+        if self.estimator == 'lucas_kanade':
+            return self._sparse_flow_score(prev_gray, curr_gray)
+        
+        if self.flow is None or self.flow.shape[:2] != curr_gray.shape:
+            self.flow = np.zeros(curr_gray.shape + (2,), dtype=np.float32)
+        if self.estimator == 'dis':
+            self.flow = self._dis.calc(prev_gray, curr_gray, self.flow)
+        else:
+            # Ghi kết quả vào buffer flow có sẵn (flags=0 nên giá trị cũ không được dùng làm khởi tạo)
+            self.flow = cv2.calcOpticalFlowFarneback(
+                prev_gray, curr_gray, self.flow, 0.5, 3, 15, 3, 5, 1.2, 0
+            )
+        
+        mag, _ = cv2.cartToPolar(self.flow[..., 0], self.flow[..., 1])
+        return np.mean(mag)
+
+    def _sparse_flow_score(self, prev_gray, curr_gray):
+        points = cv2.goodFeaturesToTrack(prev_gray, maxCorners=200, qualityLevel=0.01, minDistance=7)
+        if points is None:
+            return 0.0
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, curr_gray, points, None)
+        tracked = status.reshape(-1) == 1
+        if not np.any(tracked):
+            return 0.0
+        displacement = (next_points - points).reshape(-1, 2)[tracked]
+        return float(np.mean(np.linalg.norm(displacement, axis=1)))
@@ -0,0 +1,108 @@
+import queue
+import threading
+
+_END = object()
+
+class PipelineCancelled(Exception):
+    """Pipeline bị dừng giữa chừng bởi stop_event hoặc cancel()"""
+
+
+class StagePipeline:
+    """
+    Chạy các stage xử lý đồng thời, mỗi stage trên một thread riêng, nối với nhau
+    bằng queue có giới hạn (backpressure: stage nhanh sẽ chờ khi queue phía sau đầy).
+
+    - source: iterable sinh dữ liệu đầu vào (ví dụ: đọc frame từ video)
+    - stages: danh sách hàm stage(items) -> iterator, nhận iterator đầu vào và
+      yield kết quả theo đúng thứ tự (có thể gom batch hoặc bỏ bớt phần tử)
+
+    Kết quả của stage cuối được lấy bằng cách lặp trên pipeline ở thread gọi.
+    stop_event (tùy chọn) chỉ được đọc: bên gọi set để dừng pipeline; việc dừng nội bộ
+    (close, lỗi ở một stage) dùng event riêng nên không làm thay đổi event của bên gọi.
+    """
+    def __init__(self, source, stages, queue_size=8, stop_event=None):
+        self.stop_event = stop_event
+        self._stop = threading.Event()
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self._errors = []
+        self._threads = [threading.Thread(target=self._run_source, args=(source, self._queues[0]), daemon=True)]
+        for i, stage in enumerate(stages):
+            self._threads.append(threading.Thread(
+                target=self._run_stage, args=(stage, self._queues[i], self._queues[i + 1]), daemon=True
+            ))
+        self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            for thread in self._threads:
+                thread.start()
+
+    def cancel(self):
+        """Yêu cầu mọi stage dừng sớm"""
+        self._stop.set()
+
+    def stopped(self):
+        """Pipeline đã bị dừng (cancel / close / lỗi) hoặc bên gọi đã set stop_event"""
+        return self._stop.is_set() or (self.stop_event is not None and self.stop_event.is_set())
+
+    def close(self):
+        """Dừng pipeline và chờ các thread kết thúc"""
+        self.cancel()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+
+    def __iter__(self):
+        self.start()
+        for item in self._drain(self._queues[-1]):
+            yield item
+        if self._errors:
+            raise self._errors[0]
+        if self.stopped():
+            raise PipelineCancelled()
+
+    def _put(self, q, item):
+        while not self.stopped():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, q):
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if self.stopped():
+                    return
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _run_source(self, source, q_out):
+        self._forward(iter(source), q_out)
+
+    def _run_stage(self, stage, q_in, q_out):
+        self._forward(stage(self._drain(q_in)), q_out)
+
+    def _forward(self, items, q_out):
+        try:
+            for item in items:
+                if not self._put(q_out, item):
+                    return
+            self._put(q_out, _END)
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
@@ -0,0 +1,47 @@
+from collections import Counter
+import numpy as np
+from utils.config import create_analysis_data
+from utils.video_analysis import analyze_video
+
+def compare_precision_results(reference_data, candidate_data):
+    """
+    So sánh kết quả phân tích của model độ chính xác thấp với model fp32 trên cùng video:
+    độ lệch violence_prob, tỉ lệ trùng trạng thái, các cặp trạng thái bị đổi và tốc độ.
+    """
+    n = min(len(reference_data['violence_probs']), len(candidate_data['violence_probs']))
+    if n == 0:
+        return None
+    
+    ref_probs = np.asarray(reference_data['violence_probs'][:n], dtype=np.float64)
+    cand_probs = np.asarray(candidate_data['violence_probs'][:n], dtype=np.float64)
+    # Chỉ so xác suất trên các frame cả hai lần chạy đều gọi model (frame bị cascade bỏ qua là NaN)
+    scored = ~(np.isnan(ref_probs) | np.isnan(cand_probs))
+    diff = np.abs(ref_probs - cand_probs)[scored]
+    
+    ref_status = list(reference_data['detection_status'])[:n]
+    cand_status = list(candidate_data['detection_status'])[:n]
+    changes = Counter((r, c) for r, c in zip(ref_status, cand_status) if r != c)
+    
+    ref_seconds = reference_data['frame_times'][n - 1]
+    cand_seconds = candidate_data['frame_times'][n - 1]
+    
+    return {
+        'frames': n,
+        'timestamps': list(candidate_data['timestamps'])[:n],
+        'reference_probs': ref_probs.tolist(),
+        'candidate_probs': cand_probs.tolist(),
+        'max_prob_diff': float(diff.max()) if len(diff) else 0.0,
+        'mean_prob_diff': float(diff.mean()) if len(diff) else 0.0,
+        'status_agreement': 1.0 - sum(changes.values()) / n,
+        'status_changes': {f"{r} → {c}": count for (r, c), count in changes.most_common()},
+        'reference_seconds': ref_seconds,
+        'candidate_seconds': cand_seconds,
+        'speedup': ref_seconds / cand_seconds if cand_seconds > 0 else 0.0
+    }
+
+def run_reference_analysis(reference_model, device, video_path, **options):
+    """Chạy lại phân tích với model tham chiếu (fp32), chỉ lấy dữ liệu, không ghi video"""
+    reference_data = create_analysis_data()
+    analyze_video(reference_model, device, video_path, None,
+                  analysis_data=reference_data, output_mode="signals", **options)
+    return reference_data
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from utils.video_analysis import save_analysis, load_analysis
+from utils.hashing import file_digest
+
+def cache_key(video_digest, weights_digest, options):
+    """Khóa cache: nội dung video + weights + mọi tham số ảnh hưởng tới kết quả"""
+    payload = json.dumps({'video': video_digest, 'weights': weights_digest, 'options': options},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """
+    Cache kết quả phân tích trên đĩa theo nội dung (content-addressed).
+    Mỗi mục là một thư mục <root>/<key>/ gồm video đã chú thích (output.mp4) và
+    dữ liệu phân tích (analysis.npz). Khi tổng dung lượng vượt max_bytes, các mục
+    ít được dùng gần đây nhất bị xóa (LRU theo thời điểm truy cập).
+    """
+    VIDEO_NAME = "output.mp4"
+    ANALYSIS_NAME = "analysis.npz"
+
+    def __init__(self, root="cache/results", max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """Trả về {'output_path', 'analysis_data', 'metadata'} hoặc None nếu chưa có"""
+        entry = self.entry_dir(key)
+        video_path = os.path.join(entry, self.VIDEO_NAME)
+        analysis_path = os.path.join(entry, self.ANALYSIS_NAME)
+        if not (os.path.exists(video_path) and os.path.exists(analysis_path)):
+            return None
+        try:
+            analysis_data, metadata = load_analysis(analysis_path)
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        # Đánh dấu vừa được dùng để LRU không xóa mục này trước
+        os.utime(entry)
+        return {'output_path': video_path, 'analysis_data': analysis_data, 'metadata': metadata}
+
+    def put(self, key, output_path, analysis_data, metadata=None):
+        """Lưu kết quả vào cache (ghi vào thư mục tạm rồi đổi tên), trả về thư mục của mục"""
+        entry = self.entry_dir(key)
+        tmp_entry = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_entry)
+        try:
+            shutil.copyfile(output_path, os.path.join(tmp_entry, self.VIDEO_NAME))
+            save_analysis(analysis_data, os.path.join(tmp_entry, self.ANALYSIS_NAME),
+                          metadata={**(metadata or {}), 'cached_at': time.time()})
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp_entry, entry)
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict(keep=key)
+        return entry
+
+    def entries(self):
+        """Danh sách (thời điểm truy cập, dung lượng, key) của các mục trong cache"""
+        result = []
+        for name in os.listdir(self.root):
+            entry = self.entry_dir(name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            result.append((os.path.getmtime(entry), size, name))
+        return result
+
+    def evict(self, keep=None):
+        """Xóa các mục cũ nhất cho tới khi tổng dung lượng không vượt quá max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self.entry_dir(name), ignore_errors=True)
+            total -= size
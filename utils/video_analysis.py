@@ -0,0 +1,473 @@
+import contextlib
+import cv2
+import json
+import os
+import torch
+import numpy as np
+from collections import deque
+import time
+from models.violence_detector import FrameFeatureBuffer, unwrap_model
+from utils.motion_analysis import MotionAnalyzer
+from utils.inference_scheduler import InferenceScheduler
+from utils.pipeline import StagePipeline
+from utils.config import TIMING_STAGES, ANALYSIS_COLUMNS
+from utils.analysis_store import AnalysisStore, STATUS_LABELS, PROB_SOURCE_LABELS
+from utils.video_output import create_output_writer
+
+# Khi cần bỏ qua không quá số frame này thì grab() tuần tự, xa hơn thì seek bằng CAP_PROP_POS_FRAMES
+SEEK_GRAB_LIMIT = 64
+
+def analyze_video(model, device, video_path, output_path, 
+                  confidence_threshold=0.85, sequence_length=16, 
+                  image_size=64, motion_threshold=2.0, analysis_data=None,
+                  min_stride=1, max_stride=1, cascade_margin=None,
+                  inference_mode="per_frame", batch_size=8,
+                  queue_size=8, stop_event=None, motion_estimator="farneback",
+                  progress_callback=None, profile_path=None, video_info=None,
+                  output_mode="full", clip_pre_roll=2.0, clip_post_roll=2.0, frame_ranges=None):
+    """
+    Lõi xử lý video, không phụ thuộc giao diện: phân tích từng frame, ghi video đã
+    chú thích ra output_path và bổ sung kết quả vào analysis_data (kèm thời gian
+    từng giai đoạn của mỗi frame).
+    progress_callback(frame_count, total_frames, current_time) được gọi sau mỗi frame.
+    profile_path: nếu có, ghi trace torch.profiler (Chrome trace) của stage suy luận.
+    video_info: kết quả probe_video đã có sẵn (không cần đọc lại thông tin video).
+    output_mode: 'full' (cả video), 'clips' (chỉ các đoạn sự kiện kèm clip_pre_roll /
+    clip_post_roll giây) hoặc 'signals' (không ghi video), xem utils.video_output.
+    frame_ranges: chỉ phân tích các đoạn [(frame đầu, frame cuối)] (đánh số từ 1, tăng dần,
+    không chồng nhau); mỗi đoạn khởi tạo lại cửa sổ nên cần chừa sequence_length frame ở đầu.
+    Trả về thông tin video (fps, kích thước, số frame) và đầu ra ('output_path' hoặc 'clips').
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Lỗi mở video: {video_path}")
+
+    video_info = video_info or read_video_info(cap)
+    width = video_info['width']
+    height = video_info['height']
+    fps = video_info['fps']
+    total_frames = video_info['total_frames']
+
+    # Video writer setup
+    out = create_output_writer(output_mode, output_path, fps, (width, height), clip_pre_roll, clip_post_roll)
+    
+    # "per_frame": gọi model ngay mỗi frame, "batched": gom K frame rồi suy luận một lần
+    batch_size = max(1, int(batch_size)) if inference_mode == "batched" else 1
+    
+    start_time = time.time()
+    processed_frames = 0
+    completed = False
+    
+    # Các stage chạy đồng thời: decode -> motion/preprocess -> inference -> annotate/encode
+    pipeline = StagePipeline(
+        source=decode_frames(cap, fps, frame_ranges),
+        stages=[
+            lambda records: analyze_frames(records, image_size, sequence_length,
+                                           MotionAnalyzer(motion_estimator)),
+            lambda records: infer_frames(records, model, device, sequence_length,
+                                         InferenceScheduler(motion_threshold, min_stride, max_stride, cascade_margin),
+                                         batch_size, profile_path)
+        ],
+        queue_size=queue_size,
+        stop_event=stop_event
+    )
+    
+    try:
+        with pipeline:
+            for record in pipeline:
+                frame = record['frame']
+                frame_count = record['index']
+                current_time = record['time']
+                avg_motion = record['avg_motion']
+                prob_source = record['prob_source']
+                violence_prob = record['violence_prob']
+                
+                if prob_source is not None:
+                    detection_status, label_text, box_color = decide_detection(
+                        violence_prob, avg_motion, confidence_threshold, motion_threshold, prob_source
+                    )
+                else:
+                    detection_status = "Processing"
+                    label_text = "Initializing..."
+                    box_color = (255, 255, 0)  # Vàng
+
+                if record.get('segment_start'):
+                    out.gap()
+                overlay_time, encode_time = out.write(
+                    frame, (detection_status, label_text, box_color, avg_motion, current_time)
+                )
+                record['timings']['overlay'] = overlay_time
+                record['timings']['encode'] = encode_time
+                processed_frames += 1
+
+                # Store analysis data for charts
+                if analysis_data is not None and detection_status != "Processing":
+                    append_analysis(analysis_data, record, detection_status, time.time() - start_time)
+                
+                if progress_callback is not None:
+                    progress_callback(frame_count, total_frames, current_time)
+        completed = True
+    finally:
+        cap.release()
+        # Lỗi hoặc bị hủy: bỏ đầu ra ghi dở, giữ nguyên kết quả của lần chạy trước
+        if completed:
+            out.close()
+        else:
+            out.abort()
+    
+    return {
+        'fps': fps,
+        'width': width,
+        'height': height,
+        'total_frames': total_frames,
+        'processed_frames': processed_frames,
+        **out.result()
+    }
+
+def read_video_info(cap):
+    """Thông tin cơ bản của video đang mở (fps, kích thước, số frame, thời lượng)"""
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    return {
+        'fps': fps,
+        'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'total_frames': total_frames,
+        'duration': total_frames / fps if fps > 0 else 0
+    }
+
+def probe_video(video_path):
+    """Đọc thông tin video từ file (không giải mã frame); raise IOError nếu không mở được"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise IOError(f"Lỗi mở video: {video_path}")
+        return read_video_info(cap)
+    finally:
+        cap.release()
+
+def decode_frames(cap, fps, frame_ranges=None):
+    """
+    Stage decode: đọc lần lượt các frame từ video.
+    frame_ranges: chỉ đọc các đoạn [(frame đầu, frame cuối)] (đánh số từ 1); frame đầu
+    của mỗi đoạn được đánh dấu 'segment_start' để các stage sau khởi tạo lại trạng thái.
+    """
+    if frame_ranges is None:
+        frame_ranges = [(1, None)]
+    position = 0
+    for start, end in frame_ranges:
+        position = seek_frame(cap, position, start - 1)
+        frame_count = start - 1
+        while cap.isOpened() and (end is None or frame_count < end):
+            stage_start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret: 
+                return
+
+            frame_count += 1
+            position = frame_count
+            decoded_at = time.perf_counter()
+            yield {
+                'index': frame_count,
+                'frame': frame,
+                'time': frame_count / fps if fps > 0 else frame_count / 30,
+                'segment_start': frame_count == start,
+                'decoded_at': decoded_at,
+                'timings': {'decode': decoded_at - stage_start}
+            }
+
+def seek_frame(cap, position, target):
+    """
+    Đưa vị trí đọc từ frame position tới frame target (đánh số từ 0): bỏ qua đoạn ngắn
+    bằng grab() (không chuyển đổi ảnh), đoạn dài hoặc lùi lại thì seek trực tiếp.
+    Trả về vị trí mới.
+    """
+    if position == target:
+        return position
+    if 0 < target - position <= SEEK_GRAB_LIMIT:
+        while position < target and cap.grab():
+            position += 1
+        return position
+    cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+    return target
+
+def analyze_frames(records, image_size, sequence_length, motion_analyzer=None):
+    """Stage phân tích: tính điểm chuyển động và tiền xử lý input cho model"""
+    motion_analyzer = motion_analyzer or MotionAnalyzer()
+    motion_scores = deque(maxlen=sequence_length)
+    
+    for record in records:
+        frame = record['frame']
+        timings = record.setdefault('timings', {})
+        if record.get('segment_start'):
+            # Đoạn mới không liền với frame trước: không tính chuyển động qua chỗ ngắt
+            motion_analyzer.reset()
+            motion_scores.clear()
+        
+        # Motion Calculation (analyzer giữ ảnh xám thu nhỏ của frame trước)
+        stage_start = time.perf_counter()
+        current_motion = motion_analyzer.update(frame)
+        motion_scores.append(current_motion)
+        record['avg_motion'] = np.mean(motion_scores) if len(motion_scores) > 0 else 0.0
+        timings['motion'] = time.perf_counter() - stage_start
+
+        # AI Preprocess: giữ uint8, chuẩn hóa được thực hiện ngay trước forward
+        stage_start = time.perf_counter()
+        try:
+            record['input'] = cv2.resize(frame, (image_size, image_size))
+        except Exception as e:
+            continue
+        timings['preprocess'] = time.perf_counter() - stage_start
+
+        yield record
+
+def infer_frames(records, model, device, sequence_length, scheduler, batch_size=1, profile_path=None):
+    """
+    Stage suy luận: lưu input vào ring buffer đặc trưng, gom batch_size frame
+    rồi phân loại các cửa sổ cần thiết trong một lần forward.
+    Gán 'prob_source' (None khi cửa sổ chưa đủ frame) và 'violence_prob' cho từng frame.
+    profile_path: ghi trace torch.profiler của stage này ra file (Chrome trace).
+    """
+    detector = unwrap_model(model)
+    feature_buffer = FrameFeatureBuffer(sequence_length + batch_size - 1, detector.cnn_out_features, device)
+    last_violence_prob = 0.0
+    pending_frames = []
+    
+    def flush():
+        nonlocal last_violence_prob
+        model_records = [r for r in pending_frames if r['prob_source'] == "model"]
+        warmup_records = [r for r in pending_frames if r['prob_source'] is None]
+        if model_records:
+            stage_start = time.perf_counter()
+            with torch.no_grad():
+                with torch.profiler.record_function("backbone"):
+                    windows = feature_buffer.windows([r['position'] for r in model_records], sequence_length, detector)
+                with torch.profiler.record_function("temporal_head"):
+                    probs = torch.softmax(detector.classify_sequence(windows), dim=1)[:, 1].tolist()
+            # Thời gian forward của cả batch được chia đều cho các frame chạy model
+            forward_time = (time.perf_counter() - stage_start) / len(model_records)
+            for record, prob in zip(model_records, probs):
+                record['model_prob'] = prob
+                record['timings']['inference'] += forward_time
+        elif warmup_records:
+            # Frame khởi tạo cửa sổ qua backbone ngay trong batch của lần flush chứa nó, nên nhóm
+            # batch của mỗi frame không phụ thuộc điểm bắt đầu đọc (phân tích theo đoạn cho kết
+            # quả giống hệt chạy tuần tự, xem utils.chunked_analysis)
+            stage_start = time.perf_counter()
+            with torch.no_grad():
+                with torch.profiler.record_function("backbone"):
+                    feature_buffer.embed_pending(detector, [r['position'] - 1 for r in warmup_records])
+            embed_time = (time.perf_counter() - stage_start) / len(warmup_records)
+            for record in warmup_records:
+                record['timings']['inference'] += embed_time
+
+        for record in pending_frames:
+            if record['prob_source'] == "model":
+                last_violence_prob = record.pop('model_prob')
+            if record['prob_source'] == "gated":
+                # Cascade: chuyển động thấp nên không thể là VIOLENCE, bỏ qua model. Frame không
+                # có xác suất (NaN) và không làm đổi xác suất được giữ cho các frame "carried" sau
+                record['violence_prob'] = float('nan')
+            else:
+                # "carried": giữ nguyên xác suất của lần suy luận gần nhất
+                record['violence_prob'] = last_violence_prob if record['prob_source'] else 0.0
+        flushed = list(pending_frames)
+        pending_frames.clear()
+        return flushed
+
+    if profile_path:
+        profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+    else:
+        profiler = contextlib.nullcontext()
+
+    with profiler:
+        for record in records:
+            if record.get('segment_start') and feature_buffer.count > 0:
+                # Đoạn mới: xử lý hết các frame đang chờ rồi bắt đầu cửa sổ lại từ đầu
+                yield from flush()
+                feature_buffer.reset()
+                scheduler.reset()
+                last_violence_prob = 0.0
+
+            stage_start = time.perf_counter()
+            # Backbone chỉ chạy cho frame này khi một cửa sổ chứa nó được phân loại
+            feature_buffer.push_input(record.pop('input'))
+            record['position'] = feature_buffer.count
+
+            # None: cửa sổ chưa đủ frame, chưa thể phân loại
+            record['prob_source'] = None
+            if feature_buffer.count >= sequence_length:
+                record['prob_source'] = scheduler.next_action(record['avg_motion'])
+            record.setdefault('timings', {})['inference'] = time.perf_counter() - stage_start
+
+            pending_frames.append(record)
+            if len(pending_frames) >= batch_size:
+                yield from flush()
+
+        yield from flush()
+
+    if profile_path:
+        profiler.export_chrome_trace(profile_path)
+
+def append_analysis(analysis_data, record, detection_status, frame_time):
+    """
+    Lưu kết quả và thời gian từng giai đoạn (ms) của một frame vào analysis_data, gọi ngay
+    sau khi ghi đầu ra của frame (độ trễ tính từ record['decoded_at'])
+    """
+    timings = record.get('timings', {})
+    decoded_at = record.get('decoded_at')
+    analysis_data.append_frame(
+        timestamps=record['time'],
+        violence_probs=record['violence_prob'],
+        motion_scores=record['avg_motion'],
+        detection_status=detection_status,
+        frame_times=frame_time,
+        prob_source=record['prob_source'],
+        frame_latency=(time.perf_counter() - decoded_at) * 1000.0 if decoded_at is not None else 0.0,
+        **{f'stage_{stage}': timings.get(stage, 0.0) * 1000.0 for stage in TIMING_STAGES}
+    )
+
+def decide_detection(violence_prob, avg_motion, confidence_threshold, motion_threshold, prob_source="model"):
+    """
+    Logic kết hợp AI + chuyển động, trả về (trạng thái, nhãn, màu BGR).
+    Frame bị cascade bỏ qua (prob_source 'gated', xác suất NaN) luôn là Normal.
+    """
+    if prob_source == "gated":
+        return "Normal", f"Normal (M:{avg_motion:.1f})", (0, 255, 0)  # Xanh lá
+    is_ai_detect_violence = violence_prob > confidence_threshold
+    is_motion_high = avg_motion > motion_threshold
+
+    if is_ai_detect_violence:
+        if is_motion_high:
+            return "VIOLENCE", f"VIOLENCE! ({violence_prob:.0%} | M:{avg_motion:.1f})", (0, 0, 255)  # Đỏ
+        return "FALSE ALARM", f"FALSE ALARM (M:{avg_motion:.1f})", (0, 165, 255)  # Cam
+    return "Normal", f"Normal (Conf:{violence_prob:.0%})", (0, 255, 0)  # Xanh lá
+
+def redecide_detection(analysis_data, confidence_threshold, motion_threshold):
+    """
+    Tính lại detection_status cho toàn bộ analysis_data theo ngưỡng mới, vector hóa
+    trên xác suất và điểm chuyển động đã lưu (cùng logic với decide_detection,
+    không chạy lại model).
+    Frame bị cascade bỏ qua chưa từng được model chấm điểm nên vẫn là Normal; trả về số frame
+    bị bỏ qua có chuyển động vượt ngưỡng mới (kết quả của chúng cần phân tích lại mới biết).
+    """
+    motion_scores = analysis_data['motion_scores']
+    analysis_data.assign('detection_status', detection_codes(
+        analysis_data['violence_probs'], motion_scores, confidence_threshold, motion_threshold
+    ))
+    gated = analysis_data.codes('prob_source') == PROB_SOURCE_LABELS.index("gated")
+    return int(np.count_nonzero(gated & (np.asarray(motion_scores) > motion_threshold)))
+
+def detection_codes(violence_probs, motion_scores, confidence_threshold, motion_threshold):
+    """
+    Mã trạng thái (theo STATUS_LABELS) cho các mảng xác suất / chuyển động, cùng logic với
+    decide_detection (xác suất NaN của frame bị cascade bỏ qua cho Normal)
+    """
+    is_ai_detect_violence = np.asarray(violence_probs, dtype=np.float64) > confidence_threshold
+    is_motion_high = np.asarray(motion_scores, dtype=np.float64) > motion_threshold
+    return np.where(is_ai_detect_violence,
+                    np.where(is_motion_high, STATUS_LABELS.index("VIOLENCE"), STATUS_LABELS.index("FALSE ALARM")),
+                    STATUS_LABELS.index("Normal")).astype(np.int8)
+
+def render_annotated_video(video_path, output_path, analysis_data,
+                           confidence_threshold=0.85, motion_threshold=2.0,
+                           sequence_length=16, motion_estimator="farneback",
+                           output_mode="full", clip_pre_roll=2.0, clip_post_roll=2.0):
+    """
+    Vẽ lại video kết quả từ analysis_data đã có với ngưỡng mới, không chạy model.
+    Các frame chưa có trong analysis_data (giai đoạn khởi tạo cửa sổ) được vẽ
+    "Initializing..." với điểm chuyển động tính lại (chỉ vài frame đầu video).
+    output_mode: 'full' hoặc 'clips' như analyze_video.
+    Trả về số frame đã đọc và đầu ra ('output_path' hoặc 'clips').
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Lỗi mở video: {video_path}")
+
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    out = create_output_writer(output_mode, output_path, fps, (width, height), clip_pre_roll, clip_post_roll)
+
+    timestamps = analysis_data['timestamps']
+    violence_probs = analysis_data['violence_probs']
+    motion_scores = analysis_data['motion_scores']
+    prob_sources = analysis_data['prob_source']
+    motion_analyzer = MotionAnalyzer(motion_estimator)
+    warmup_motion = deque(maxlen=sequence_length)
+    avg_motion = 0.0
+    row = 0
+    frame_count = 0
+    completed = False
+
+    try:
+        for record in decode_frames(cap, fps):
+            frame = record['frame']
+            if row < len(timestamps) and np.isclose(record['time'], timestamps[row]):
+                avg_motion = float(motion_scores[row])
+                detection_status, label_text, box_color = decide_detection(
+                    float(violence_probs[row]), avg_motion, confidence_threshold, motion_threshold, prob_sources[row]
+                )
+                row += 1
+            else:
+                if row == 0:
+                    warmup_motion.append(motion_analyzer.update(frame))
+                    avg_motion = float(np.mean(warmup_motion))
+                detection_status, label_text, box_color = "Processing", "Initializing...", (255, 255, 0)
+            out.write(frame, (detection_status, label_text, box_color, avg_motion, record['time']))
+            frame_count += 1
+        completed = True
+    finally:
+        cap.release()
+        if completed:
+            out.close()
+        else:
+            out.abort()
+
+    return {'processed_frames': frame_count, **out.result()}
+
+def save_analysis(analysis_data, path, metadata=None):
+    """
+    Ghi dữ liệu phân tích ra file (ghi file tạm rồi đổi tên để không để lại file dở dang).
+    Định dạng theo phần mở rộng: .json (mặc định), .npz hoặc .parquet
+    """
+    ext = os.path.splitext(path)[1].lower()
+    tmp_path = f"{path}.tmp{ext}"
+    if ext == '.npz':
+        analysis_data.export_npz(tmp_path, metadata)
+    elif ext == '.parquet':
+        analysis_data.export_parquet(tmp_path)
+    else:
+        payload = {
+            'metadata': metadata or {},
+            'analysis': {key: _json_column(values) for key, values in analysis_data.items()}
+        }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, allow_nan=False)
+    os.replace(tmp_path, path)
+
+def _json_column(values):
+    """Cột dữ liệu dạng list JSON hợp lệ: NaN (frame bị gate, chưa chấm điểm) ghi thành null"""
+    values = np.asarray(values)
+    missing = np.isnan(values) if values.dtype.kind == 'f' else None
+    if missing is None or not missing.any():
+        return values.tolist()
+    column = np.array(values.tolist(), dtype=object)
+    column[missing] = None
+    return column.tolist()
+
+def load_analysis(path):
+    """Đọc file phân tích (.json hoặc .npz) do save_analysis ghi, trả về (analysis_data, metadata)"""
+    if path.lower().endswith('.npz'):
+        with np.load(path) as archive:
+            arrays = {key: archive[key] for key in ANALYSIS_COLUMNS if key in archive}
+            metadata = json.loads(str(archive['metadata'])) if 'metadata' in archive else {}
+        return AnalysisStore.from_arrays(ANALYSIS_COLUMNS, arrays), metadata
+    with open(path, encoding='utf-8') as f:
+        payload = json.load(f)
+    # null -> NaN cho các cột số thực
+    arrays = {key: np.array(values, dtype=ANALYSIS_COLUMNS[key])
+              if key in ANALYSIS_COLUMNS and np.dtype(ANALYSIS_COLUMNS[key]).kind == 'f' else values
+              for key, values in payload['analysis'].items()}
+    analysis_data = AnalysisStore.from_arrays(ANALYSIS_COLUMNS, arrays)
+    return analysis_data, payload.get('metadata', {})
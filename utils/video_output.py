@@ -0,0 +1,210 @@
+import os
+import shutil
+import tempfile
+import time
+import cv2
+from collections import deque
+
+OUTPUT_MODES = ['full', 'clips', 'signals']
+
+def draw_overlay(frame, label_text, box_color, avg_motion, current_time, width):
+    """Vẽ thông tin lên frame"""
+    cv2.rectangle(frame, (0, 0), (width, 60), (0, 0, 0), -1)
+    cv2.putText(frame, label_text, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, box_color, 2)
+    
+    # Motion Bar
+    bar_len = int(min(avg_motion, 10.0) * 30)
+    cv2.rectangle(frame, (20, 70), (20 + bar_len, 80), (255, 255, 255), -1)
+    cv2.putText(frame, f"Motion: {avg_motion:.1f}", (20, 100), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    
+    # Time stamp
+    cv2.putText(frame, f"Time: {current_time:.1f}s", (width - 150, 30), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+def annotate_frame(frame, detection_status, label_text, box_color, avg_motion, current_time):
+    """Vẽ khung cảnh báo (khi VIOLENCE) và thông tin lên frame"""
+    height, width = frame.shape[:2]
+    if detection_status == "VIOLENCE":
+        cv2.rectangle(frame, (0, 0), (width, height), box_color, 10)
+    draw_overlay(frame, label_text, box_color, avg_motion, current_time, width)
+
+
+class FullVideoWriter:
+    """
+    Ghi toàn bộ video đã chú thích ra output_path (ghi file tạm cùng thư mục rồi đổi tên khi đóng,
+    nên người đang xem / tải file cũ không thấy file ghi dở). Khi lỗi / hủy, gọi abort() thay
+    cho close() để bỏ file tạm và giữ nguyên output_path của lần chạy trước.
+    """
+    def __init__(self, output_path, fps, frame_size):
+        self.output_path = output_path
+        output_dir = os.path.dirname(output_path) or "."
+        os.makedirs(output_dir, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(suffix=os.path.splitext(output_path)[1], prefix=".tmp_", dir=output_dir)
+        os.close(fd)
+        self.out = cv2.VideoWriter(self.temp_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+
+    def write(self, frame, annotation):
+        """Vẽ và ghi một frame, trả về (thời gian vẽ, thời gian mã hóa) tính bằng giây"""
+        stage_start = time.perf_counter()
+        annotate_frame(frame, *annotation)
+        encode_start = time.perf_counter()
+        self.out.write(frame)
+        return encode_start - stage_start, time.perf_counter() - encode_start
+
+    def gap(self):
+        """Frame tiếp theo không liền sau frame trước (chỉ phân tích một số đoạn): ghi nối tiếp"""
+        pass
+
+    def close(self):
+        self.out.release()
+        os.replace(self.temp_path, self.output_path)
+
+    def abort(self):
+        self.out.release()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def result(self):
+        return {'output_path': self.output_path}
+
+
+class EventClipWriter:
+    """
+    Chỉ ghi các đoạn có trạng thái VIOLENCE thành các clip ngắn trong clip_dir.
+    Giữ pre_roll giây frame gần nhất (chưa vẽ) trong bộ đệm có giới hạn để clip bắt đầu
+    trước sự kiện; clip kết thúc sau post_roll giây không còn VIOLENCE (các sự kiện
+    cách nhau ít hơn post_roll được gộp vào cùng một clip). Frame chỉ được vẽ khi ghi.
+    Clip được ghi vào thư mục tạm bên cạnh clip_dir, đổi tên thành clip_dir khi đóng (thay
+    thư mục của lần chạy trước), nên không xóa clip mà phiên khác có thể đang xem;
+    abort() bỏ thư mục tạm và giữ nguyên clip_dir.
+    """
+    def __init__(self, clip_dir, fps, frame_size, pre_roll=2.0, post_roll=2.0):
+        parent = os.path.dirname(os.path.abspath(clip_dir))
+        os.makedirs(parent, exist_ok=True)
+        self.clip_dir = clip_dir
+        self.temp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=parent)
+        self.fps = fps if fps > 0 else 30
+        self.frame_size = frame_size
+        self.post_roll_frames = max(0, int(round(post_roll * self.fps)))
+        # +1: frame hiện tại cũng đi qua bộ đệm trước khi được ghi
+        self.pre_roll = deque(maxlen=max(0, int(round(pre_roll * self.fps))) + 1)
+        self.clips = []
+        self.out = None
+        self.post_remaining = 0
+
+    def write(self, frame, annotation):
+        detection_status, current_time = annotation[0], annotation[4]
+        overlay_time = encode_time = 0.0
+        if detection_status == "VIOLENCE":
+            if self.out is None:
+                self._open_clip()
+            self.post_remaining = self.post_roll_frames
+        elif self.out is not None:
+            if self.post_remaining == 0:
+                self._close_clip()
+            else:
+                self.post_remaining -= 1
+
+        if self.out is None:
+            self.pre_roll.append((frame, annotation))
+            return overlay_time, encode_time
+
+        # Ghi các frame đệm trước sự kiện rồi tới frame hiện tại
+        self.pre_roll.append((frame, annotation))
+        while self.pre_roll:
+            buffered_frame, buffered_annotation = self.pre_roll.popleft()
+            stage_start = time.perf_counter()
+            annotate_frame(buffered_frame, *buffered_annotation)
+            encode_start = time.perf_counter()
+            self.out.write(buffered_frame)
+            overlay_time += encode_start - stage_start
+            encode_time += time.perf_counter() - encode_start
+            clip = self.clips[-1]
+            clip['start'] = buffered_annotation[4] if clip['start'] is None else clip['start']
+            clip['end'] = buffered_annotation[4]
+            clip['frames'] += 1
+        return overlay_time, encode_time
+
+    def gap(self):
+        """Frame tiếp theo không liền sau frame trước: kết thúc clip đang ghi và bỏ bộ đệm"""
+        if self.out is not None:
+            self._close_clip()
+        self.pre_roll.clear()
+        self.post_remaining = 0
+
+    def _open_clip(self):
+        name = f"event_{len(self.clips) + 1:03d}.mp4"
+        self.out = cv2.VideoWriter(os.path.join(self.temp_dir, name), cv2.VideoWriter_fourcc(*'mp4v'),
+                                   self.fps, self.frame_size)
+        self.clips.append({'path': os.path.join(self.clip_dir, name), 'start': None, 'end': None, 'frames': 0})
+
+    def _close_clip(self):
+        self.out.release()
+        self.out = None
+
+    def close(self):
+        if self.out is not None:
+            self._close_clip()
+        self.pre_roll.clear()
+        if self.temp_dir is None:
+            return
+        # Thư mục cũ được đổi tên trước khi xóa để clip_dir luôn là một lần chạy hoàn chỉnh
+        previous_dir = None
+        if os.path.exists(self.clip_dir):
+            previous_dir = tempfile.mkdtemp(prefix=".old_", dir=os.path.dirname(self.temp_dir))
+            os.replace(self.clip_dir, os.path.join(previous_dir, "clips"))
+        os.replace(self.temp_dir, self.clip_dir)
+        self.temp_dir = None
+        if previous_dir is not None:
+            shutil.rmtree(previous_dir, ignore_errors=True)
+
+    def abort(self):
+        if self.out is not None:
+            self._close_clip()
+        self.pre_roll.clear()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+
+    def result(self):
+        return {'clips': list(self.clips)}
+
+
+class SignalsOnlyWriter:
+    """Không ghi video, chỉ giữ dữ liệu phân tích"""
+    def write(self, frame, annotation):
+        return 0.0, 0.0
+
+    def gap(self):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def result(self):
+        return {}
+
+
+def clip_dir_for(output_path):
+    """Thư mục chứa các clip sự kiện tương ứng với đường dẫn video kết quả"""
+    return f"{os.path.splitext(output_path)[0]}_clips"
+
+
+def create_output_writer(output_mode, output_path, fps, frame_size, pre_roll=2.0, post_roll=2.0):
+    """
+    Tạo bộ ghi đầu ra theo chế độ:
+    - 'full': toàn bộ video đã chú thích (mặc định)
+    - 'clips': chỉ các đoạn sự kiện, lưu trong thư mục clip_dir_for(output_path)
+    - 'signals': không ghi video
+    """
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Chế độ đầu ra không hợp lệ: {output_mode}")
+    if output_mode == 'clips':
+        return EventClipWriter(clip_dir_for(output_path), fps, frame_size, pre_roll, post_roll)
+    if output_mode == 'signals':
+        return SignalsOnlyWriter()
+    return FullVideoWriter(output_path, fps, frame_size)